@@ -30,6 +30,7 @@ from dashboard_app.models import (
     Attachment,
     Bundle,
     BundleDeserializationError,
+    BundleDeserializationTask,
     BundleStream,
     HardwareDevice,
     Image,
@@ -95,6 +96,12 @@ class BundleDeserializationErrorAdmin(admin.ModelAdmin):
     search_fields = ('bundle__content_sha1',)
 
 
+class BundleDeserializationTaskAdmin(admin.ModelAdmin):
+    list_display = ('bundle', 'status', 'queued_on', 'started_on', 'worker')
+    list_filter = ('status',)
+    search_fields = ('bundle__content_sha1',)
+
+
 class BundleStreamAdminForm(forms.ModelForm):
     class Meta:
         model = BundleStream
@@ -272,6 +279,7 @@ class TestDefinitionAdmin(admin.ModelAdmin):
 admin.site.register(Attachment, AttachmentAdmin)
 admin.site.register(Bundle, BundleAdmin)
 admin.site.register(BundleDeserializationError, BundleDeserializationErrorAdmin)
+admin.site.register(BundleDeserializationTask, BundleDeserializationTaskAdmin)
 admin.site.register(BundleStream, BundleStreamAdmin)
 admin.site.register(HardwareDevice, HardwareDeviceAdmin)
 admin.site.register(Image, ImageAdmin)
@@ -449,13 +449,15 @@ def get_named_attributes(filter, content_type):
 
 
 def get_filter_testruns(user, filter, prefetch_related=[], limit=100,
-                        descending=True, image_chart_filter=None):
+                        descending=True, image_chart_filter=None, bundle=None):
     # Return the list of test runs which meet the conditions specified in the
-    # filter.
+    # filter, only from the bundle if specified.
 
     testruns = TestRun.objects.filter(
         bundle__bundle_stream__testrunfilter=filter
     )
+    if bundle is not None:
+        testruns = testruns.filter(bundle=bundle)
 
     test_run_attributes_ids = get_named_attributes(
         filter, ContentType.objects.get_for_model(TestRun))
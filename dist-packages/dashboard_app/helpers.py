@@ -4,17 +4,19 @@ Module with non-database helper classes
 
 from uuid import UUID
 import base64
+import datetime
 import logging
 import time
 import ldap
 
-from django.core.files.base import ContentFile
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile, File
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import connection, transaction, IntegrityError
 from lava_server.settings.getsettings import Settings
 from linaro_dashboard_bundle.errors import DocumentFormatError
 from linaro_dashboard_bundle.evolution import DocumentEvolution
-from linaro_dashboard_bundle.io import DocumentIO
+from linaro_dashboard_bundle.io import Base64Spool, DocumentIO, DocumentStream
 from json_schema_validator.extensions import datetime_extension, timedelta_extension
 
 
@@ -26,6 +28,104 @@ def is_postgres():
             == 'django.db.backends.postgresql_psycopg2')
 
 
+def copy_value(value):
+    """
+    Format a value as a field of the text format of the PostgreSQL COPY
+    command.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    elif not isinstance(value, basestring):
+        value = unicode(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class CopyStream(object):
+    """
+    File-like object handed to cursor.copy_expert(). The rows are
+    formatted as they are read, so the rows of a large bundle are never
+    all held in memory at once.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                break
+            self._buffer += '\t'.join([copy_value(value) for value in row]) + '\n'
+            self.count += 1
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Load the rows into the table with COPY.
+
+    :return: the number of rows loaded
+    """
+    stream = CopyStream(rows)
+    cursor.copy_expert(
+        "COPY %s (%s) FROM STDIN" % (table, ', '.join(columns)), stream)
+    return stream.count
+
+
+class ImportCache(object):
+    """
+    Ids of the rows shared by all the bundles (test cases and software
+    packages), so that the importer only looks up the rows it has not
+    seen yet.
+
+    The rows are never updated, but they may be deleted by an admin: the
+    cache is cleared when an import fails on an IntegrityError.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.test_cases = {}
+        self.packages = {}
+
+    def get(self, name, key):
+        return getattr(self, name).get(key)
+
+    def update(self, other):
+        for name in ('test_cases', 'packages'):
+            table = getattr(self, name)
+            new = getattr(other, name)
+            if len(table) + len(new) > self.max_size:
+                table.clear()
+            table.update(new)
+
+    def clear(self):
+        self.test_cases.clear()
+        self.packages.clear()
+
+
+# Shared by the imports of the process. Ids seen by an import are only
+# added once its transaction is committed.
+IMPORT_CACHE = ImportCache()
+
+
 class IBundleFormatImporter(object):
     """
     Interface for bundle format importers.
@@ -57,6 +157,10 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
     IFormatImporter subclass capable of loading "Dashboard Bundle Format 1.0"
     """
 
+    # Load the test results, attributes, attachments and packages with
+    # COPY when the database is PostgreSQL.
+    use_copy = True
+
     def import_document(self, s_bundle, doc):
         """
         Import specified bundle document into the database.
@@ -66,8 +170,32 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         try:
             self._import_document_with_transaction(s_bundle, doc)
         except IntegrityError:
+            # a cached row may have been deleted
+            IMPORT_CACHE.clear()
+            self._remove_created_files()
+            raise
+        if not connection.in_atomic_block:
+            IMPORT_CACHE.update(self._cache)
+
+    def import_stream(self, s_bundle, stream):
+        """
+        Import a document read by a DocumentStream, one test run at a time.
+
+        The test runs are only read and checked during the import, so the
+        sanity check is done on each test run inside the transaction.
+        """
+        self._content_files = []
+        try:
+            self._import_stream_with_transaction(s_bundle, stream)
+        except IntegrityError:
+            IMPORT_CACHE.clear()
+            self._remove_created_files()
+            raise
+        except Exception:
             self._remove_created_files()
             raise
+        if not connection.in_atomic_block:
+            IMPORT_CACHE.update(self._cache)
 
     def _remove_created_files(self):
         """
@@ -77,6 +205,8 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         """
         for content_file in self._content_files:
             content_file.delete(save=False)
+        for name in self._content_names:
+            self._attachment_field().storage.delete(name)
 
     def _import_sanity_check(self, doc):
         """
@@ -112,9 +242,19 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         for c_test_run in doc.get("test_runs", []):
             self._import_test_run(c_test_run, s_bundle)
 
+    @transaction.atomic
+    def _import_stream_with_transaction(self, s_bundle, stream):
+        for c_test_run in stream.test_runs():
+            self._import_sanity_check({"test_runs": [c_test_run]})
+            self._import_test_run(c_test_run, s_bundle)
+
     def __init__(self):
         self._qc = 0
         self._time = time.time()
+        self._content_files = []
+        self._content_names = []
+        # ids seen by this import, not committed yet
+        self._cache = ImportCache()
 
     def _log(self, method_name):
         if PROFILE_LOGGING:
@@ -387,6 +527,13 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         if not c_test_results:
             return
 
+        if self._use_copy():
+            self._import_test_cases_copy(c_test_results, s_test_run.test)
+            self._import_test_results_copy(c_test_results, s_test_run)
+            self._import_test_result_attributes_copy(c_test_results, s_test_run)
+            self._log('test result attributes')
+            return
+
         if is_postgres():
             self._import_test_cases_pgsql(c_test_results, s_test_run.test)
         else:
@@ -478,6 +625,152 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
                 """)
         cursor.close()
 
+    def _use_copy(self):
+        return self.use_copy and is_postgres()
+
+    def _lookup(self, name, key):
+        """
+        Id of a test case or software package seen by this import or by
+        a previous one.
+        """
+        pk = self._cache.get(name, key)
+        if pk is None:
+            pk = IMPORT_CACHE.get(name, key)
+        return pk
+
+    def _import_test_cases_copy(self, c_test_results, s_test):
+        """
+        Import TestCase, looking up the ids of the test cases
+        """
+        id_units = {}
+        for c_test_result in c_test_results:
+            if "test_case_id" not in c_test_result:
+                continue
+            test_case_id = c_test_result["test_case_id"]
+            if self._lookup('test_cases', (s_test.id, test_case_id)) is None:
+                id_units.setdefault(test_case_id, c_test_result.get("units", ""))
+        if not id_units:
+            return
+
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE
+                newtestcases (test_case_id text, units text)
+            """)
+        copy_rows(cursor, 'newtestcases', ('test_case_id', 'units'),
+                  id_units.iteritems())
+        cursor.execute(
+            """
+            INSERT INTO
+                dashboard_app_testcase (test_id, units, name, test_case_id)
+            SELECT %s, units, E'', test_case_id FROM newtestcases
+            WHERE NOT EXISTS (SELECT 1 FROM dashboard_app_testcase
+                              WHERE test_id = %s
+                                AND newtestcases.test_case_id
+                                  = dashboard_app_testcase.test_case_id)
+            """ % (s_test.id, s_test.id))
+        cursor.execute(
+            """
+            SELECT dashboard_app_testcase.test_case_id, dashboard_app_testcase.id
+            FROM dashboard_app_testcase, newtestcases
+            WHERE dashboard_app_testcase.test_id = %s
+              AND dashboard_app_testcase.test_case_id = newtestcases.test_case_id
+            """ % s_test.id)
+        for test_case_id, pk in cursor.fetchall():
+            self._cache.test_cases[(s_test.id, test_case_id)] = pk
+        cursor.execute(
+            """
+            drop table newtestcases
+            """)
+        cursor.close()
+
+    def _import_test_results_copy(self, c_test_results, s_test_run):
+        """
+        Import TestRun.test_results with COPY. As with the other
+        implementations, results without a test case are not imported.
+        """
+        from dashboard_app.models import TestResult
+
+        test_id = s_test_run.test.id
+
+        def rows():
+            for index, c_test_result in enumerate(c_test_results, 1):
+                test_case = self._lookup(
+                    'test_cases', (test_id, c_test_result.get("test_case_id")))
+                if test_case is None:
+                    continue
+                timestamp = c_test_result.get("timestamp")
+                if timestamp:
+                    timestamp = datetime_extension.from_json(timestamp)
+                duration = c_test_result.get("duration", None)
+                if duration:
+                    duration = timedelta_extension.from_json(duration)
+                    duration = (duration.microseconds +
+                                (duration.seconds * 10 ** 6) +
+                                (duration.days * 24 * 60 * 60 * 10 ** 6))
+                yield (
+                    s_test_run.id,
+                    0,
+                    index,
+                    timestamp,
+                    duration,
+                    c_test_result.get("log_filename", None),
+                    self._translate_result_string(c_test_result["result"]),
+                    c_test_result.get("measurement", None),
+                    c_test_result.get("message", None),
+                    test_case,
+                    c_test_result.get("log_lineno", None),
+                )
+
+        cursor = connection.cursor()
+        copy_rows(
+            cursor, TestResult._meta.db_table,
+            ('test_run_id', '_order', 'relative_index', 'timestamp',
+             'microseconds', 'filename', 'result', 'measurement', 'message',
+             'test_case_id', 'lineno'),
+            rows())
+        cursor.close()
+
+    def _test_result_ids(self, s_test_run):
+        """
+        :return: dictionary of the ids of the test results of the test run,
+        keyed by relative index
+        """
+        from dashboard_app.models import TestResult
+
+        return dict(TestResult.objects.filter(test_run=s_test_run).values_list(
+            'relative_index', 'id'))
+
+    def _import_test_result_attributes_copy(self, c_test_results, s_test_run):
+        from dashboard_app.models import TestResult
+
+        if not any(c_test_result.get("attributes", {}) for c_test_result in c_test_results):
+            return
+        ids = self._test_result_ids(s_test_run)
+        self._copy_attributes(TestResult, (
+            (ids[index], name, value)
+            for index, c_test_result in enumerate(c_test_results, 1)
+            if index in ids
+            for name, value in c_test_result.get("attributes", {}).iteritems()))
+
+    def _copy_attributes(self, model, attributes):
+        """
+        Load NamedAttributes with COPY.
+
+        :param attributes: iterable of (object id, name, value)
+        """
+        from dashboard_app.models import NamedAttribute
+
+        content_type = ContentType.objects.get_for_model(model)
+        cursor = connection.cursor()
+        copy_rows(
+            cursor, NamedAttribute._meta.db_table,
+            ('content_type_id', 'object_id', 'name', 'value'),
+            ((content_type.id, object_id, str(name), str(value))
+             for object_id, name, value in attributes))
+        cursor.close()
+
     def _import_packages_scratch_sqlite(self, cursor, packages):
         data = []
         for c_package in packages:
@@ -505,6 +798,9 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         packages = self._get_sw_context(c_test_run).get("packages", [])
         if not packages:
             return
+        if self._use_copy():
+            self._import_packages_copy(packages, s_test_run)
+            return
         cursor = connection.cursor()
 
         if is_postgres():
@@ -536,6 +832,54 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
             """)
         cursor.close()
 
+    def _import_packages_copy(self, packages, s_test_run):
+        """
+        Import TestRun.packages, only looking up the packages which were
+        not seen yet.
+        """
+        ids = set()
+        missing = set()
+        for c_package in packages:
+            key = (c_package['name'], c_package['version'])
+            pk = self._lookup('packages', key)
+            if pk is None:
+                missing.add(key)
+            else:
+                ids.add(pk)
+
+        cursor = connection.cursor()
+        if missing:
+            copy_rows(cursor, 'dashboard_app_softwarepackagescratch',
+                      ('name', 'version'), missing)
+            cursor.execute(
+                """
+                INSERT INTO dashboard_app_softwarepackage (name, version)
+                SELECT name, version FROM dashboard_app_softwarepackagescratch
+                EXCEPT SELECT name, version FROM dashboard_app_softwarepackage
+                """)
+            cursor.execute(
+                """
+                SELECT dashboard_app_softwarepackage.name,
+                       dashboard_app_softwarepackage.version,
+                       dashboard_app_softwarepackage.id
+                FROM dashboard_app_softwarepackage, dashboard_app_softwarepackagescratch
+                WHERE dashboard_app_softwarepackage.name
+                        = dashboard_app_softwarepackagescratch.name
+                  AND dashboard_app_softwarepackage.version
+                        = dashboard_app_softwarepackagescratch.version
+                """)
+            for name, version, pk in cursor.fetchall():
+                self._cache.packages[(name, version)] = pk
+                ids.add(pk)
+            cursor.execute(
+                """
+                delete from dashboard_app_softwarepackagescratch
+                """)
+        copy_rows(cursor, 'dashboard_app_testrun_packages',
+                  ('testrun_id', 'softwarepackage_id'),
+                  ((s_test_run.id, pk) for pk in ids))
+        cursor.close()
+
     def _import_devices(self, c_test_run, s_test_run):
         """
         Import TestRun.devices
@@ -556,25 +900,113 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         Import attributes from any client-side object into any
         server-side object
         """
-        for name, value in c_object.get("attributes", {}).iteritems():
+        attributes = c_object.get("attributes", {})
+        if attributes and self._use_copy():
+            self._copy_attributes(type(s_object), (
+                (s_object.pk, name, value)
+                for name, value in attributes.iteritems()))
+            return
+        for name, value in attributes.iteritems():
             s_object.attributes.create(
                 name=str(name), value=str(value))
 
+    def _get_attachments(self, c_object):
+        """
+        :return: list of (content_filename, mime_type, public_url, content)
+        of the attachments of a client-side object, content is None when
+        the attachment only has a public url.
+        """
+        return [(filename, "text/plain", "", "".join(lines).encode("UTF-8"))
+                for filename, lines in c_object.get("attachments", {}).iteritems()]
+
     def _import_attachments(self, c_test_run, s_test_run):
         """
         Import TestRun.attachments
         """
-        for filename, lines in c_test_run.get("attachments", {}).iteritems():
-            s_attachment = s_test_run.attachments.create(
-                mime_type="text/plain",
-                content_filename=filename)
+        self._create_attachments(s_test_run, self._get_attachments(c_test_run))
+
+    def _create_attachments(self, s_object, attachments):
+        """
+        Create the attachments of any server-side object
+
+        :param attachments: list returned by _get_attachments(), the content
+        being a string or a File
+        """
+        if attachments and self._use_copy():
+            self._copy_attachments(type(s_object), [
+                (s_object.pk,) + attachment for attachment in attachments])
+            return
+        for filename, mime_type, public_url, content in attachments:
+            s_attachment = s_object.attachments.create(
+                content_filename=filename,
+                public_url=public_url,
+                mime_type=mime_type)
+            # Save to get pk
             s_attachment.save()
-            s_attachment.content.save(
-                "attachment-{0}.txt".format(s_attachment.pk),
-                ContentFile("".join(lines).encode("UTF-8")))
-            # Collect this attachment for cleanup in case something goes wrong
-            # and we need to rollback the transaction
-            self._content_files.append(s_attachment)
+            if content is not None:
+                s_attachment.content.save(
+                    "attachment-{0}.txt".format(s_attachment.pk),
+                    self._content_file(content))
+                # Collect this attachment for cleanup in case something goes
+                # wrong and we need to rollback the transaction
+                self._content_files.append(s_attachment.content)
+
+    def _decode_content(self, content):
+        """
+        :return: the content of an attachment, from its base64 string or
+        from the file it was spooled to by DocumentStream
+        """
+        if isinstance(content, Base64Spool):
+            return File(content.file)
+        return base64.standard_b64decode(content)
+
+    def _content_file(self, content):
+        if isinstance(content, File):
+            return content
+        return ContentFile(content)
+
+    def _attachment_field(self):
+        from dashboard_app.models import Attachment
+
+        return Attachment._meta.get_field('content')
+
+    def _copy_attachments(self, model, attachments):
+        """
+        Load Attachments with COPY. The ids are reserved first, as the name
+        of the content file holds the id of the attachment.
+
+        :param attachments: list of (object id, content_filename, mime_type,
+        public_url, content)
+        """
+        from dashboard_app.models import Attachment
+
+        table = Attachment._meta.db_table
+        field = self._attachment_field()
+        content_type = ContentType.objects.get_for_model(model)
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [table, len(attachments)])
+        ids = [row[0] for row in cursor.fetchall()]
+
+        def rows():
+            for pk, attachment in zip(ids, attachments):
+                object_id, filename, mime_type, public_url, content = attachment
+                name = None
+                if content is not None:
+                    name = field.storage.save(
+                        field.generate_filename(None, "attachment-{0}.txt".format(pk)),
+                        self._content_file(content))
+                    self._content_names.append(name)
+                yield (pk, content_type.id, object_id, filename, mime_type,
+                       public_url, name)
+
+        copy_rows(
+            cursor, table,
+            ('id', 'content_type_id', 'object_id', 'content_filename',
+             'mime_type', 'public_url', 'content'),
+            rows())
+        cursor.close()
 
     def _translate_result_string(self, result):
         """
@@ -627,20 +1059,12 @@ class BundleFormatImporter_1_1(BundleFormatImporter_1_0_1):
             "image", {}).get("name", "")
         self._import_sources(c_test_run, s_test_run)
 
-    def _import_attachments(self, c_test_run, s_test_run):
-        """
-        Import TestRun.attachments
-        """
-        for c_attachment in c_test_run.get("attachments", []):
-            s_attachment = s_test_run.attachments.create(
-                content_filename=c_attachment["pathname"],
-                mime_type=c_attachment["mime_type"])
-            # Save to get pk
-            s_attachment.save()
-            content = base64.standard_b64decode(c_attachment["content"])
-            s_attachment.content.save(
-                "attachment-{0}.txt".format(s_attachment.pk),
-                ContentFile(content))
+    def _get_attachments(self, c_object):
+        return [(c_attachment["pathname"],
+                 c_attachment["mime_type"],
+                 "",
+                 self._decode_content(c_attachment["content"]))
+                for c_attachment in c_object.get("attachments", [])]
 
     def _import_sources(self, c_test_run, s_test_run):
         """
@@ -672,22 +1096,14 @@ class BundleFormatImporter_1_2(BundleFormatImporter_1_1):
     IFormatImporter subclass capable of loading "Dashboard Bundle Format 1.2"
     """
 
-    def _import_attachments(self, c_test_run, s_test_run):
-        """
-        Import TestRun.attachments
-        """
-        for c_attachment in c_test_run.get("attachments", []):
-            s_attachment = s_test_run.attachments.create(
-                content_filename=c_attachment["pathname"],
-                public_url=c_attachment.get("public_url", ""),
-                mime_type=c_attachment["mime_type"])
-            s_attachment.save()
-            if "content" in c_attachment:
-                # Content is optional now
-                content = base64.standard_b64decode(c_attachment["content"])
-                s_attachment.content.save(
-                    "attachment-{0}.txt".format(s_attachment.pk),
-                    ContentFile(content))
+    def _get_attachments(self, c_object):
+        return [(c_attachment["pathname"],
+                 c_attachment["mime_type"],
+                 c_attachment.get("public_url", ""),
+                 # Content is optional now
+                 self._decode_content(c_attachment["content"])
+                 if "content" in c_attachment else None)
+                for c_attachment in c_object.get("attachments", [])]
 
 
 class BundleFormatImporter_1_3(BundleFormatImporter_1_2):
@@ -729,21 +1145,23 @@ class BundleFormatImporter_1_5(BundleFormatImporter_1_4):
     """
 
     def _import_test_result_attachments(self, c_test_result, s_test_result):
-        for c_attachment in c_test_result.get("attachments", []):
-            s_attachment = s_test_result.attachments.create(
-                content_filename=c_attachment["pathname"],
-                mime_type=c_attachment["mime_type"])
-            # Save to get pk
-            s_attachment.save()
-            content = base64.standard_b64decode(c_attachment["content"])
-            s_attachment.content.save(
-                "attachment-{0}.txt".format(s_attachment.pk),
-                ContentFile(content))
+        self._create_attachments(s_test_result, self._get_attachments(c_test_result))
 
     def _import_test_results(self, c_test_run, s_test_run):
         from dashboard_app.models import TestResult
         super(BundleFormatImporter_1_5, self)._import_test_results(c_test_run, s_test_run)
-        for index, c_test_result in enumerate(c_test_run.get("test_results", []), 1):
+        c_test_results = c_test_run.get("test_results", [])
+        if self._use_copy():
+            if not any(c_test_result.get("attachments", {}) for c_test_result in c_test_results):
+                return
+            ids = self._test_result_ids(s_test_run)
+            self._copy_attachments(TestResult, [
+                (ids[index],) + attachment
+                for index, c_test_result in enumerate(c_test_results, 1)
+                if index in ids
+                for attachment in self._get_attachments(c_test_result)])
+            return
+        for index, c_test_result in enumerate(c_test_results, 1):
             if c_test_result.get("attachments", {}):
                 try:
                     s_test_result = TestResult.objects.get(
@@ -894,6 +1312,10 @@ class BundleDeserializer(object):
             old documents are imported exactly as before. Enabling it should
             be quite safe though as it passes all tests.
 
+            Otherwise the document is read with a DocumentStream and its
+            test runs are imported as they are read, so large bundles are
+            never loaded at once.
+
         :Exceptions raised:
             json_schema_validator.ValidationError
                 When the document does not match the appropriate schema.
@@ -903,17 +1325,19 @@ class BundleDeserializer(object):
                 When the text does not represent a correct JSON document.
         """
         assert s_bundle.is_deserialized is False
-        s_bundle.content.open('rb')
         logger = logging.getLogger(__name__)
+        if not prefer_evolution:
+            self._deserialize_stream(s_bundle)
+            return
+        s_bundle.content.open('rb')
         try:
             logger.debug("Loading document")
             fmt, doc = DocumentIO.load(s_bundle.content)
             logger.debug("Document loaded")
-            if prefer_evolution:
-                logger.debug("Evolving document")
-                DocumentEvolution.evolve_document(doc)
-                logger.debug("Document evolution complete")
-                fmt = doc["format"]
+            logger.debug("Evolving document")
+            DocumentEvolution.evolve_document(doc)
+            logger.debug("Document evolution complete")
+            fmt = doc["format"]
         finally:
             s_bundle.content.close()
         importer = self.IMPORTERS.get(fmt)
@@ -927,6 +1351,24 @@ class BundleDeserializer(object):
             logger.debug("Exception while importing document: %r", exc)
             raise
 
+    def _deserialize_stream(self, s_bundle):
+        logger = logging.getLogger(__name__)
+        s_bundle.content.open('rb')
+        try:
+            stream = DocumentStream(s_bundle.content)
+            fmt = stream.format()
+            importer = self.IMPORTERS.get(fmt)
+            if importer is None:
+                raise DocumentFormatError(fmt)
+            logger.debug("Importing document")
+            importer().import_stream(s_bundle, stream)
+            logger.debug("Document import complete")
+        except Exception as exc:
+            logger.debug("Exception while importing document: %r", exc)
+            raise
+        finally:
+            s_bundle.content.close()
+
 
 def get_ldap_user_properties(ldap_user):
     """Searches LDAP based on the parameters in settings.conf and returns LDAP
@@ -0,0 +1,116 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dashboard
+#
+# Lava Dashboard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# Lava Dashboard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Lava Dashboard. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import uuid
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from dashboard_app.helpers import BundleFormatImporter_1_7_1, is_postgres
+from dashboard_app.models import Bundle, BundleStream
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the time taken by the bundle importers on generated bundles'
+    option_list = BaseCommand.option_list + (
+        make_option('--results',
+                    type='int',
+                    default=50000,
+                    help='Number of test results in each bundle'),
+        make_option('--attributes',
+                    type='int',
+                    default=2,
+                    help='Number of attributes of each test result'),
+        make_option('--packages',
+                    type='int',
+                    default=500,
+                    help='Number of software packages in each bundle'),
+        make_option('--bundles',
+                    type='int',
+                    default=2,
+                    help='Number of bundles imported in a row, the first '
+                         'creates the test cases and packages'),
+    )
+
+    def handle(self, *args, **options):
+        if not is_postgres():
+            self.stderr.write("The COPY importer needs PostgreSQL")
+            return
+        for use_copy in [False, True]:
+            timings = self._run(use_copy, options)
+            self.stdout.write("%-6s %s" % (
+                "copy" if use_copy else "insert",
+                " ".join(["%.2fs" % timing for timing in timings])))
+
+    def _document(self, options):
+        return {
+            "format": "Dashboard Bundle Format 1.7.1",
+            "test_runs": [{
+                "test_id": "benchmark-bundle-import",
+                "analyzer_assigned_uuid": str(uuid.uuid4()),
+                "analyzer_assigned_date": "2016-01-01T00:00:00Z",
+                "time_check_performed": False,
+                "attributes": {"target": "benchmark"},
+                "software_context": {
+                    "packages": [
+                        {"name": "package-%d" % index, "version": "1.0"}
+                        for index in range(options['packages'])]
+                },
+                "test_results": [
+                    {
+                        "test_case_id": "case-%d" % index,
+                        "result": "pass" if index % 10 else "fail",
+                        "measurement": index * 0.5,
+                        "units": "ms",
+                        "message": "line one\nline\ttwo",
+                        "attributes": dict(
+                            ("attribute-%d" % attribute, str(index))
+                            for attribute in range(options['attributes'])),
+                    } for index in range(options['results'])]
+            }]
+        }
+
+    def _run(self, use_copy, options):
+        """
+        Import the bundles in a transaction which is rolled back, so each
+        importer starts from the same database.
+        """
+        timings = []
+        # the same importer keeps the ids it looked up between bundles
+        importer = BundleFormatImporter_1_7_1()
+        importer.use_copy = use_copy
+        try:
+            with transaction.atomic():
+                bundle_stream = BundleStream.objects.create(
+                    pathname="/anonymous/benchmark-%s/" % uuid.uuid4(),
+                    is_anonymous=True, is_public=True)
+                for _ in range(options['bundles']):
+                    doc = self._document(options)
+                    s_bundle = Bundle.objects.create(
+                        bundle_stream=bundle_stream,
+                        content_filename="benchmark.json")
+                    start = time.time()
+                    importer._import_document(s_bundle, doc)
+                    timings.append(time.time() - start)
+                raise Rollback()
+        except Rollback:
+            pass
+        return timings
@@ -0,0 +1,102 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dashboard
+#
+# Lava Dashboard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# Lava Dashboard is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Lava Dashboard. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import connection, DatabaseError
+from dashboard_app.models import BundleDeserializationTask
+
+
+def work(poll_interval, stop):
+    """
+    Deserialize the queued bundles until the stop event is set. The task
+    being run is always completed.
+    """
+    # the parent process stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logger = logging.getLogger('dashboard_app')
+    worker = "%s:%d" % (socket.gethostname(), os.getpid())
+    while not stop.is_set():
+        try:
+            task = BundleDeserializationTask.claim(worker)
+            if task is None:
+                stop.wait(poll_interval)
+                continue
+            logger.info("[%s] Deserializing bundle %s", worker, task.bundle.content_sha1)
+            task.run()
+        except DatabaseError:
+            logger.exception("[%s] Database error, reconnecting", worker)
+            connection.close()
+            stop.wait(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Deserialize the bundles queued by BUNDLE_DESERIALIZATION_ASYNC'
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+                    type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='Number of worker processes'),
+        make_option('--poll-interval',
+                    type='float',
+                    default=1.0,
+                    help='Seconds between two polls of an idle worker'),
+        make_option('--stale-timeout',
+                    type='int',
+                    default=3600,
+                    help='Seconds after which a running task is queued '
+                         'again, as its worker is gone'),
+    )
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('dashboard_app')
+        stop = multiprocessing.Event()
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        workers = []
+        last_requeue = 0
+        while not stop.is_set():
+            if time.time() - last_requeue > options['stale_timeout'] / 10:
+                requeued = BundleDeserializationTask.requeue_stale(options['stale_timeout'])
+                if requeued:
+                    logger.warning("Queued %d stale deserialization tasks again", requeued)
+                last_requeue = time.time()
+            alive = [process for process in workers if process.is_alive()]
+            if len(alive) < len(workers):
+                logger.warning("Restarting %d deserializer workers", len(workers) - len(alive))
+            workers = alive
+            if len(workers) < options['workers']:
+                # the workers must not share the database connection
+                connection.close()
+                while len(workers) < options['workers']:
+                    process = multiprocessing.Process(
+                        target=work, args=(options['poll_interval'], stop))
+                    process.start()
+                    workers.append(process)
+            stop.wait(options['poll_interval'])
+
+        logger.info("Waiting for the deserializer workers")
+        for process in workers:
+            process.join()
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0020_auto_20160222_1743'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BundleDeserializationTask',
+            fields=[
+                ('bundle', models.OneToOneField(related_name=b'deserialization_task', primary_key=True, serialize=False, to='dashboard_app.Bundle')),
+                ('status', models.PositiveSmallIntegerField(default=0, db_index=True, choices=[(0, 'Queued'), (1, 'Running')])),
+                ('queued_on', models.DateTimeField(auto_now_add=True)),
+                ('started_on', models.DateTimeField(null=True, blank=True)),
+                ('worker', models.CharField(max_length=256, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
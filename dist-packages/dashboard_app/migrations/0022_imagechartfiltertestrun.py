@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0021_bundledeserializationtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagechartfilter',
+            name='chart_data_key',
+            field=models.CharField(default='', max_length=40, blank=True),
+            preserve_default=True,
+        ),
+        migrations.CreateModel(
+            name='ImageChartFilterTestRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('build_number', models.CharField(max_length=1024)),
+                ('build_number_value', models.IntegerField(null=True)),
+                ('uploaded_on', models.DateTimeField()),
+                ('link', models.CharField(max_length=1024)),
+                ('bundle_link', models.CharField(max_length=1024)),
+                ('test_run_uuid', models.CharField(max_length=36)),
+                ('count_pass', models.PositiveIntegerField()),
+                ('count_fail', models.PositiveIntegerField()),
+                ('count_skip', models.PositiveIntegerField()),
+                ('count_all', models.PositiveIntegerField()),
+                ('bug_links', models.TextField(default='[]')),
+                ('has_comments', models.BooleanField(default=False)),
+                ('attributes', models.TextField(default='{}')),
+                ('image_chart_filter', models.ForeignKey(to='dashboard_app.ImageChartFilter')),
+                ('test', models.ForeignKey(related_name='+', to='dashboard_app.Test')),
+                ('test_run', models.ForeignKey(related_name='+', to='dashboard_app.TestRun')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagechartfiltertestrun',
+            unique_together=set([('image_chart_filter', 'test_run')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='imagechartfiltertestrun',
+            index_together=set([('image_chart_filter', 'build_number_value'), ('image_chart_filter', 'uploaded_on')]),
+        ),
+    ]
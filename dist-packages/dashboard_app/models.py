@@ -28,6 +28,7 @@ import hashlib
 import logging
 import os
 import simplejson
+import time
 import traceback
 import contextlib
 
@@ -49,15 +50,16 @@ from django.core.validators import (
     MaxValueValidator,
     MinValueValidator
 )
-from django.db import models, connection, IntegrityError
+from django.db import models, connection, transaction, IntegrityError
 from django.db.models.fields import FieldDoesNotExist
-from django.db.models.signals import post_delete
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.template import Template, Context
 from django.template.defaultfilters import filesizeformat, slugify
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ungettext_lazy
+from django.utils import timezone
 from django.db.utils import DatabaseError
 from django_restricted_resource.models import RestrictedResource
 from linaro_dashboard_bundle.io import DocumentIO
@@ -591,6 +593,26 @@ class Bundle(models.Model):
             self.save()
             bundle_was_deserialized.send_robust(sender=self, bundle=self)
 
+    @property
+    def deserialization_status(self):
+        """
+        'deserialized', 'failed', 'queued', 'running' when the bundle is
+        deserialized in the background, or 'pending'.
+        """
+        if self.is_deserialized:
+            return 'deserialized'
+        try:
+            task = self.deserialization_task
+        except BundleDeserializationTask.DoesNotExist:
+            pass
+        else:
+            return BundleDeserializationTask.STATUS_MAP[task.status]
+        try:
+            self.deserialization_error
+        except BundleDeserializationError.DoesNotExist:
+            return 'pending'
+        return 'failed'
+
     def _do_deserialize(self, prefer_evolution):
         """
         Deserialize this bundle or raise an exception
@@ -707,6 +729,97 @@ class BundleDeserializationError(models.Model):
         return self.error_message
 
 
+class BundleDeserializationTask(models.Model):
+    """
+    Model for the bundles waiting to be deserialized by the deserializer
+    workers, when the bundles are deserialized in the background
+    (BUNDLE_DESERIALIZATION_ASYNC).
+
+    The task is removed once the bundle is deserialized, successfully or
+    not.
+    """
+
+    STATUS_QUEUED = 0
+    STATUS_RUNNING = 1
+
+    STATUS_MAP = {
+        STATUS_QUEUED: 'queued',
+        STATUS_RUNNING: 'running',
+    }
+
+    bundle = models.OneToOneField(
+        Bundle,
+        primary_key=True,
+        related_name='deserialization_task'
+    )
+
+    status = models.PositiveSmallIntegerField(
+        choices=(
+            (STATUS_QUEUED, _(u"Queued")),
+            (STATUS_RUNNING, _(u"Running")),
+        ),
+        default=STATUS_QUEUED,
+        db_index=True
+    )
+
+    queued_on = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    started_on = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    worker = models.CharField(
+        max_length=256,
+        blank=True
+    )
+
+    def __unicode__(self):
+        return _(u"Deserialization of {0} ({1})").format(
+            self.bundle, self.STATUS_MAP[self.status])
+
+    @classmethod
+    def claim(cls, worker, bundle=None):
+        """
+        Take the oldest queued task, or the task of the given bundle.
+        Concurrent workers never take the same task, as the task is only
+        claimed if it is still queued when updated.
+
+        :return: the task, or None if there is no queued task
+        """
+        tasks = cls.objects.filter(status=cls.STATUS_QUEUED)
+        if bundle is not None:
+            tasks = tasks.filter(bundle=bundle)
+        for pk in tasks.order_by('queued_on').values_list('pk', flat=True)[:10]:
+            claimed = cls.objects.filter(pk=pk, status=cls.STATUS_QUEUED).update(
+                status=cls.STATUS_RUNNING, started_on=timezone.now(), worker=worker)
+            if claimed:
+                return cls.objects.select_related('bundle').get(pk=pk)
+        return None
+
+    @classmethod
+    def requeue_stale(cls, timeout):
+        """
+        Queue again the tasks of the workers which did not complete them
+        in time, usually because the worker was killed.
+        """
+        limit = timezone.now() - datetime.timedelta(seconds=timeout)
+        return cls.objects.filter(
+            status=cls.STATUS_RUNNING, started_on__lt=limit).update(
+                status=cls.STATUS_QUEUED, started_on=None, worker='')
+
+    def run(self):
+        """
+        Deserialize the bundle and remove the task.
+        """
+        try:
+            self.bundle.deserialize()
+        finally:
+            self.delete()
+
+
 class Test(models.Model):
     """
     Model for representing tests.
@@ -1641,41 +1754,43 @@ class TestRunFilter(models.Model):
     #       = the minimum over testrun (the number of attributes on the filter that are not on the testrun) is 0
     #    and (filter.test_case is null
     #         or filter.test_case in select test_case from bundle.test_runs.test_results.test_cases)
+    # The filters are looked up in TestRunFilterIndex rather than with
+    # this query.
 
     @classmethod
     def matches_against_bundle(cls, bundle):
         from dashboard_app.filters import FilterMatch
-        bundle_filters = bundle.bundle_stream.testrunfilter_set.all()
-        attribute_filters = bundle_filters.extra(
-            where=[
-                """(select min((select count(*)
-                              from dashboard_app_testrunfilterattribute
-                             where filter_id = dashboard_app_testrunfilter.id
-                               and (name, value) not in (select name, value
-                                                           from dashboard_app_namedattribute
-                                  where content_type_id = (
-                                          select django_content_type.id from django_content_type
-                                          where app_label = 'dashboard_app' and model='testrun')
-                                 and object_id = dashboard_app_testrun.id)))
-            from dashboard_app_testrun where dashboard_app_testrun.bundle_id = %s) = 0""" % bundle.id],
-        )
-        no_test_filters = list(attribute_filters.annotate(models.Count('tests')).filter(tests__count=0))
-        attribute_filters = list(attribute_filters)
-        no_test_case_filters = list(
-            TestRunFilter.objects.filter(
-                id__in=TestRunFilterTest.objects.filter(
-                    filter__in=attribute_filters, test__in=bundle.test_runs.all()
-                    .values('test_id')).annotate(models.Count('cases')).filter(cases__count=0).values('filter__id'),
-            ))
-        tcf = TestRunFilter.objects.filter(
-            id__in=TestRunFilterTest.objects.filter(
-                filter__in=attribute_filters,
-                cases__test_case__id__in=bundle.test_runs.all().values('test_results__test_case__id')
-            ).values('filter__id')
-        )
-        test_case_filters = list(tcf)
-
-        filters = set(test_case_filters + no_test_case_filters + no_test_filters)
+        test_runs = list(bundle.test_runs.all())
+        if not test_runs:
+            return []
+        run_attributes = dict((test_run.id, set()) for test_run in test_runs)
+        for object_id, name, value in NamedAttribute.objects.filter(
+                content_type=ContentType.objects.get_for_model(TestRun),
+                object_id__in=list(run_attributes)).values_list('object_id', 'name', 'value'):
+            run_attributes[object_id].add((name, value))
+        test_case_ids = set(
+            TestResult.objects.filter(test_run__bundle=bundle).exclude(
+                test_case=None).values_list('test_case', flat=True).order_by().distinct())
+
+        index = TestRunFilterIndex.current()
+        filter_ids = index.filter_ids(
+            bundle.bundle_stream_id,
+            set([test_run.test_id for test_run in test_runs]),
+            test_case_ids,
+            run_attributes.values())
+        if not filter_ids:
+            return []
+
+        # the results of the test cases of all the matching filters
+        filter_test_case_ids = set()
+        for filter_id in filter_ids:
+            filter_test_case_ids.update(index.test_case_ids(filter_id))
+        results = []
+        if filter_test_case_ids:
+            results = list(TestResult.objects.filter(
+                test_case__id__in=list(filter_test_case_ids),
+                test_run__bundle=bundle))
+
         matches = []
         bundle_with_counts = Bundle.objects.annotate(
             pass_count=models.Sum('test_runs__denormalization__count_pass'),
@@ -1683,15 +1798,14 @@ class TestRunFilter(models.Model):
             skip_count=models.Sum('test_runs__denormalization__count_skip'),
             fail_count=models.Sum('test_runs__denormalization__count_fail')
         ).get(id=bundle.id)
-        for filter in filters:
+        for filter in TestRunFilter.objects.filter(id__in=list(filter_ids)).select_related('owner'):
             match = FilterMatch()
             match.filter = filter
             match.filter_data = filter.as_data()
-            match.test_runs = list(bundle.test_runs.all())
-            match.specific_results = list(
-                TestResult.objects.filter(
-                    test_case__id__in=filter.tests.all().values('cases__test_case__id'),
-                    test_run__bundle=bundle))
+            match.test_runs = list(test_runs)
+            cases = index.test_case_ids(filter.id)
+            match.specific_results = [
+                result for result in results if result.test_case_id in cases]
             b = bundle_with_counts
             match.result_count = b.unknown_count + b.skip_count + b.pass_count + b.fail_count
             match.pass_count = bundle_with_counts.pass_count
@@ -1714,6 +1828,161 @@ class TestRunFilter(models.Model):
         return True
 
 
+class TestRunFilterIndex(object):
+    """
+    In memory index of the test run filters, to find the filters matching
+    a bundle without evaluating every filter in the database.
+
+    The index of the process is rebuilt when the filter tables change:
+    the filter forms replace the rows of a filter when it is saved, which
+    changes the number of rows or the largest id of the tables. The rows
+    edited in place (from the admin) are seen by the other processes once
+    the index is older than MAX_AGE.
+    """
+
+    MAX_AGE = 600
+
+    _current = None
+
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.built_on = time.time()
+        # bundle stream id -> filter ids
+        self.by_stream = {}
+        # filter id -> frozenset of (name, value)
+        self.attributes = {}
+        # test id -> ids of the filters with this test and no test cases
+        self.by_test = {}
+        # test case id -> filter ids
+        self.by_test_case = {}
+        # filter id -> test case ids
+        self.test_cases = {}
+        # ids of the filters with tests
+        self.with_tests = set()
+
+    @classmethod
+    def _tables(cls):
+        return [
+            TestRunFilter._meta.db_table,
+            TestRunFilter.bundle_streams.through._meta.db_table,
+            TestRunFilterAttribute._meta.db_table,
+            TestRunFilterTest._meta.db_table,
+            TestRunFilterTestCase._meta.db_table,
+        ]
+
+    @classmethod
+    def get_fingerprint(cls):
+        """
+        :return: the number of rows and the largest id of each filter table
+        """
+        columns = []
+        for table in cls._tables():
+            columns.append("(SELECT COUNT(*) FROM %s)" % table)
+            columns.append("(SELECT MAX(id) FROM %s)" % table)
+        cursor = connection.cursor()
+        cursor.execute("SELECT %s" % ", ".join(columns))
+        return tuple(cursor.fetchone())
+
+    @classmethod
+    def current(cls):
+        """
+        :return: the index of the process, rebuilt when the filters changed
+        """
+        fingerprint = cls.get_fingerprint()
+        index = cls._current
+        if index is None or index.fingerprint != fingerprint or \
+                time.time() - index.built_on > cls.MAX_AGE:
+            index = cls.build(fingerprint)
+            cls._current = index
+        return index
+
+    @classmethod
+    def invalidate(cls):
+        cls._current = None
+
+    @classmethod
+    def build(cls, fingerprint=None):
+        index = cls(fingerprint)
+        streams = {}
+        for filter_id, stream_id in TestRunFilter.bundle_streams.through.objects.values_list(
+                'testrunfilter', 'bundlestream'):
+            streams.setdefault(filter_id, set()).add(stream_id)
+        attributes = {}
+        for filter_id, name, value in TestRunFilterAttribute.objects.values_list(
+                'filter', 'name', 'value'):
+            attributes.setdefault(filter_id, set()).add((name, value))
+        cases = {}
+        for test_id, test_case_id in TestRunFilterTestCase.objects.values_list(
+                'test', 'test_case'):
+            cases.setdefault(test_id, set()).add(test_case_id)
+        tests = {}
+        for trf_test_id, filter_id, test_id in TestRunFilterTest.objects.values_list(
+                'id', 'filter', 'test'):
+            tests.setdefault(filter_id, []).append((test_id, cases.get(trf_test_id, ())))
+        for filter_id, stream_ids in streams.items():
+            index.add(filter_id, stream_ids, attributes.get(filter_id, ()),
+                      tests.get(filter_id, ()))
+        return index
+
+    def add(self, filter_id, stream_ids, attributes, tests):
+        """
+        :param attributes: (name, value) of the attributes of the filter
+        :param tests: (test id, test case ids) of the tests of the filter
+        """
+        for stream_id in stream_ids:
+            self.by_stream.setdefault(stream_id, set()).add(filter_id)
+        self.attributes[filter_id] = frozenset(attributes)
+        test_cases = set()
+        for test_id, test_case_ids in tests:
+            self.with_tests.add(filter_id)
+            if not test_case_ids:
+                self.by_test.setdefault(test_id, set()).add(filter_id)
+            for test_case_id in test_case_ids:
+                self.by_test_case.setdefault(test_case_id, set()).add(filter_id)
+            test_cases.update(test_case_ids)
+        self.test_cases[filter_id] = frozenset(test_cases)
+
+    def test_case_ids(self, filter_id):
+        return self.test_cases.get(filter_id, frozenset())
+
+    def filter_ids(self, bundle_stream_id, test_ids, test_case_ids, run_attributes):
+        """
+        :param test_ids: ids of the tests of the test runs of the bundle
+        :param test_case_ids: ids of the test cases of the test results
+        :param run_attributes: sets of (name, value) of each test run
+        :return: ids of the filters matching the bundle
+        """
+        candidates = self.by_stream.get(bundle_stream_id)
+        if not candidates or not run_attributes:
+            return set()
+        tested = set()
+        for test_id in test_ids:
+            tested.update(self.by_test.get(test_id, ()))
+        for test_case_id in test_case_ids:
+            tested.update(self.by_test_case.get(test_case_id, ()))
+        matches = set()
+        for filter_id in candidates:
+            if filter_id in self.with_tests and filter_id not in tested:
+                continue
+            attributes = self.attributes[filter_id]
+            # all the attributes of the filter are on one of the test runs
+            if attributes and not any([attributes <= run for run in run_attributes]):
+                continue
+            matches.add(filter_id)
+        return matches
+
+
+def _invalidate_filter_index(sender, **kwargs):
+    TestRunFilterIndex.invalidate()
+
+
+for _model in (TestRunFilter, TestRunFilterAttribute, TestRunFilterTest,
+               TestRunFilterTestCase):
+    post_save.connect(_invalidate_filter_index, sender=_model)
+    post_delete.connect(_invalidate_filter_index, sender=_model)
+m2m_changed.connect(_invalidate_filter_index, sender=TestRunFilter.bundle_streams.through)
+
+
 class TestRunFilterSubscription(models.Model):
 
     user = models.ForeignKey(User)
@@ -1760,7 +2029,7 @@ class TestRunFilterSubscription(models.Model):
                     for t in match.filter_data['tests']:
                         if not t['test_cases']:
                             for tr in match.test_runs:
-                                if tr.test == t.test:
+                                if tr.test == t['test']:
                                     if tr.denormalization.count_pass != tr.denormalization.count_all():
                                         failure_found = True
                                         break
@@ -1933,6 +2202,14 @@ def update_image_charts(bundle):
         for chart_filter in chart_filters:
             chart_filter.save()
 
+    # Materialize the test runs of the bundle shown in pass/fail charts.
+    chart_filters = ImageChartFilter.objects.filter(
+        image_chart__chart_type="pass/fail",
+        filter__bundle_streams=bundle.bundle_stream).exclude(
+            chart_data_key='').select_related('image_chart', 'filter')
+    for chart_filter in chart_filters:
+        ImageChartFilterTestRun.refresh(chart_filter, bundle)
+
 
 bundle_was_deserialized.connect(bundle_deserialization_callback)
 
@@ -2190,11 +2467,6 @@ class ImageReportChart(models.Model):
 
     def get_chart_test_data(self, user, image_chart_filter, filter_data,
                             chart_data):
-        from dashboard_app.filters import get_filter_testruns
-
-        # Prepare to filter the tests and test cases for the
-        # evaluate_filter call.
-        tests = []
 
         selected_chart_tests = image_chart_filter.imagecharttest_set.all().\
             prefetch_related('imagecharttestattribute_set')
@@ -2203,32 +2475,33 @@ class ImageReportChart(models.Model):
         if not selected_chart_tests:
             return
 
-        test_runs = get_filter_testruns(
-            user, image_chart_filter.filter, limit=200,
-            image_chart_filter=image_chart_filter)
+        key = image_chart_filter.get_chart_data_key(filter_data,
+                                                    selected_chart_tests)
+        if image_chart_filter.chart_data_key != key:
+            ImageChartFilterTestRun.rebuild(image_chart_filter, key)
 
-        # Store metadata changes.
-        metadata = {}
+        test_runs = ImageChartFilterTestRun.objects.filter(
+            image_chart_filter=image_chart_filter).select_related(
+                'test').order_by(ImageChartFilterTestRun.chart_order(
+                    image_chart_filter))[:ImageChartFilterTestRun.CHART_LIMIT]
 
-        for test_run in test_runs:
+        chart_tests = dict((chart_test.test_id, chart_test)
+                           for chart_test in selected_chart_tests)
 
-            denorm = test_run.denormalization
+        # Store metadata changes.
+        metadata = {}
+        # Chart items by test_filter_id and build number, to aggregate the
+        # parametrized tests.
+        chart_items = {}
 
-            bug_links = sorted(
-                [b.bug_link for b in test_run.bug_links.all()])
+        for test_run in reversed(test_runs):
 
             metadata_content = {}
             test_id = test_run.test.test_id
-
-            if not hasattr(test_run, 'build_number'):
-                test_run.build_number = str(test_run.bundle.uploaded_on)
+            attributes = test_run.attribute_values
 
             # Find corresponding chart_test object.
-            chart_test = None
-            for ch_test in selected_chart_tests:
-                if ch_test.test == test_run.test:
-                    chart_test = ch_test
-                    break
+            chart_test = chart_tests.get(test_run.test_id)
 
             if test_id not in metadata.keys():
                 metadata[test_id] = {}
@@ -2242,20 +2515,15 @@ class ImageReportChart(models.Model):
                 # If specific attribute's value didn't change since the
                 # last test run, do not include that attr.
                 for attr in chart_test.attributes:
-                    if attr not in metadata[test_id].keys():
-                        try:
-                            metadata[test_id][attr] = \
-                                test_run.attributes.get(name=attr).value
-                        except NamedAttribute.DoesNotExist:
-                            # Skip this attribute.
-                            pass
-                    else:
+                    if attr not in attributes:
+                        # Skip this attribute.
+                        continue
+                    new_value = attributes[attr]
+                    if attr in metadata[test_id].keys():
                         old_value = metadata[test_id][attr]
-                        new_value = test_run.attributes.get(
-                            name=attr).value
                         if old_value != new_value:
                             metadata_content[attr] = (old_value, new_value)
-                        metadata[test_id][attr] = new_value
+                    metadata[test_id][attr] = new_value
 
                 alias = chart_test.name
 
@@ -2263,70 +2531,59 @@ class ImageReportChart(models.Model):
                 alias = "%s: %s" % (image_chart_filter.filter.name,
                                     test_id)
 
-            # Add comments flag to indicate whether comments do exist in
-            # any of the test result in this test run.
-            has_comments = test_run.test_results.exclude(
-                comments__isnull=True).count() != 0
-
             test_filter_id = "%s-%s" % (test_id, image_chart_filter.id)
 
             # Calculate percentages.
             percentage = 0
             if self.is_percentage:
-                if denorm.count_all() != 0:
-                    percentage = round(100 * float(denorm.count_pass) /
-                                       denorm.count_all(), 2)
+                if test_run.count_all != 0:
+                    percentage = round(100 * float(test_run.count_pass) /
+                                       test_run.count_all, 2)
 
             # Find already existing chart item (this happens if we're
             # dealing with parametrized tests) and add the values instead
             # of creating new chart item.
-            found = False
-            if image_chart_filter.image_chart.is_aggregate_results:
-                for chart_item in chart_data["test_data"]:
-                    if chart_item["test_filter_id"] == test_filter_id and \
-                       chart_item["number"] == str(test_run.build_number):
-                        chart_item["passes"] += denorm.count_pass
-                        chart_item["skip"] += denorm.count_skip
-                        chart_item["total"] += denorm.count_all()
-                        chart_item["link"] = image_chart_filter.filter.\
-                            get_absolute_url()
-                        chart_item["pass"] &= denorm.count_fail == 0
-                        found = True
+            item_key = (test_filter_id, test_run.build_number)
+            if self.is_aggregate_results and item_key in chart_items:
+                chart_item = chart_items[item_key]
+                chart_item["passes"] += test_run.count_pass
+                chart_item["skip"] += test_run.count_skip
+                chart_item["total"] += test_run.count_all
+                chart_item["link"] = image_chart_filter.filter.\
+                    get_absolute_url()
+                chart_item["pass"] &= test_run.count_fail == 0
+                continue
 
             # Set attribute based on xaxis_attribute.
             attribute = None
             if self.xaxis_attribute:
-                try:
-                    attribute = test_run.attributes.get(
-                        name=self.xaxis_attribute).value
-                except:
-                    pass
-
-            # If no existing chart item was found, create a new one.
-            if not image_chart_filter.image_chart.is_aggregate_results or \
-               not found:
-                chart_item = {
-                    "filter_rep": image_chart_filter.representation,
-                    "test_filter_id": test_filter_id,
-                    "chart_test_id": chart_test_id,
-                    "link": test_run.get_absolute_url(),
-                    "bundle_link": test_run.bundle.get_absolute_url(),
-                    "alias": alias,
-                    "number": str(test_run.build_number),
-                    "date": str(test_run.bundle.uploaded_on),
-                    "attribute": attribute,
-                    "pass": denorm.count_fail == 0,
-                    "passes": denorm.count_pass,
-                    "percentage": percentage,
-                    "skip": denorm.count_skip,
-                    "total": denorm.count_all(),
-                    "test_run_uuid": test_run.analyzer_assigned_uuid,
-                    "bug_links": bug_links,
-                    "metadata_content": metadata_content,
-                    "comments": has_comments,
-                }
+                attribute = attributes.get(self.xaxis_attribute)
+
+            chart_item = {
+                "filter_rep": image_chart_filter.representation,
+                "test_filter_id": test_filter_id,
+                "chart_test_id": chart_test_id,
+                "link": test_run.link,
+                "bundle_link": test_run.bundle_link,
+                "alias": alias,
+                "number": test_run.build_number,
+                "date": str(test_run.uploaded_on),
+                "attribute": attribute,
+                "pass": test_run.count_fail == 0,
+                "passes": test_run.count_pass,
+                "percentage": percentage,
+                "skip": test_run.count_skip,
+                "total": test_run.count_all,
+                "test_run_uuid": test_run.test_run_uuid,
+                "bug_links": test_run.bug_link_list,
+                "metadata_content": metadata_content,
+                # Whether comments do exist in any of the test result in
+                # this test run.
+                "comments": test_run.has_comments,
+            }
+            chart_items[item_key] = chart_item
 
-                chart_data["test_data"].append(chart_item)
+            chart_data["test_data"].append(chart_item)
 
     def get_chart_test_case_data(self, user, image_chart_filter, filter_data,
                                  chart_data):
@@ -2559,6 +2816,27 @@ class ImageChartFilter(models.Model):
         else:
             return self.imagecharttest_set.all()
 
+    # get_chart_data_key() when the test runs were materialized
+    chart_data_key = models.CharField(
+        max_length=40,
+        blank=True,
+        default='')
+
+    def get_chart_data_key(self, filter_data, chart_tests):
+        """
+        :return: a key of the settings which select the test runs of the
+        chart, which changes when the materialized test runs are outdated.
+        """
+        key = [
+            self.filter_id,
+            self.image_chart.is_build_number,
+            filter_data['build_number_attribute'],
+            sorted([bundle_stream.id for bundle_stream in filter_data['bundle_streams']]),
+            sorted(filter_data['attributes']),
+            sorted([chart_test.test_id for chart_test in chart_tests]),
+        ]
+        return hashlib.sha1(repr(key)).hexdigest()
+
     def get_basic_filter_data(self):
         return {
             "owner": self.filter.owner.username,
@@ -2667,6 +2945,225 @@ class ImageChartTestAttribute(models.Model):
     name = models.TextField(blank=False, null=False)
 
 
+class ImageChartFilterTestRun(models.Model):
+    """
+    Model for the materialized data of a test run shown in a pass/fail
+    chart, so that the chart is rendered from this table only.
+
+    The test runs of an image chart filter are materialized when the chart
+    is rendered for the first time, or after the selection of the test runs
+    changed (see ImageChartFilter.get_chart_data_key). The test runs of the
+    bundles deserialized afterwards are added by update_image_charts, and
+    only the last CHART_LIMIT test runs of the chart are kept.
+    """
+
+    class Meta:
+        unique_together = ("image_chart_filter", "test_run")
+        index_together = [
+            ("image_chart_filter", "build_number_value"),
+            ("image_chart_filter", "uploaded_on"),
+        ]
+
+    # Number of test runs shown in a chart.
+    CHART_LIMIT = 200
+
+    image_chart_filter = models.ForeignKey(
+        ImageChartFilter,
+        on_delete=models.CASCADE)
+
+    test_run = models.ForeignKey(
+        TestRun,
+        related_name='+',
+        on_delete=models.CASCADE)
+
+    test = models.ForeignKey(
+        Test,
+        related_name='+',
+        on_delete=models.CASCADE)
+
+    # build number or date of the bundle, as shown in the chart
+    build_number = models.CharField(max_length=1024)
+
+    build_number_value = models.IntegerField(null=True)
+
+    uploaded_on = models.DateTimeField()
+
+    link = models.CharField(max_length=1024)
+
+    bundle_link = models.CharField(max_length=1024)
+
+    test_run_uuid = models.CharField(max_length=36)
+
+    count_pass = models.PositiveIntegerField()
+
+    count_fail = models.PositiveIntegerField()
+
+    count_skip = models.PositiveIntegerField()
+
+    count_all = models.PositiveIntegerField()
+
+    # JSON list of the bug links of the test run
+    bug_links = models.TextField(default="[]")
+
+    has_comments = models.BooleanField(default=False)
+
+    # JSON object with the attributes of the test run
+    attributes = models.TextField(default="{}")
+
+    @property
+    def attribute_values(self):
+        return simplejson.loads(self.attributes)
+
+    @property
+    def bug_link_list(self):
+        return simplejson.loads(self.bug_links)
+
+    @classmethod
+    def _test_runs_data(cls, image_chart_filter, test_runs):
+        test_run_ids = [test_run.id for test_run in test_runs]
+        attributes = dict((test_run_id, {}) for test_run_id in test_run_ids)
+        for object_id, name, value in NamedAttribute.objects.filter(
+                content_type=ContentType.objects.get_for_model(TestRun),
+                object_id__in=test_run_ids).values_list('object_id', 'name', 'value'):
+            attributes[object_id][name] = value
+        bug_links = dict((test_run_id, []) for test_run_id in test_run_ids)
+        for test_run_id, bug_link in BugLink.test_runs.through.objects.filter(
+                testrun__in=test_run_ids).values_list('testrun', 'buglink__bug_link'):
+            bug_links[test_run_id].append(bug_link)
+        commented = set(TestResult.objects.filter(
+            test_run__in=test_run_ids).exclude(comments__isnull=True).values_list(
+                'test_run', flat=True).order_by().distinct())
+
+        data = []
+        for test_run in test_runs:
+            denorm = test_run.denormalization
+            build_number = getattr(test_run, 'build_number', None)
+            data.append(cls(
+                image_chart_filter=image_chart_filter,
+                test_run=test_run,
+                test=test_run.test,
+                build_number=str(test_run.bundle.uploaded_on) if build_number is None else str(build_number),
+                build_number_value=build_number,
+                uploaded_on=test_run.bundle.uploaded_on,
+                link=test_run.get_absolute_url(),
+                bundle_link=test_run.bundle.get_absolute_url(),
+                test_run_uuid=test_run.analyzer_assigned_uuid,
+                count_pass=denorm.count_pass,
+                count_fail=denorm.count_fail,
+                count_skip=denorm.count_skip,
+                count_all=denorm.count_all(),
+                bug_links=simplejson.dumps(sorted(bug_links[test_run.id])),
+                has_comments=test_run.id in commented,
+                attributes=simplejson.dumps(attributes[test_run.id])))
+        return data
+
+    @classmethod
+    def chart_order(cls, image_chart_filter):
+        """
+        :return: the order of the test runs in the chart, the same as
+        get_filter_testruns.
+        """
+        if image_chart_filter.image_chart.is_build_number and \
+           image_chart_filter.filter.build_number_attribute:
+            return '-build_number_value'
+        return '-uploaded_on'
+
+    @classmethod
+    def trim(cls, image_chart_filter):
+        """
+        Delete the test runs which are no longer among the last CHART_LIMIT
+        test runs of the image chart filter.
+        """
+        stale = cls.objects.filter(image_chart_filter=image_chart_filter).order_by(
+            cls.chart_order(image_chart_filter)).values_list(
+                'id', flat=True)[cls.CHART_LIMIT:]
+        cls.objects.filter(id__in=list(stale)).delete()
+
+    @classmethod
+    def rebuild(cls, image_chart_filter, key):
+        """
+        Materialize the last test runs selected by the image chart filter.
+        """
+        from dashboard_app.filters import get_filter_testruns
+        test_runs = list(get_filter_testruns(
+            None, image_chart_filter.filter, limit=cls.CHART_LIMIT,
+            image_chart_filter=image_chart_filter))
+        try:
+            with transaction.atomic():
+                cls.objects.filter(image_chart_filter=image_chart_filter).delete()
+                cls.objects.bulk_create(cls._test_runs_data(image_chart_filter, test_runs))
+                ImageChartFilter.objects.filter(id=image_chart_filter.id).update(
+                    chart_data_key=key)
+        except IntegrityError:
+            # the test runs of a new bundle were added concurrently
+            logging.warning("Unable to materialize the chart data of %s", image_chart_filter)
+            return
+        image_chart_filter.chart_data_key = key
+
+    @classmethod
+    def refresh(cls, image_chart_filter, bundle):
+        """
+        Materialize the test runs of the bundle, if the test runs of the
+        image chart filter are materialized and still up to date, and drop
+        the test runs which are pushed out of the chart.
+        """
+        from dashboard_app.filters import get_filter_testruns
+        if not image_chart_filter.chart_data_key:
+            return
+        chart_tests = image_chart_filter.imagecharttest_set.all()
+        key = image_chart_filter.get_chart_data_key(
+            image_chart_filter.filter.as_data(), chart_tests)
+        if key != image_chart_filter.chart_data_key:
+            # rebuilt when the chart is rendered
+            return
+        test_runs = list(get_filter_testruns(
+            None, image_chart_filter.filter, limit=None,
+            image_chart_filter=image_chart_filter, bundle=bundle))
+        if not test_runs:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.filter(image_chart_filter=image_chart_filter,
+                                   test_run__bundle=bundle).delete()
+                cls.objects.bulk_create(cls._test_runs_data(image_chart_filter, test_runs))
+                cls.trim(image_chart_filter)
+        except IntegrityError:
+            # the chart filter was rebuilt concurrently, with the bundle
+            pass
+
+    @classmethod
+    def refresh_links(cls, test_run_ids):
+        """
+        Update the bug links and comments flag of the test runs.
+        """
+        for test_run_id in test_run_ids:
+            points = cls.objects.filter(test_run=test_run_id)
+            if not points.exists():
+                continue
+            bug_links = BugLink.test_runs.through.objects.filter(
+                testrun=test_run_id).values_list('buglink__bug_link', flat=True)
+            has_comments = TestResult.objects.filter(
+                test_run=test_run_id).exclude(comments__isnull=True).exists()
+            points.update(bug_links=simplejson.dumps(sorted(bug_links)),
+                          has_comments=has_comments)
+
+
+@receiver(m2m_changed, sender=BugLink.test_runs.through)
+def chart_bug_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        ImageChartFilterTestRun.refresh_links([instance.pk])
+    elif pk_set:
+        ImageChartFilterTestRun.refresh_links(pk_set)
+
+
+@receiver(post_save, sender=TestResult)
+def chart_comments_changed(sender, instance, created, **kwargs):
+    if not created:
+        ImageChartFilterTestRun.refresh_links([instance.test_run_id])
+
+
 class ImageChartTestCase(models.Model):
 
     class Meta:
@@ -11,12 +11,14 @@ TEST_MODULES = [
     'models.test_bundle_deserialization_error',
     'models.test_bundle_stream',
     'models.test_hw_device',
+    'models.test_image_chart',
     'models.test_named_attribute',
     'models.test_sw_package',
     'models.test',
     'models.test_case',
     'models.test_result',
     'models.test_run',
+    'models.test_run_filter_index',
     'other.test_csrf',
     'other.test_dashboard_api',
     'other.test_deserialization',
@@ -12,6 +12,7 @@ from dashboard_app.tests import fixtures
 from dashboard_app.models import (
     Bundle,
     BundleDeserializationError,
+    BundleDeserializationTask,
     BundleStream,
 )
 from dashboard_app.tests.call_helper import ObjectFactoryMixIn
@@ -123,3 +124,42 @@ class BundleDeserializationTests(TestCaseWithScenarios):
         self.assertRaises(
             BundleDeserializationError.DoesNotExist,
             BundleDeserializationError.objects.get, bundle=self.bundle)
+
+
+class BundleDeserializationTaskTests(TestCase):
+
+    def setUp(self):
+        super(BundleDeserializationTaskTests, self).setUp()
+        self.bundle = fixtures.create_bundle(
+            '/anonymous/', 'bogus', 'test1.json')
+
+    def tearDown(self):
+        self.bundle.delete_files()
+        super(BundleDeserializationTaskTests, self).tearDown()
+
+    def test_claim(self):
+        self.assertIsNone(BundleDeserializationTask.claim('worker'))
+        BundleDeserializationTask.objects.create(bundle=self.bundle)
+        self.assertEqual(self.bundle.deserialization_status, 'queued')
+        task = BundleDeserializationTask.claim('worker')
+        self.assertEqual(task.bundle, self.bundle)
+        self.assertEqual(task.worker, 'worker')
+        self.assertEqual(task.status, BundleDeserializationTask.STATUS_RUNNING)
+        # a running task is not claimed again
+        self.assertIsNone(BundleDeserializationTask.claim('other'))
+        bundle = Bundle.objects.get(pk=self.bundle.pk)
+        self.assertEqual(bundle.deserialization_status, 'running')
+
+    def test_requeue_stale(self):
+        BundleDeserializationTask.objects.create(bundle=self.bundle)
+        BundleDeserializationTask.claim('worker')
+        self.assertEqual(BundleDeserializationTask.requeue_stale(3600), 0)
+        self.assertEqual(BundleDeserializationTask.requeue_stale(-1), 1)
+        self.assertEqual(BundleDeserializationTask.claim('other').worker, 'other')
+
+    def test_run(self):
+        BundleDeserializationTask.objects.create(bundle=self.bundle)
+        BundleDeserializationTask.claim('worker').run()
+        self.assertFalse(BundleDeserializationTask.objects.exists())
+        bundle = Bundle.objects.get(pk=self.bundle.pk)
+        self.assertEqual(bundle.deserialization_status, 'failed')
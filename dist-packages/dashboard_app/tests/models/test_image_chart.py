@@ -0,0 +1,205 @@
+"""
+Tests for the materialized test runs of the pass/fail image charts
+"""
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import TestCase
+
+from dashboard_app.filters import get_filter_testruns
+from dashboard_app.models import (
+    ImageChartFilter,
+    ImageChartFilterTestRun,
+    ImageChartTest,
+    ImageReport,
+    ImageReportChart,
+    NamedAttribute,
+    Test,
+    TestRunFilter,
+)
+from dashboard_app.tests import fixtures
+
+
+BUNDLE_TEXT = """
+{
+  "test_runs": [
+    {
+      "test_results": [
+        {
+          "test_case_id": "test-case-0",
+          "result": "pass"
+        },
+        {
+          "test_case_id": "test-case-1",
+          "result": "%(result)s"
+        }
+      ],
+      "attributes": {
+        "kernel": "%(kernel)s"
+      },
+      "analyzer_assigned_date": "2010-10-15T22:04:46Z",
+      "time_check_performed": false,
+      "analyzer_assigned_uuid": "00000000-0000-0000-0000-%(uuid)012d",
+      "test_id": "examples"
+    }
+  ],
+  "format": "Dashboard Bundle Format 1.0"
+}
+"""
+
+
+def legacy_chart_test_data(image_chart, image_chart_filter):
+    """
+    The chart data computed from the test runs, as before the test runs
+    were materialized.
+    """
+    test_data = []
+    selected_chart_tests = image_chart_filter.imagecharttest_set.all()
+    test_runs = get_filter_testruns(
+        None, image_chart_filter.filter,
+        limit=ImageChartFilterTestRun.CHART_LIMIT,
+        image_chart_filter=image_chart_filter)
+    metadata = {}
+    for test_run in test_runs:
+        denorm = test_run.denormalization
+        metadata_content = {}
+        test_id = test_run.test.test_id
+        if not hasattr(test_run, 'build_number'):
+            test_run.build_number = str(test_run.bundle.uploaded_on)
+        chart_test = None
+        for ch_test in selected_chart_tests:
+            if ch_test.test == test_run.test:
+                chart_test = ch_test
+        metadata.setdefault(test_id, {})
+        for attr in chart_test.attributes:
+            try:
+                new_value = test_run.attributes.get(name=attr).value
+            except NamedAttribute.DoesNotExist:
+                continue
+            if attr in metadata[test_id] and metadata[test_id][attr] != new_value:
+                metadata_content[attr] = (metadata[test_id][attr], new_value)
+            metadata[test_id][attr] = new_value
+        attribute = None
+        if image_chart.xaxis_attribute:
+            attribute = test_run.attributes.get(name=image_chart.xaxis_attribute).value
+        test_data.append({
+            "filter_rep": image_chart_filter.representation,
+            "test_filter_id": "%s-%s" % (test_id, image_chart_filter.id),
+            "chart_test_id": chart_test.id,
+            "link": test_run.get_absolute_url(),
+            "bundle_link": test_run.bundle.get_absolute_url(),
+            "alias": chart_test.name,
+            "number": str(test_run.build_number),
+            "date": str(test_run.bundle.uploaded_on),
+            "attribute": attribute,
+            "pass": denorm.count_fail == 0,
+            "passes": denorm.count_pass,
+            "percentage": 0,
+            "skip": denorm.count_skip,
+            "total": denorm.count_all(),
+            "test_run_uuid": test_run.analyzer_assigned_uuid,
+            "bug_links": sorted([b.bug_link for b in test_run.bug_links.all()]),
+            "metadata_content": metadata_content,
+            "comments": test_run.test_results.exclude(
+                comments__isnull=True).count() != 0,
+        })
+    return test_data
+
+
+class ImageChartFilterTestRunTests(TestCase):
+
+    _PATHNAME = "/anonymous/"
+
+    def setUp(self):
+        super(ImageChartFilterTestRunTests, self).setUp()
+        self.bundles = []
+        self.add_bundle(self._PATHNAME, 'pass', '4.4')
+        self.add_bundle(self._PATHNAME, 'fail', '4.5')
+        owner = User.objects.create(username='chart-owner')
+        self.filter = TestRunFilter.objects.create(owner=owner, name='chart-filter')
+        self.filter.bundle_streams.add(fixtures.create_bundle_stream(self._PATHNAME))
+        report = ImageReport.objects.create(name='chart-report', user=owner)
+        self.chart = ImageReportChart.objects.create(
+            name='chart', image_report=report, is_build_number=False,
+            is_aggregate_results=False, xaxis_attribute='kernel')
+        self.chart_filter = ImageChartFilter.objects.create(
+            image_chart=self.chart, filter=self.filter)
+        chart_test = ImageChartTest.objects.create(
+            image_chart_filter=self.chart_filter,
+            test=Test.objects.get(test_id='examples'), name='examples')
+        chart_test.attributes = ['kernel']
+
+    def tearDown(self):
+        for bundle in self.bundles:
+            bundle.delete_files()
+        super(ImageChartFilterTestRunTests, self).tearDown()
+
+    def add_bundle(self, pathname, result, kernel):
+        content = BUNDLE_TEXT % {
+            'result': result, 'kernel': kernel, 'uuid': len(self.bundles) + 1}
+        bundle = fixtures.create_bundle(pathname, content, 'bundle.json')
+        self.bundles.append(bundle)
+        bundle.deserialize()
+        self.assertTrue(bundle.is_deserialized)
+        return bundle
+
+    def materialized(self):
+        return sorted(ImageChartFilterTestRun.objects.filter(
+            image_chart_filter=self.chart_filter).values_list('test_run_uuid', flat=True))
+
+    def assertChartData(self):
+        # reload the chart filter, as in a new request
+        self.chart_filter = ImageChartFilter.objects.get(id=self.chart_filter.id)
+        test_data = self.chart.get_chart_data(AnonymousUser())["test_data"]
+        self.assertEqual(legacy_chart_test_data(self.chart, self.chart_filter), test_data)
+        return test_data
+
+    def test_build(self):
+        self.assertEqual([], self.materialized())
+        test_data = self.assertChartData()
+        self.assertEqual(['4.4', '4.5'], [item['attribute'] for item in test_data])
+        self.assertEqual({'kernel': ('4.4', '4.5')}, test_data[1]['metadata_content'])
+        self.assertEqual(2, len(self.materialized()))
+
+    def test_new_bundle(self):
+        self.assertChartData()
+        key = ImageChartFilter.objects.get(id=self.chart_filter.id).chart_data_key
+        bundle = self.add_bundle(self._PATHNAME, 'pass', '4.6')
+        # added by update_image_charts, without a rebuild
+        self.assertEqual(3, len(self.materialized()))
+        self.assertIn(bundle.test_runs.get().analyzer_assigned_uuid, self.materialized())
+        self.assertEqual(key, ImageChartFilter.objects.get(id=self.chart_filter.id).chart_data_key)
+        self.assertChartData()
+
+    def test_comments(self):
+        self.assertChartData()
+        test_result = self.bundles[0].test_runs.get().test_results.all()[0]
+        test_result.comments = 'flaky'
+        test_result.save()
+        test_data = self.assertChartData()
+        self.assertTrue(test_data[0]['comments'])
+
+    def test_bundle_streams_changed(self):
+        self.assertChartData()
+        other = "/anonymous/other/"
+        self.add_bundle(other, 'pass', '4.6')
+        # not selected by the filter
+        self.assertEqual(2, len(self.materialized()))
+        self.filter.bundle_streams.add(fixtures.create_bundle_stream(other))
+        self.assertEqual(3, len(self.assertChartData()))
+        self.assertEqual(3, len(self.materialized()))
+        self.filter.bundle_streams.remove(fixtures.create_bundle_stream(self._PATHNAME))
+        self.assertEqual(1, len(self.assertChartData()))
+        self.assertEqual(1, len(self.materialized()))
+
+    def test_chart_limit(self):
+        self.addCleanup(setattr, ImageChartFilterTestRun, 'CHART_LIMIT',
+                        ImageChartFilterTestRun.CHART_LIMIT)
+        ImageChartFilterTestRun.CHART_LIMIT = 2
+        self.assertChartData()
+        new_bundles = [self.add_bundle(self._PATHNAME, 'pass', kernel)
+                       for kernel in ['4.6', '4.7']]
+        # the oldest test runs are pushed out of the chart
+        self.assertEqual(sorted([bundle.test_runs.get().analyzer_assigned_uuid
+                                 for bundle in new_bundles]), self.materialized())
+        test_data = self.assertChartData()
+        self.assertEqual(['4.6', '4.7'], [item['attribute'] for item in test_data])
@@ -0,0 +1,45 @@
+"""
+Tests for the TestRunFilterIndex
+"""
+
+from django.test import TestCase
+
+from dashboard_app.models import TestRunFilterIndex
+
+
+class TestRunFilterIndexTests(TestCase):
+
+    def setUp(self):
+        super(TestRunFilterIndexTests, self).setUp()
+        self.index = TestRunFilterIndex()
+        # any test run of stream 1
+        self.index.add(1, [1], [], [])
+        # test runs of stream 2 with target=panda
+        self.index.add(2, [1, 2], [('target', 'panda')], [])
+        # test 10, or test case 100 of test 11
+        self.index.add(3, [1], [], [(10, []), (11, [100])])
+        # test case 101 of test 11, with two attributes
+        self.index.add(4, [1], [('target', 'panda'), ('kernel', '4.4')], [(11, [101])])
+
+    def test_bundle_stream(self):
+        self.assertEqual(set([2]), self.index.filter_ids(2, [], [], [set([('target', 'panda')])]))
+        self.assertEqual(set(), self.index.filter_ids(3, [10], [], [set()]))
+
+    def test_no_test_runs(self):
+        self.assertEqual(set(), self.index.filter_ids(1, [], [], []))
+
+    def test_tests(self):
+        self.assertEqual(set([1, 3]), self.index.filter_ids(1, [10], [], [set()]))
+        self.assertEqual(set([1]), self.index.filter_ids(1, [11], [], [set()]))
+        self.assertEqual(set([1, 3]), self.index.filter_ids(1, [11], [100], [set()]))
+
+    def test_attributes_on_one_test_run(self):
+        attributes = [set([('target', 'panda')]), set([('kernel', '4.4')])]
+        self.assertEqual(set([1, 2]), self.index.filter_ids(1, [11], [101], attributes))
+        attributes = [set([('target', 'panda'), ('kernel', '4.4'), ('os', 'debian')])]
+        self.assertEqual(set([1, 2, 4]), self.index.filter_ids(1, [11], [101], attributes))
+
+    def test_test_case_ids(self):
+        self.assertEqual(frozenset([100]), self.index.test_case_ids(3))
+        self.assertEqual(frozenset(), self.index.test_case_ids(1))
+        self.assertEqual(frozenset(), self.index.test_case_ids(5))
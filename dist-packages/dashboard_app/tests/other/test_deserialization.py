@@ -50,9 +50,12 @@ from dashboard_app.models import (
 )
 from dashboard_app.helpers import (
     BundleDeserializer,
+    CopyStream,
     IBundleFormatImporter,
     BundleFormatImporter_1_0,
     BundleFormatImporter_1_1,
+    ImportCache,
+    copy_value,
 )
 
 
@@ -258,6 +261,57 @@ class BundleFormatImporter_1_0Tests(
                           "impossible result")
 
 
+class CopyStreamTests(TestCase):
+
+    def test_copy_value(self):
+        self.assertEqual(copy_value(None), '\\N')
+        self.assertEqual(copy_value(True), 't')
+        self.assertEqual(copy_value(12), '12')
+        self.assertEqual(copy_value(0.1), '0.1')
+        self.assertEqual(copy_value(decimal.Decimal('1.50')), '1.50')
+        self.assertEqual(copy_value(u'caf\xe9'), 'caf\xc3\xa9')
+        self.assertEqual(copy_value('a\tb\nc\\d\re'), 'a\\tb\\nc\\\\d\\re')
+        self.assertEqual(
+            copy_value(datetime.datetime(2016, 1, 2, 3, 4, 5)),
+            '2016-01-02T03:04:05')
+
+    def test_read(self):
+        rows = [(1, 'a', None), (2, 'b\tc', 'd')]
+        expected = '1\ta\t\\N\n2\tb\\tc\td\n'
+        self.assertEqual(CopyStream(rows).read(), expected)
+        stream = CopyStream(rows)
+        chunks = []
+        while True:
+            chunk = stream.read(3)
+            if not chunk:
+                break
+            self.assertTrue(len(chunk) <= 3)
+            chunks.append(chunk)
+        self.assertEqual(''.join(chunks), expected)
+        self.assertEqual(stream.count, 2)
+
+
+class ImportCacheTests(TestCase):
+
+    def test_update(self):
+        cache = ImportCache(max_size=3)
+        pending = ImportCache()
+        pending.test_cases[(1, 'case')] = 10
+        pending.packages[('name', '1.0')] = 20
+        cache.update(pending)
+        self.assertEqual(cache.get('test_cases', (1, 'case')), 10)
+        self.assertEqual(cache.get('packages', ('name', '1.0')), 20)
+        self.assertIsNone(cache.get('packages', ('name', '2.0')))
+        pending = ImportCache()
+        pending.test_cases.update({(1, 'a'): 11, (1, 'b'): 12, (1, 'c'): 13})
+        cache.update(pending)
+        # the table is cleared rather than growing over max_size
+        self.assertIsNone(cache.get('test_cases', (1, 'case')))
+        self.assertEqual(cache.get('test_cases', (1, 'c')), 13)
+        cache.clear()
+        self.assertIsNone(cache.get('packages', ('name', '1.0')))
+
+
 class BundleDeserializerSuccessTests(TestCaseWithScenarios):
 
     json_text = '''
@@ -29,7 +29,9 @@ import xmlrpclib
 import hashlib
 import json
 import os
+import socket
 import subprocess
+from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.core.urlresolvers import reverse
 from django.db import IntegrityError, DatabaseError
@@ -42,6 +44,7 @@ from linaro_django_xmlrpc.models import (
 from dashboard_app.filters import evaluate_filter
 from dashboard_app.models import (
     Bundle,
+    BundleDeserializationTask,
     BundleStream,
     Test,
     TestRunFilter,
@@ -131,8 +134,12 @@ class DashboardAPI(ExposedAPI):
             self.logger.exception("big oops")
             raise
         else:
-            self.logger.debug("Deserializing bundle")
-            bundle.deserialize()
+            if getattr(settings, 'BUNDLE_DESERIALIZATION_ASYNC', False):
+                self.logger.debug("Queuing bundle deserialization")
+                BundleDeserializationTask.objects.create(bundle=bundle)
+            else:
+                self.logger.debug("Deserializing bundle")
+                bundle.deserialize()
             return bundle
 
     @xml_rpc_signature('str', 'str', 'str', 'str')
@@ -682,7 +689,11 @@ class DashboardAPI(ExposedAPI):
         Return value
         ------------
         True - deserialization okay
-        False - deserialization not needed
+        False - deserialization not needed, or the bundle is being
+        deserialized by a background worker
+
+        A bundle queued for background deserialization is deserialized
+        immediately.
 
         Exceptions raised
         -----------------
@@ -697,13 +708,60 @@ class DashboardAPI(ExposedAPI):
             raise xmlrpclib.Fault(errors.NOT_FOUND, "Bundle not found")
         if bundle.is_deserialized:
             return False
-        bundle.deserialize()
+        try:
+            bundle.deserialization_task
+        except BundleDeserializationTask.DoesNotExist:
+            bundle.deserialize()
+        else:
+            task = BundleDeserializationTask.claim(
+                "%s:%d" % (socket.gethostname(), os.getpid()), bundle=bundle)
+            if task is None:
+                return False
+            task.run()
+            bundle = Bundle.objects.get(pk=bundle.pk)
         if bundle.is_deserialized is False:
             raise xmlrpclib.Fault(
                 errors.CONFLICT,
                 bundle.deserialization_error.error_message)
         return True
 
+    def deserialization_status(self, content_sha1):
+        """
+        Name
+        ----
+        `deserialization_status` (`content_sha1`)
+
+        Description
+        -----------
+        Show the deserialization status of a bundle, to follow the bundles
+        deserialized in the background after `put`.
+
+        Arguments
+        ---------
+        `content_sha1`: string
+            SHA1 hash of the content of the bundle. This *MUST* designate
+            an bundle or ``Fault(404, "...")`` is raised.
+
+        Return value
+        ------------
+        One of:
+            - 'pending' - the bundle is not deserialized
+            - 'queued' - the bundle waits for a deserializer worker
+            - 'running' - a worker is deserializing the bundle
+            - 'deserialized' - deserialization okay
+            - 'failed' - bundle import failed
+
+        Exceptions raised
+        -----------------
+        404
+            Bundle not found
+        """
+        try:
+            bundle = Bundle.objects.get(content_sha1=content_sha1)
+        except Bundle.DoesNotExist:
+            raise xmlrpclib.Fault(errors.NOT_FOUND, "Bundle not found")
+        return bundle.deserialization_status
+
     def make_stream(self, pathname, name):
         """
         Name
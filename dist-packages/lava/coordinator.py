@@ -1,7 +1,16 @@
+import os
 import time
+import errno
+import select
 import socket
+import sqlite3
 import logging
 import json
+import zlib
+import multiprocessing
+from multiprocessing.reduction import send_handle, recv_handle
+
+from lava.framing import FrameReader, MAX_MESSAGE
 
 #  Copyright 2013 Linaro Limited
 #  Author Neil Williams <neil.williams@linaro.org>
@@ -22,6 +31,99 @@ import json
 #  MA 02110-1301, USA.
 
 
+# requests which a client can ask to be kept pending, instead of getting
+# a "wait" response, until the group data allows a reply.
+PUSH_REQUESTS = ['group_data', 'lava_sync', 'lava_wait', 'lava_wait_all']
+
+POLLIN = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
+POLLOUT = select.POLLOUT
+
+
+class CoordinatorConnection(object):
+    """
+    A non-blocking client connection. Handlers send the responses through
+    the connection as they would through a socket: the data is buffered
+    until the socket is writable, and close() only closes once the
+    response is sent, unless the client asked for a persistent connection.
+    """
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.sock.setblocking(0)
+        self.fd = sock.fileno()
+        self.addr = addr
+        self.reader = FrameReader()
+        self.outbuf = bytearray()
+        self.persistent = False
+        self.push = False
+        self.closing = False
+        self.closed = False
+        self.eof = False
+
+    def fileno(self):
+        return self.fd
+
+    def getpeername(self):
+        return self.addr
+
+    def send(self, data):
+        self.outbuf += data
+        return len(data)
+
+    def close(self):
+        if not self.persistent:
+            self.closing = True
+
+
+def shard(group_name, workers):
+    """
+    :return: the index of the worker serving the group.
+    """
+    return (zlib.crc32(group_name.encode('utf-8')) & 0xffffffff) % workers
+
+
+class GroupSnapshot(object):
+    """
+    On-disk copy of the group data in a sqlite database, shared by the
+    workers, so that the groups survive a restart of the coordinator.
+    Clients lose their connection on restart and send their request
+    again, so pending requests do not need to be saved.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS groups "
+                        "(name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.db.commit()
+
+    def load(self, index=0, workers=1):
+        """
+        :return: the groups served by the worker
+        """
+        groups = {}
+        for name, data in self.db.execute("SELECT name, data FROM groups"):
+            if shard(name, workers) == index:
+                groups[name] = json.loads(data)
+        return groups
+
+    def save(self, all_groups, names):
+        """
+        Store the named groups, or delete them if they have been cleared.
+        """
+        with self.db:
+            for name in names:
+                if name in all_groups:
+                    self.db.execute("INSERT OR REPLACE INTO groups (name, data) VALUES (?, ?)",
+                                    (name, json.dumps(all_groups[name])))
+                else:
+                    self.db.execute("DELETE FROM groups WHERE name = ?", (name,))
+
+    def close(self):
+        self.db.close()
+
+
 class LavaCoordinator(object):
 
     running = False
@@ -34,6 +136,14 @@ class LavaCoordinator(object):
     group = None
     conn = None
     host = "localhost"
+    # pending connections allowed by listen()
+    backlog = 128
+    # seconds between checks of self.running
+    poll_timeout = 1
+    # number of worker processes, each serving a shard of the groups
+    workers = 1
+    # path to the sqlite snapshot of the groups, if any
+    snapshot = None
 
     def __init__(self, json_data):
         """
@@ -50,8 +160,35 @@ class LavaCoordinator(object):
             self.blocksize = json_data['blocksize']
         if 'host' in json_data:
             self.host = json_data['host']
+        if 'workers' in json_data:
+            self.workers = max(int(json_data['workers']), 1)
+        if 'snapshot' in json_data:
+            self.snapshot = json_data['snapshot']
+        self.all_groups = {}
+        # index of the shard of groups served by this process
+        self.shard = 0
+        # groups changed since the last snapshot
+        self.dirty = set()
+        self.connections = {}
+        # requests waiting for a change in the data of their group,
+        # indexed by group name
+        self.waiters = {}
+        self.parked = False
+        self.poller = None
 
     def run(self):
+        """
+        Serves all the clients from a single epoll loop.
+        Clients setting "persistent" in a request keep the connection open
+        for the next requests. If they also set "push", the requests listed
+        in PUSH_REQUESTS do not get a "wait" response: the response is sent
+        as soon as the rest of the group allows it.
+        Other clients get the response to a single request, then the
+        connection is closed.
+        With more than one worker, this process only accepts the
+        connections and passes each one, once its first request is read,
+        to the worker serving the group of the request.
+        """
         s = None
         while 1:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -64,32 +201,276 @@ class LavaCoordinator(object):
                 logging.warn("Unable to bind, trying again with delay=%d msg=%s" % (self.delay, e.message))
                 time.sleep(self.delay)
                 self.delay *= 2
-        s.listen(1)
+        self.group_port = s.getsockname()[1]
+        s.listen(self.backlog)
+        s.setblocking(0)
+        if self.workers > 1:
+            self._route(s)
+        else:
+            self._serve(listener=s)
+        s.close()
+
+    def _serve(self, listener=None, pipe=None):
+        """
+        Event loop of a process serving groups: the connections are accepted
+        on the listener or received from the router on the pipe.
+        """
+        self.poller = select.epoll() if hasattr(select, 'epoll') else select.poll()
+        if listener:
+            self.poller.register(listener.fileno(), POLLIN)
+        if pipe:
+            self.poller.register(pipe.fileno(), POLLIN)
+        snapshot = None
+        if self.snapshot:
+            snapshot = GroupSnapshot(self.snapshot)
+            self.all_groups.update(snapshot.load(self.shard, self.workers))
+            logging.info("Restored %d groups from %s" % (len(self.all_groups), self.snapshot))
+        self.running = True
+        logging.info("Ready to accept new connections")
+        while self.running:
+            for fd, event in self._poll():
+                if listener and fd == listener.fileno():
+                    self._accept(listener)
+                    continue
+                if pipe and fd == pipe.fileno():
+                    self._receive(pipe)
+                    continue
+                conn = self.connections.get(fd)
+                if conn is None:
+                    continue
+                if event & POLLIN:
+                    self._read(conn)
+                if event & POLLOUT and not conn.closed:
+                    self._flush(conn)
+            if snapshot and self.dirty:
+                snapshot.save(self.all_groups, self.dirty)
+            self.dirty.clear()
+        for conn in self.connections.values():
+            self._drop(conn)
+        if snapshot:
+            snapshot.close()
+        if hasattr(self.poller, 'close'):
+            self.poller.close()
+
+    def _route(self, s):
+        """
+        Starts the workers and passes them the connections.
+        """
+        workers = []
+        for index in range(self.workers):
+            parent, child = multiprocessing.Pipe()
+            others = [pipe for _, pipe in workers] + [parent]
+            process = multiprocessing.Process(target=self._worker, args=(index, s, others, child))
+            process.daemon = True
+            process.start()
+            child.close()
+            workers.append((process, parent))
+        logging.info("Started %d workers" % self.workers)
+        self.poller = select.epoll() if hasattr(select, 'epoll') else select.poll()
+        self.poller.register(s.fileno(), POLLIN)
         self.running = True
         while self.running:
-            logging.info("Ready to accept new connections")
-            self.conn, addr = s.accept()
-            # read the header to get the size of the message to follow
-            data = str(self.conn.recv(8))  # 32bit limit
+            for fd, event in self._poll():
+                if fd == s.fileno():
+                    self._accept(s)
+                    continue
+                conn = self.connections.get(fd)
+                if conn is None:
+                    continue
+                try:
+                    messages = conn.reader.feed(conn.sock)
+                    if messages:
+                        group_name = json.loads(messages[0]).get('group_name') or ''
+                        index = shard(group_name, self.workers)
+                except (ValueError, AttributeError, TypeError):
+                    logging.debug("Invalid message: %s from %s" % (conn.reader.pending(), conn.addr[0]))
+                    self._drop(conn)
+                    continue
+                if not messages:
+                    if conn.reader.eof:
+                        self._drop(conn)
+                    continue
+                process, pipe = workers[index]
+                self._handover(conn, messages, process, pipe)
+        for conn in self.connections.values():
+            self._drop(conn)
+        for process, pipe in workers:
+            # the worker stops once the pipe is closed
+            pipe.close()
+            process.join()
+        if hasattr(self.poller, 'close'):
+            self.poller.close()
+
+    def _worker(self, index, s, others, pipe):
+        s.close()
+        # only the router may keep the pipes of the workers open
+        for other in others:
+            other.close()
+        self.shard = index
+        self._serve(pipe=pipe)
+
+    def _handover(self, conn, messages, process, pipe):
+        del self.connections[conn.fd]
+        self.poller.unregister(conn.fd)
+        conn.closed = True
+        try:
+            pipe.send((conn.addr, conn.reader, messages))
+            send_handle(pipe, conn.fd, process.pid)
+        except (IOError, OSError) as exc:
+            logging.error("Unable to pass the connection from %s to worker %d: %s" %
+                          (conn.addr[0], process.pid, exc))
+        conn.sock.close()
+
+    def _receive(self, pipe):
+        try:
+            addr, reader, messages = pipe.recv()
+            fd = recv_handle(pipe)
+        except (EOFError, IOError):
+            # the router has stopped
+            self.running = False
+            return
+        sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+        os.close(fd)
+        conn = CoordinatorConnection(sock, addr)
+        conn.reader = reader
+        self.connections[conn.fileno()] = conn
+        self.poller.register(conn.fileno(), POLLIN)
+        self._process(conn, messages)
+
+    def _poll(self):
+        try:
+            if hasattr(select, 'epoll') and isinstance(self.poller, select.epoll):
+                return self.poller.poll(self.poll_timeout)
+            return self.poller.poll(self.poll_timeout * 1000)
+        except (IOError, select.error) as exc:
+            if exc.args[0] == errno.EINTR:
+                return []
+            raise
+
+    def _accept(self, s):
+        while True:
             try:
-                count = int(data, 16)
-            except ValueError:
-                logging.debug("Invalid message: %s from %s" % (data, self.conn.getpeername()[0]))
-                self.conn.close()
-                continue
-            c = 0
-            data = ''
-            # get the message itself
-            while c < count:
-                data += self.conn.recv(self.blocksize)
-                c += self.blocksize
+                sock, addr = s.accept()
+            except socket.error as exc:
+                if exc.errno in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+                    return
+                logging.warn("Unable to accept a connection: %s" % exc)
+                return
+            conn = CoordinatorConnection(sock, addr)
+            self.connections[conn.fileno()] = conn
+            self.poller.register(conn.fileno(), POLLIN)
+
+    def _read(self, conn):
+        try:
+            messages = conn.reader.feed(conn.sock)
+        except ValueError:
+            logging.debug("Invalid message: %s from %s" % (conn.reader.pending(), conn.addr[0]))
+            self._drop(conn)
+            return
+        self._process(conn, messages)
+
+    def _process(self, conn, messages):
+        # clients which do not keep the connection shutdown their side
+        # once the request is sent: the response is still sent.
+        conn.eof = conn.reader.eof
+        for data in messages:
+            if conn.closed:
+                break
             try:
                 json_data = json.loads(data)
             except ValueError:
                 logging.warn("JSON error for '%s'" % data[:100])
-                self.conn.close()
-                continue
-            self.dataReceived(json_data)
+                self._drop(conn)
+                return
+            self._handle(conn, json_data)
+        if not conn.closed:
+            self._flush(conn)
+
+    def _handle(self, conn, json_data):
+        """
+        Handles one request. A "wait" response to a request of a client
+        asking for push is not sent: the request is kept and handled again
+        each time the data of its group changes, until it gets another
+        response.
+        """
+        conn.persistent = bool(json_data.get('persistent', False))
+        conn.push = conn.persistent and json_data.get('push', False) and \
+            json_data.get('request') in PUSH_REQUESTS
+        self._dispatch(conn, json_data)
+        if self.parked:
+            self.waiters.setdefault(json_data['group_name'], []).append((conn, json_data))
+        elif not conn.persistent:
+            conn.closing = True
+        self._flush(conn)
+        if 'group_name' in json_data:
+            self.dirty.add(json_data['group_name'])
+            self._wake(json_data['group_name'])
+
+    def _dispatch(self, conn, json_data):
+        self.conn = conn
+        self.parked = False
+        self.dataReceived(json_data)
+
+    def _wake(self, group_name):
+        """
+        Handles again the pending requests of the group, as if the clients
+        had polled, until none of them gets a response.
+        """
+        changed = True
+        while changed and group_name in self.waiters:
+            changed = False
+            waiters = self.waiters.pop(group_name)
+            if group_name not in self.all_groups:
+                # the group has been cleared
+                for conn, _ in waiters:
+                    self.conn = conn
+                    self._badRequest()
+                    self._flush(conn)
+                return
+            pending = []
+            for conn, json_data in waiters:
+                if conn.closed:
+                    continue
+                self._dispatch(conn, json_data)
+                if self.parked:
+                    pending.append((conn, json_data))
+                else:
+                    changed = True
+                    self._flush(conn)
+            if pending:
+                self.waiters[group_name] = pending
+
+    def _flush(self, conn):
+        if conn.closed:
+            return
+        while conn.outbuf:
+            try:
+                sent = conn.sock.send(memoryview(conn.outbuf))
+            except socket.error as exc:
+                if exc.errno in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+                    break
+                self._drop(conn)
+                return
+            del conn.outbuf[:sent]
+        if conn.outbuf:
+            self.poller.modify(conn.fileno(), POLLIN | POLLOUT)
+        elif conn.closing or conn.eof:
+            self._drop(conn)
+        else:
+            self.poller.modify(conn.fileno(), POLLIN)
+
+    def _drop(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        del self.connections[conn.fd]
+        for group_name in self.waiters.keys():
+            self.waiters[group_name] = [waiter for waiter in self.waiters[group_name]
+                                        if waiter[0] is not conn]
+            if not self.waiters[group_name]:
+                del self.waiters[group_name]
+        self.poller.unregister(conn.fd)
+        conn.sock.close()
 
     def _updateData(self, json_data):
         """
@@ -198,9 +579,9 @@ class LavaCoordinator(object):
             return None
         # "header" calculation
         msglen = "%08X" % len(msgstr)
-        if int(msglen, 16) > 0xFFFFFFFF:
+        if int(msglen, 16) > MAX_MESSAGE:
             logging.error("Message was too long to send! %d > %d" %
-                          (int(msglen, 16), 0xFFFFFFFF))
+                          (int(msglen, 16), MAX_MESSAGE))
             return None
         return msglen, msgstr
 
@@ -284,6 +665,10 @@ class LavaCoordinator(object):
         self.conn.close()
 
     def _waitResponse(self):
+        if self.conn.push:
+            # the request is handled again when the group data changes
+            self.parked = True
+            return
         msgdata = self._formatMessage({"response": "wait"})
         if msgdata:
             self.conn.send(msgdata[0])
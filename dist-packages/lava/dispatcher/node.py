@@ -30,18 +30,23 @@ import errno
 import logging
 import os
 import copy
+import select
 import sys
 import time
+from lava.framing import send_message, recv_message, MAX_MESSAGE
 from lava_dispatcher.config import get_config
 from lava_dispatcher.job import LavaTestJob
 
 
 class Poller(object):
     """
-    Blocking, synchronous socket poller which repeatedly tries to connect
-    to the Coordinator, get a very fast response and then implement the
-    wait.
+    Blocking, synchronous client of the Coordinator.
+    The connection is kept open between requests and the requests ask the
+    Coordinator to push the response once it is available, so that the
+    node is released as soon as the rest of the group is ready.
     If the node needs to wait, it will get a {"response": "wait"}
+    (only for requests which cannot be pushed, or from older Coordinators
+    which also close the connection after each response) and polls again.
     If the node should stop polling and send data back to the board, it will
     get a {"response": "ack", "message": "blah blah"}
     """
@@ -51,6 +56,7 @@ class Poller(object):
     # how long between polls (in seconds)
     poll_delay = 1
     timeout = 0
+    sock = None
 
     def __init__(self, data_str):
         try:
@@ -68,41 +74,85 @@ class Poller(object):
         if 'timeout' in self.json_data:
             self.timeout = self.json_data['timeout']
 
+    def _connect(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.connect((self.json_data['host'], self.json_data['port']))
+            logging.debug("Connecting to LAVA Coordinator on %s:%s",
+                          self.json_data['host'], self.json_data['port'])
+        except socket.error as e:
+            if e.errno == errno.ECONNREFUSED:
+                logging.warning("Lava Coordinator refused connection on %s %s" %
+                                (self.json_data['host'], self.json_data['port']))
+            elif e.errno == errno.ECONNRESET:
+                logging.warning("Connection to coordinator reset by peer on port %s" %
+                                self.json_data['port'])
+            else:
+                logging.warning("socket error on connect: %d %s %s" %
+                                (e.errno, self.json_data['host'], self.json_data['port']))
+            self.close()
+            return False
+        return True
+
+    def _request(self, msg_str, timeout):
+        """
+        Send one request over the connection and wait up to timeout seconds
+        for the response.
+        :return: the response, None if the connection was lost.
+        :raises socket.timeout: if no response was received in time.
+        """
+        try:
+            send_message(self.sock, msg_str)
+        except socket.error as e:
+            logging.warning("socket error '%s' on send", e)
+            self.close()
+            return None
+        self.sock.settimeout(timeout)
+        try:
+            response = recv_message(self.sock)
+        except socket.timeout:
+            self.close()
+            raise
+        except (socket.error, ValueError) as e:
+            logging.warning("socket error '%s' on response", e)
+            self.close()
+            return None
+        if response is None:
+            logging.debug("connection closed before the response")
+            self.close()
+            return None
+        # older Coordinators close the connection after each response.
+        if select.select([self.sock], [], [], 0)[0] and not self.sock.recv(1, socket.MSG_PEEK):
+            self.close()
+        return response
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+
     def poll(self, msg_str):
         """
-        Blocking, synchronous polling of the Coordinator on the configured port.
-        Single send operations greater than 0xFFFF are rejected to prevent truncation.
+        Blocking, synchronous request to the Coordinator on the configured port.
         :param msg_str: The message to send to the Coordinator, as a JSON string.
         :return: a JSON string of the response to the poll
         """
         # starting value for the delay between polls
         delay = 1
-        msg_len = len(msg_str)
-        if msg_len > 0xFFFE:
+        msg = json.loads(msg_str)
+        msg.update({"persistent": True, "push": True})
+        msg_str = json.dumps(msg)
+        if len(msg_str) > MAX_MESSAGE:
             logging.error("Message was too long to send!")
             return
+        start = time.time()
         c = 0
         waited = 0
         response = None
         while True:
             c += self.poll_delay
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            try:
-                s.connect((self.json_data['host'], self.json_data['port']))
-                logging.debug("Connecting to LAVA Coordinator on %s:%s",
-                              self.json_data['host'], self.json_data['port'])
-                delay = self.poll_delay
-            except socket.error as e:
-                if e.errno == errno.ECONNREFUSED:
-                    logging.warning("Lava Coordinator refused connection on %s %s" %
-                                    (self.json_data['host'], self.json_data['port']))
-                elif e.errno == errno.ECONNRESET:
-                    logging.warning("Connection to coordinator reset by peer on port %s" %
-                                    self.json_data['port'])
-                else:
-                    logging.warning("socket error on connect: %d %s %s" %
-                                    (e.errno, self.json_data['host'], self.json_data['port']))
+            if not self.sock and not self._connect():
                 logging.debug("Trying again in %s seconds. Job will timeout in %s seconds" %
                               (delay, self.json_data['timeout'] - waited))
                 waited += delay
@@ -111,41 +161,15 @@ class Poller(object):
                     logging.info("Connection to coordinator timed out")
                     break
                 delay += 2
-                s.close()
                 continue
+            delay = self.poll_delay
             logging.debug("sending message: %s...", msg_str[:42])
-            # blocking synchronous call
-            try:
-                # send the length as 32bit hexadecimal
-                ret_bytes = s.send("%08X" % msg_len)
-                if ret_bytes == 0:
-                    logging.debug("zero bytes sent for length - connection closed?")
-                    continue
-                ret_bytes = s.send(msg_str)
-                if ret_bytes == 0:
-                    logging.debug("zero bytes sent for message - connection closed?")
-                    continue
-            except socket.error as e:
-                logging.warning("socket error '%d' on send", e.message)
-                s.close()
-                continue
-            s.shutdown(socket.SHUT_WR)
+            remaining = max(self.timeout - (time.time() - start), self.poll_delay)
             try:
-                header = s.recv(8)  # 32bit limit as a hexadecimal
-                if not header or header == '':
-                    logging.debug("empty header received?")
-                    continue
-                msg_count = int(header, 16)
-                recv_count = 0
-                response = ''
-                while recv_count < msg_count:
-                    response += s.recv(self.blocks)
-                    recv_count += self.blocks
-            except socket.error as e:
-                logging.warning("socket error '%d' on response", e.errno)
-                s.close()
-                continue
-            s.close()
+                response = self._request(msg_str, remaining)
+            except socket.timeout:
+                response = json.dumps({"response": "nack"})
+                break
             if not response:
                 time.sleep(delay)
                 # if no response, wait and try again
@@ -160,10 +184,10 @@ class Poller(object):
                 break
             else:
                 if not (c % int(10 * self.poll_delay)):
-                    logging.info("Waiting ... %d of %d secs", c, self.timeout)
+                    logging.info("Waiting ... %d of %d secs", time.time() - start, self.timeout)
                 time.sleep(delay)
             # apply the default timeout to each poll operation.
-            if c > self.timeout:
+            if time.time() - start > self.timeout:
                 response = json.dumps({"response": "nack"})
                 break
         return response
@@ -303,6 +327,7 @@ class NodeDispatcher(object):
         fin_msg.update(self.base_msg)
         logging.debug("fin_msg %s", json.dumps(fin_msg))
         self.poller.poll(json.dumps(fin_msg))
+        self.poller.close()
 
     def __call__(self, args):
         """ Makes the NodeDispatcher callable so that the test shell can send messages just using the
@@ -0,0 +1,155 @@
+#  Copyright 2016 Linaro Limited
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+"""
+Framing of the messages exchanged with the LAVA Coordinator.
+
+Each message is preceded by a header holding the length of the message as
+a hexadecimal string padded to 8 characters (not including 0x). Messages
+are read into preallocated buffers with recv_into, so reading a message
+is linear in its size whatever the size of the reads returned by the
+socket.
+"""
+
+import errno
+import socket
+
+HEADER_SIZE = 8
+# The buffer of a message is allocated from the length in the header sent
+# by the peer, so the length is bounded well below the 32bit limit of the
+# header.
+MAX_MESSAGE = 16 * 1024 * 1024
+
+
+def frame(message):
+    """
+    :param message: the message as a string
+    :return: the header followed by the message
+    :raises ValueError: if the message is too long for the header
+    """
+    if len(message) > MAX_MESSAGE:
+        raise ValueError("Message was too long to send! %d > %d" % (len(message), MAX_MESSAGE))
+    return "%08X%s" % (len(message), message)
+
+
+def parse_header(header):
+    """
+    :raises ValueError: if the header is not a valid length, or a length
+    larger than MAX_MESSAGE
+    """
+    count = int(str(header), 16)
+    if count < 0:
+        raise ValueError("Invalid message length: %s" % header)
+    if count > MAX_MESSAGE:
+        raise ValueError("Message was too long to receive! %d > %d" % (count, MAX_MESSAGE))
+    return count
+
+
+def send_message(sock, message):
+    """
+    Send the header and the message on a blocking socket.
+    """
+    sock.sendall(frame(message))
+
+
+def recv_exactly(sock, count):
+    """
+    Read exactly count bytes from a blocking socket.
+    :return: the data, None if the connection was closed before.
+    """
+    data = bytearray(count)
+    view = memoryview(data)
+    pos = 0
+    while pos < count:
+        received = sock.recv_into(view[pos:], count - pos)
+        if not received:
+            return None
+        pos += received
+    return str(data)
+
+
+def recv_message(sock):
+    """
+    Read one message from a blocking socket.
+    :return: the message, None if the connection was closed.
+    :raises ValueError: if the header is invalid or the message too long
+    """
+    header = recv_exactly(sock, HEADER_SIZE)
+    if header is None:
+        return None
+    count = parse_header(header)
+    if not count:
+        return ''
+    return recv_exactly(sock, count)
+
+
+class FrameReader(object):
+    """
+    Reads the messages received on a non-blocking socket as the data
+    arrives: the header, then the message into a buffer of the size given
+    by the header.
+    """
+
+    def __init__(self):
+        self.eof = False
+        self._reset()
+
+    def _reset(self):
+        self.header = True
+        self.buffer = bytearray(HEADER_SIZE)
+        self.pos = 0
+
+    def pending(self):
+        """
+        :return: the beginning of the partial message, for logging.
+        """
+        return str(self.buffer[:self.pos])
+
+    def feed(self, sock):
+        """
+        Read the available data from the socket.
+        :return: the list of complete messages received
+        :raises ValueError: if a header is invalid or a message too long
+        """
+        messages = []
+        while not self.eof:
+            view = memoryview(self.buffer)
+            try:
+                received = sock.recv_into(view[self.pos:], len(self.buffer) - self.pos)
+            except socket.error as exc:
+                if exc.errno in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+                    break
+                received = 0
+            if not received:
+                self.eof = True
+                break
+            self.pos += received
+            if self.pos < len(self.buffer):
+                continue
+            if self.header:
+                count = parse_header(self.buffer)
+                if not count:
+                    messages.append('')
+                    self._reset()
+                    continue
+                self.header = False
+                self.buffer = bytearray(count)
+                self.pos = 0
+            else:
+                messages.append(str(self.buffer))
+                self._reset()
+        return messages
@@ -0,0 +1,246 @@
+#  Copyright 2016 Linaro Limited
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+"""
+lava.coordinator unit tests, over real sockets.
+"""
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+from lava.coordinator import LavaCoordinator
+
+
+class Client(object):
+    """
+    A node talking to the coordinator, either over a persistent connection
+    with push, or with one connection per request like older nodes.
+    """
+
+    def __init__(self, port, group, name, role, size, persistent=True):
+        self.port = port
+        self.persistent = persistent
+        self.sock = None
+        self.base = {"group_name": group, "client_name": name, "role": role,
+                     "hostname": name, "group_size": size}
+
+    def send(self, request, **kwargs):
+        if not self.sock:
+            self.sock = socket.create_connection(('localhost', self.port))
+        msg = dict(self.base, request=request, **kwargs)
+        if self.persistent:
+            msg.update({"persistent": True, "push": True})
+        data = json.dumps(msg)
+        self.sock.sendall("%08X" % len(data))
+        self.sock.sendall(data)
+        if not self.persistent:
+            self.sock.shutdown(socket.SHUT_WR)
+
+    def recv(self, timeout=5):
+        self.sock.settimeout(timeout)
+        header = self._read(8)
+        response = json.loads(self._read(int(header, 16)))
+        if not self.persistent:
+            self.close()
+        return response
+
+    def _read(self, count):
+        data = ''
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise socket.error("connection closed")
+            data += chunk
+        return data
+
+    def pending(self, timeout=0.2):
+        self.sock.settimeout(timeout)
+        try:
+            return self.sock.recv(1, socket.MSG_PEEK) != ''
+        except socket.timeout:
+            return False
+
+    def close(self):
+        self.sock.close()
+        self.sock = None
+
+
+class TestCoordinator(unittest.TestCase):
+
+    config = {}
+
+    def setUp(self):
+        self.start()
+        self.group = str(uuid.uuid4())
+        self.clients = []
+
+    def start(self):
+        self.coordinator = LavaCoordinator(dict(self.config, port=0))
+        self.coordinator.poll_timeout = 0.1
+        self.thread = threading.Thread(target=self.coordinator.run)
+        self.thread.daemon = True
+        self.thread.start()
+        while not self.coordinator.running:
+            time.sleep(0.01)
+        for client in getattr(self, 'clients', []):
+            client.port = self.coordinator.group_port
+
+    def stop(self):
+        for client in self.clients:
+            if client.sock:
+                client.close()
+        self.coordinator.running = False
+        self.thread.join()
+
+    def tearDown(self):
+        self.stop()
+
+    def client(self, name, role='client', size=2, persistent=True):
+        client = Client(self.coordinator.group_port, self.group, name, role, size, persistent)
+        self.clients.append(client)
+        return client
+
+    def test_group_data_push(self):
+        server = self.client('server', role='server')
+        client = self.client('client')
+        server.send('group_data')
+        self.assertFalse(server.pending())
+        client.send('group_data')
+        roles = {'server': 'server', 'client': 'client'}
+        self.assertEqual({'response': 'group_data', 'roles': roles}, client.recv())
+        self.assertEqual({'response': 'group_data', 'roles': roles}, server.recv())
+
+    def test_wait_released_by_send(self):
+        server = self.client('server', role='server')
+        client = self.client('client')
+        server.send('group_data')
+        client.send('group_data')
+        server.recv()
+        client.recv()
+        client.send('lava_wait', messageID='ready')
+        self.assertFalse(client.pending())
+        # the same connection is used for the next requests
+        server.send('lava_send', messageID='ready', message={'ip': '10.0.0.1'})
+        self.assertEqual('ack', server.recv()['response'])
+        self.assertEqual({'response': 'ack', 'message': {'server': {'ip': '10.0.0.1'}}},
+                         client.recv())
+
+    def test_sync_push(self):
+        nodes = [self.client('node%d' % index, size=3) for index in range(3)]
+        for node in nodes:
+            node.send('group_data')
+        for node in nodes:
+            node.recv()
+        nodes[0].send('lava_sync', messageID='sync')
+        nodes[1].send('lava_sync', messageID='sync')
+        self.assertFalse(nodes[0].pending())
+        nodes[2].send('lava_sync', messageID='sync')
+        for node in nodes:
+            self.assertEqual('ack', node.recv()['response'])
+
+    def test_polling_client(self):
+        old = self.client('old', persistent=False, size=3)
+        new = self.client('new', size=3)
+        other = self.client('other', size=3)
+        old.send('group_data')
+        self.assertEqual({'response': 'wait'}, old.recv())
+        new.send('group_data')
+        self.assertFalse(new.pending())
+        other.send('group_data')
+        self.assertEqual('group_data', other.recv()['response'])
+        self.assertEqual('group_data', new.recv()['response'])
+        old.send('group_data')
+        self.assertEqual('group_data', old.recv()['response'])
+
+    def test_invalid_header(self):
+        client = self.client('bad')
+        client.sock = socket.create_connection(('localhost', self.coordinator.group_port))
+        client.sock.sendall('notvalid')
+        client.sock.settimeout(5)
+        self.assertEqual('', client.sock.recv(8))
+
+    def test_large_message(self):
+        server = self.client('server', role='server')
+        client = self.client('client')
+        server.send('group_data')
+        client.send('group_data')
+        server.recv()
+        client.recv()
+        client.send('lava_wait', messageID='bundle')
+        payload = {'data': 'x' * 0x20000}
+        server.send('lava_send', messageID='bundle', message=payload)
+        self.assertEqual('ack', server.recv()['response'])
+        self.assertEqual({'server': payload}, client.recv()['message'])
+
+
+class TestShardedCoordinator(TestCoordinator):
+    """
+    The same tests with the groups served by two worker processes.
+    """
+
+    config = {'workers': 2}
+
+    def test_groups(self):
+        groups = [str(uuid.uuid4()) for _ in range(6)]
+        port = self.coordinator.group_port
+        nodes = [Client(port, group, name, 'client', 2) for group in groups for name in ['a', 'b']]
+        self.clients.extend(nodes)
+        for node in nodes:
+            node.send('group_data')
+        for node in nodes:
+            self.assertEqual('group_data', node.recv()['response'])
+
+
+class TestSnapshot(TestCoordinator):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {'snapshot': os.path.join(self.tmpdir, 'groups.db')}
+        super(TestSnapshot, self).setUp()
+
+    def tearDown(self):
+        super(TestSnapshot, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def test_restart(self):
+        server = self.client('server', role='server')
+        client = self.client('client')
+        server.send('group_data')
+        client.send('group_data')
+        server.recv()
+        client.recv()
+        server.send('lava_send', messageID='ready', message={'ip': '10.0.0.1'})
+        server.recv()
+        self.stop()
+        self.start()
+        # the clients reconnect and poll again
+        client.send('lava_wait', messageID='ready')
+        self.assertEqual({'server': {'ip': '10.0.0.1'}}, client.recv()['message'])
+        server.send('clear_group')
+        client.send('clear_group')
+        server.recv()
+        client.recv()
+        self.stop()
+        self.start()
+        self.assertEqual({}, self.coordinator.all_groups)
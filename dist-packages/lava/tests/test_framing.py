@@ -0,0 +1,88 @@
+#  Copyright 2016 Linaro Limited
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+"""
+lava.framing unit tests.
+"""
+
+import socket
+import threading
+import unittest
+
+from lava.framing import (
+    MAX_MESSAGE,
+    FrameReader,
+    frame,
+    recv_message,
+    send_message,
+)
+
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_frame(self):
+        self.assertEqual('0000000E{"key": "val"}', frame('{"key": "val"}'))
+        self.assertEqual('00000000', frame(''))
+
+    def test_large_message(self):
+        # larger than the former 0xFFFE limit and than the socket buffers
+        message = 'x' * (4 * 1024 * 1024 + 3)
+        sender = threading.Thread(target=send_message, args=(self.left, message))
+        sender.start()
+        self.assertEqual(message, recv_message(self.right))
+        sender.join()
+
+    def test_short_reads(self):
+        self.left.sendall('00000005ab')
+        self.left.shutdown(socket.SHUT_WR)
+        self.assertIsNone(recv_message(self.right))
+
+    def test_invalid_header(self):
+        self.left.sendall('notvalid{}')
+        self.assertRaises(ValueError, recv_message, self.right)
+
+    def test_message_too_long(self):
+        self.assertRaises(ValueError, frame, 'x' * (MAX_MESSAGE + 1))
+        # the buffer is not allocated from the header of the peer
+        self.left.sendall('7FFFFFFF')
+        self.assertRaises(ValueError, recv_message, self.right)
+        reader = FrameReader()
+        self.left.sendall('%08X' % (MAX_MESSAGE + 1))
+        self.assertRaises(ValueError, reader.feed, self.right)
+
+    def test_reader(self):
+        reader = FrameReader()
+        self.right.setblocking(0)
+        self.assertEqual([], reader.feed(self.right))
+        self.assertFalse(reader.eof)
+        data = frame('first') + frame('') + frame('second')
+        self.left.sendall(data[:3])
+        self.assertEqual([], reader.feed(self.right))
+        self.left.sendall(data[3:25])
+        self.assertEqual(['first', ''], reader.feed(self.right))
+        self.assertEqual('0000', reader.pending())
+        self.left.sendall(data[25:])
+        self.left.shutdown(socket.SHUT_WR)
+        self.assertEqual(['second'], reader.feed(self.right))
+        self.assertTrue(reader.eof)
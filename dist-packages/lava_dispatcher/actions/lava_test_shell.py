@@ -886,27 +886,33 @@ class cmd_lava_test_shell(BaseAction):
                 timeout = runner._connection.timeout
             initial_timeout = timeout
             signal_director.set_connection(runner._connection)
-            while self._keep_running(runner, target, timeout, signal_director):
-                elapsed = time.time() - start
-                timeout = int(initial_timeout - elapsed)
+            console = utils.ConsoleReader(runner._connection)
+            try:
+                while self._keep_running(runner, target, timeout, signal_director, console):
+                    elapsed = time.time() - start
+                    timeout = int(initial_timeout - elapsed)
+            finally:
+                logging.info("lava_test_shell console: %s", console.stats())
 
         self._bundle_results(target, signal_director, testdef_objs)
 
-    def _keep_running(self, runner, target, timeout, signal_director):
+    def _keep_running(self, runner, target, timeout, signal_director, console):
         if self._current_testdef:
             test_case_result = self._current_testdef.pattern
         else:
             # no-op (the existing timeout would match first)
             test_case_result = pexpect.TIMEOUT
 
+        # the markers of the runner are only searched for in the output
+        # holding their prefix
         patterns = [
-            '<LAVA_TEST_RUNNER>: exiting',
-            pexpect.EOF,
-            pexpect.TIMEOUT,
-            '<LAVA_SIGNAL_(\S+) ([^>]+)>',
-            '<LAVA_MULTI_NODE> <LAVA_(\S+) ([^>]+)>',
-            '<LAVA_LMP> <LAVA_(\S+) ([^>]+)>',
-            test_case_result,
+            ('<LAVA_TEST_RUNNER>: exiting', '<LAVA_TEST_RUNNER>'),
+            (pexpect.EOF, None),
+            (pexpect.TIMEOUT, None),
+            ('<LAVA_SIGNAL_(\S+) ([^>]+)>', '<LAVA_SIGNAL_'),
+            ('<LAVA_MULTI_NODE> <LAVA_(\S+) ([^>]+)>', '<LAVA_MULTI_NODE>'),
+            ('<LAVA_LMP> <LAVA_(\S+) ([^>]+)>', '<LAVA_LMP>'),
+            (test_case_result, None),
         ]
 
         # these are names for the indexes in the array above
@@ -918,7 +924,7 @@ class cmd_lava_test_shell(BaseAction):
         LMP = 5
         TEST_CASE_RESULT = 6
 
-        event = runner._connection.expect(patterns, timeout=timeout)
+        event = console.expect(patterns, timeout=timeout)
 
         if event == EXIT:
             logging.info('lava_test_shell seems to have completed')
@@ -21,6 +21,7 @@
 import atexit
 import bz2
 import contextlib
+import httplib
 import logging
 import lzma
 import os
@@ -39,6 +40,56 @@ from lava_dispatcher.utils import rmtree
 from lava_dispatcher.utils import search_substr_from_array
 import hashlib
 
+# Number of times an interrupted http download is resumed
+HTTP_RESUME_RETRIES = 5
+
+
+class _ResumableResponse(object):
+    """
+    Wraps the response of an http download. When reading fails, the url is
+    opened again with a Range request from the last byte received, so that
+    the download does not restart from the beginning.
+    """
+
+    def __init__(self, opener, url, retries=HTTP_RESUME_RETRIES):
+        self.opener = opener
+        self.url = url
+        self.retries = retries
+        self.offset = 0
+        self.resp = opener.open(url, timeout=30)
+        info = self.resp.info()
+        self.ranges = info.get('accept-ranges', '') == 'bytes'
+        self.version = info.get('etag', info.get('last-modified', None))
+        self.length = int(info.get('content-length', -1))
+
+    def _reopen(self):
+        self.resp.close()
+        request = urllib2.Request(self.url, headers={'Range': 'bytes=%d-' % self.offset})
+        if self.version:
+            # only resume if the resource did not change
+            request.add_header('If-Range', self.version)
+        self.resp = self.opener.open(request, timeout=30)
+        if self.resp.getcode() != 206:
+            raise IOError("Unable to resume the download of %s" % self.url)
+
+    def read(self, size):
+        while True:
+            try:
+                buff = self.resp.read(size)
+                if not buff and 0 <= self.offset < self.length:
+                    raise IOError("Connection closed after %d of %d bytes" % (self.offset, self.length))
+                self.offset += len(buff)
+                return buff
+            except (IOError, httplib.HTTPException) as exc:
+                if not self.ranges or not self.retries:
+                    raise
+                self.retries -= 1
+                logging.warning("Download of %s interrupted at %d bytes, resuming: %s", self.url, self.offset, exc)
+                self._reopen()
+
+    def close(self):
+        self.resp.close()
+
 
 @contextlib.contextmanager
 def _scp_stream(url, proxy=None, no_proxy=None, cookies=None):
@@ -87,7 +138,7 @@ def _http_stream(url, proxy=None, no_proxy=None, cookies=None):
         opener.addheaders.append(('Cookie', cookies))
 
     try:
-        resp = opener.open(url_quoted, timeout=30)
+        resp = _ResumableResponse(opener, url_quoted)
         yield resp
     finally:
         if resp:
@@ -256,7 +256,58 @@ def _merge_results(dest, src):
     dest.setdefault('attributes', {}).update(src.get('attributes', []))
 
 
-def _get_test_results(test_run_dir, testdef, stdout, err_log):
+# Both forms of lava-test-case signals, tried in this order: alternatives
+# are tried in turn, so the combined pattern matches like the two patterns
+# used one after the other.
+TESTCASE_SIGNAL = '<LAVA_SIGNAL_TESTCASE '
+TESTCASE_PATTERN = re.compile(
+    "<LAVA_SIGNAL_TESTCASE (?:"
+    "TEST_CASE_ID=(?P<test_case_id>.*)\\s+"
+    "RESULT=(?P<result>(PASS|pass|FAIL|fail|SKIP|skip|UNKNOWN|unknown))>"
+    "|"
+    "TEST_CASE_ID=(?P<measured_test_case_id>.*)\\s+"
+    "RESULT=(?P<measured_result>(PASS|pass|FAIL|fail|SKIP|skip|UNKNOWN|unknown))\\s"
+    "UNITS=(?P<units>.*)\\s"
+    "MEASUREMENT=(?P<measurement>.*)>)")
+
+
+def _match_testcase_signal(line):
+    """
+    :param line: a stripped line of the output
+    :return: the fields of the lava-test-case signal, None if the line is
+    not a signal.
+    """
+    if not line.startswith(TESTCASE_SIGNAL):
+        return None
+    match = TESTCASE_PATTERN.match(line)
+    if not match:
+        return None
+    data = match.groupdict()
+    if data['test_case_id'] is not None:
+        return {'test_case_id': data['test_case_id'], 'result': data['result']}
+    return {'test_case_id': data['measured_test_case_id'], 'result': data['measured_result'],
+            'units': data['units'], 'measurement': data['measurement']}
+
+
+def _read_lines(filepath):
+    """
+    Iterate over the lines of a file without their newline, like
+    read_content(filepath).split('\\n') but without reading the whole file.
+    """
+    last = ''
+    with open(filepath, 'r') as lines:
+        for line in lines:
+            last = line
+            yield line[:-1] if line.endswith('\n') else line
+    if not last or last.endswith('\n'):
+        yield ''
+
+
+def _get_test_results(test_run_dir, testdef, stdout_lines, err_log):
+    """
+    :param stdout_lines: iterable over the lines of stdout.log, so that
+    large logs are parsed without being held in memory.
+    """
     results_from_log_file = []
     fixupdict = {'PASS': 'pass', 'FAIL': 'fail', 'SKIP': 'skip',
                  'UNKNOWN': 'unknown'}
@@ -296,18 +347,9 @@ def _get_test_results(test_run_dir, testdef, stdout, err_log):
     if not pattern:
         logging.debug("No pattern set")
 
-    slim_pattern = "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=(?P<test_case_id>.*)\\s+"\
-                   "RESULT=(?P<result>(PASS|pass|FAIL|fail|SKIP|skip|UNKNOWN|unknown))>"
-
-    test_pattern = "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=(?P<test_case_id>.*)\\s+"\
-                   "RESULT=(?P<result>(PASS|pass|FAIL|fail|SKIP|skip|UNKNOWN|unknown))\\s"\
-                   "UNITS=(?P<units>.*)\s"\
-                   "MEASUREMENT=(?P<measurement>.*)>"
-    test_case_pattern = re.compile(test_pattern)
-    result_pattern = re.compile(slim_pattern)
-
-    for lineno, line in enumerate(stdout.split('\n'), 1):
-        match = pattern.match(line.strip())
+    for lineno, line in enumerate(stdout_lines, 1):
+        line = line.strip()
+        match = pattern.match(line)
         if match:
             res = parse_testcase_result(match.groupdict(), fixupdict)
             # Both of 'test_case_id' and 'result' must be included
@@ -320,18 +362,11 @@ def _get_test_results(test_run_dir, testdef, stdout, err_log):
             res['log_filename'] = 'stdout.log'
             results_from_log_file.append(res)
             continue
-        # Locate a simple lava-test-case with result to retrieve log line no
-        match = result_pattern.match(line.strip())
-        if match:
-            res = parse_testcase_result(match.groupdict(), fixupdict)
-            res['log_lineno'] = lineno
-            res['log_filename'] = 'stdout.log'
-            results_from_log_file.append(res)
-            continue
-        # also catch a lava-test-case with a unit and a measurement
-        match = test_case_pattern.match(line.strip())
-        if match:
-            res = parse_testcase_result(match.groupdict(), fixupdict)
+        # Locate a lava-test-case with result, and optionally a unit and a
+        # measurement, to retrieve log line no
+        data = _match_testcase_signal(line)
+        if data:
+            res = parse_testcase_result(data, fixupdict)
             res['log_lineno'] = lineno
             res['log_filename'] = 'stdout.log'
             results_from_log_file.append(res)
@@ -376,8 +411,27 @@ def _get_test_results(test_run_dir, testdef, stdout, err_log):
     return results_from_log_file
 
 
-def _get_run_attachments(test_run_dir, testdef, stdout):
-    attachments = [create_attachment('stdout.log', stdout),
+def _stdout_attachment(test_run_dir):
+    """
+    Attachment of stdout.log, base64 encoded by blocks rather than after
+    reading the whole log.
+    """
+    content = []
+    with open(os.path.join(test_run_dir, 'stdout.log'), 'rb') as stdout:
+        # blocks of a multiple of 3 bytes encode without padding
+        block = stdout.read(3 * 65536)
+        while block:
+            content.append(base64.b64encode(block))
+            block = stdout.read(3 * 65536)
+    return {
+        'pathname': 'stdout.log',
+        'mime_type': 'text/plain',
+        'content': ''.join(content),
+    }
+
+
+def _get_run_attachments(test_run_dir, testdef):
+    attachments = [_stdout_attachment(test_run_dir),
                    create_attachment('testdef.yaml', testdef)]
     return_code = read_content(os.path.join(test_run_dir, 'return_code'), ignore_missing=True)
     if return_code:
@@ -430,7 +484,6 @@ def _get_test_run(test_run_dir, testdef_objs, err_log):
     now = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
 
     testdef = read_content(os.path.join(test_run_dir, 'testdef.yaml'))
-    stdout = read_content(os.path.join(test_run_dir, 'stdout.log'))
     uuid = read_content(os.path.join(test_run_dir, 'analyzer_assigned_uuid'))
 
     cpuinfo = read_content(os.path.join(test_run_dir, 'hwcontext/cpuinfo.txt'), ignore_missing=True)
@@ -440,7 +493,7 @@ def _get_test_run(test_run_dir, testdef_objs, err_log):
     build = read_content(os.path.join(test_run_dir, 'swcontext/build.txt'), ignore_missing=True)
     pkginfo = read_content(os.path.join(test_run_dir, 'swcontext/pkgs.txt'), ignore_missing=True)
 
-    attachments = _get_run_attachments(test_run_dir, testdef, stdout)
+    attachments = _get_run_attachments(test_run_dir, testdef)
     attributes = _attributes_from_dir(os.path.join(test_run_dir, 'attributes'))
 
     testdef = yaml.safe_load(testdef)
@@ -459,7 +512,8 @@ def _get_test_run(test_run_dir, testdef_objs, err_log):
         'analyzer_assigned_date': now,
         'analyzer_assigned_uuid': uuid,
         'time_check_performed': False,
-        'test_results': _get_test_results(test_run_dir, testdef, stdout, err_log),
+        'test_results': _get_test_results(test_run_dir, testdef,
+                                          _read_lines(os.path.join(test_run_dir, 'stdout.log')), err_log),
         'software_context': swcontext,
         'hardware_context': hwcontext,
         'attachments': attachments,
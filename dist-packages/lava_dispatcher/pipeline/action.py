@@ -252,6 +252,78 @@ class Pipeline(object):  # pylint: disable=too-many-instance-attributes
         # Diagnosis is not allowed to alter the connection, do not use the return value.
         return None
 
+    def run_action(self, action, connection, args=None, threaded=False):
+        """
+        Run one action of the pipeline with the per-action bookkeeping: log
+        metadata, start and duration messages, elapsed time and results and,
+        on failure, the diagnosis and the cleanup of the action. The error is
+        raised again for the caller.
+        Use threaded when the action runs outside of the main thread: the
+        timeout alarms can only be set in the main thread and the log
+        metadata is then only set for the calling thread.
+        :return: the connection returned by the action, or the connection
+        passed in if the action returned none.
+        """
+        # TODO: this shouldn't be needed
+        # The ci-test does not set the default logging class
+        if isinstance(action.logger, YAMLLogger):
+            action.logger.setMetadata(action.level, action.name)
+        # Add action start timestamp to the log message
+        msg = {'msg': 'start: %s %s (max %ds)' % (action.level,
+                                                  action.name,
+                                                  action.timeout.duration),
+               'ts': datetime.datetime.utcnow().isoformat()}
+        if self.parent is None:
+            action.logger.info(msg)
+        else:
+            action.logger.debug(msg)
+        try:
+            start = time.time()
+            new_connection = None
+            try:
+                # FIXME: not sure to understand why we have two cases here?
+                if not connection and not threaded:
+                    with action.timeout.action_timeout():
+                        new_connection = action.run(connection, args)
+                else:
+                    new_connection = action.run(connection, args)
+            # overly broad exceptions will cause issues with RetryActions
+            # always ensure the unit tests continue to pass with changes here.
+            except (ValueError, KeyError, TypeError, RuntimeError, AttributeError) as exc:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                traceback_details = {
+                    'filename': exc_traceback.tb_frame.f_code.co_filename,
+                    'lineno': exc_traceback.tb_lineno,
+                    'name': exc_traceback.tb_frame.f_code.co_name,
+                    'type': exc_type.__name__,
+                    'message': exc_value.message,
+                }
+                action.logger.exception(traceback_details)
+                raise RuntimeError(exc)
+            action.elapsed_time = time.time() - start
+            # Add action end timestamp to the log message
+            msg = {'msg': "%s duration: %.02f" % (action.name,
+                                                  action.elapsed_time),
+                   'ts': datetime.datetime.utcnow().isoformat()}
+            if self.parent is None:
+                action.logger.info(msg)
+            else:
+                action.logger.debug(msg)
+            if action.results and isinstance(action.logger, YAMLLogger):
+                action.results.update({'level': action.level,
+                                       'duration': action.elapsed_time,
+                                       'timeout': action.timeout.duration,
+                                       })
+                action.logger.results({action.name: action.results})
+        except (JobError, InfrastructureError) as exc:
+            action.errors = exc.message
+            # set results including retries
+            action.results = {"fail": exc}
+            self._diagnose(connection)
+            action.cleanup()
+            raise exc
+        return new_connection if new_connection else connection
+
     def run_actions(self, connection, args=None):  # pylint: disable=too-many-branches,too-many-statements,too-many-locals
 
         def cancelling_handler(*args):  # pylint: disable=unused-argument
@@ -281,74 +353,15 @@ class Pipeline(object):  # pylint: disable=too-many-instance-attributes
                     raise RuntimeError(msg)
                 raise JobError(msg)
 
-            # Begin the action
-            # TODO: this shouldn't be needed
-            # The ci-test does not set the default logging class
-            if isinstance(action.logger, YAMLLogger):
-                action.logger.setMetadata(action.level, action.name)
-            # Add action start timestamp to the log message
-            msg = {'msg': 'start: %s %s (max %ds)' % (action.level,
-                                                      action.name,
-                                                      action.timeout.duration),
-                   'ts': datetime.datetime.utcnow().isoformat()}
-            if self.parent is None:
-                action.logger.info(msg)
-            else:
-                action.logger.debug(msg)
             try:
                 if not self.parent:
                     signal.signal(signal.SIGINT, cancelling_handler)
                     signal.signal(signal.SIGTERM, cancelling_handler)
-                start = time.time()
-                new_connection = None
-                try:
-                    # FIXME: not sure to understand why we have two cases here?
-                    if not connection:
-                        with action.timeout.action_timeout():
-                            new_connection = action.run(connection, args)
-                    else:
-                        new_connection = action.run(connection, args)
-                # overly broad exceptions will cause issues with RetryActions
-                # always ensure the unit tests continue to pass with changes here.
-                except (ValueError, KeyError, TypeError, RuntimeError, AttributeError) as exc:
-                    exc_type, exc_value, exc_traceback = sys.exc_info()
-                    traceback_details = {
-                        'filename': exc_traceback.tb_frame.f_code.co_filename,
-                        'lineno': exc_traceback.tb_lineno,
-                        'name': exc_traceback.tb_frame.f_code.co_name,
-                        'type': exc_type.__name__,
-                        'message': exc_value.message,
-                    }
-                    action.logger.exception(traceback_details)
-                    raise RuntimeError(exc)
-                except KeyboardInterrupt:
-                    raise KeyboardInterrupt
-                action.elapsed_time = time.time() - start
-                # Add action end timestamp to the log message
-                msg = {'msg': "%s duration: %.02f" % (action.name,
-                                                      action.elapsed_time),
-                       'ts': datetime.datetime.utcnow().isoformat()}
-                if self.parent is None:
-                    action.logger.info(msg)
-                else:
-                    action.logger.debug(msg)
-                if action.results and isinstance(action.logger, YAMLLogger):
-                    action.results.update({'level': action.level,
-                                           'duration': action.elapsed_time,
-                                           'timeout': action.timeout.duration,
-                                           })
-                    action.logger.results({action.name: action.results})
-                if new_connection:
-                    connection = new_connection
+                connection = self.run_action(action, connection, args)
             except KeyboardInterrupt:
                 self.cleanup_actions(connection, "Cancelled")
                 sys.exit(1)
             except (JobError, InfrastructureError) as exc:
-                action.errors = exc.message
-                # set results including retries
-                action.results = {"fail": exc}
-                self._diagnose(connection)
-                action.cleanup()
                 self.cleanup_actions(connection, exc.message)
                 raise exc
         return connection
@@ -24,6 +24,10 @@
 
 import math
 import os
+import Queue
+import shutil
+import tempfile
+import threading
 import time
 import urlparse
 import hashlib
@@ -33,20 +37,214 @@ import bz2
 import contextlib
 import lzma
 import zlib
+from distutils import spawn
 from lava_dispatcher.pipeline.action import (
     Action,
+    InfrastructureError,
     JobError,
     Pipeline,
 )
 from lava_dispatcher.pipeline.logical import RetryAction
+from lava_dispatcher.pipeline.utils.cache import DownloadCache
 from lava_dispatcher.pipeline.utils.constants import (
+    DOWNLOAD_HOST_CONNECTIONS,
+    DOWNLOAD_QUEUE_SIZE,
+    DOWNLOAD_WORKERS,
     FILE_DOWNLOAD_CHUNK_SIZE,
     HTTP_DOWNLOAD_CHUNK_SIZE,
+    HTTP_DOWNLOAD_SEGMENTS,
     HTTP_DOWNLOAD_TIMEOUT,
+    HTTP_RESUME_RETRIES,
+    HTTP_SEGMENT_SIZE,
     SCP_DOWNLOAD_CHUNK_SIZE,
 )
 
 
+# Decompressors run as a separate process, in order of preference. The
+# parallel implementations are used when installed on the worker.
+DECOMPRESS_COMMANDS = {
+    'gz': [['pigz', '-d', '-c'], ['gzip', '-d', '-c']],
+    'bz2': [['pbzip2', '-d', '-c'], ['bzip2', '-d', '-c']],
+    'xz': [['xz', '-d', '-c', '-T0']],
+}
+
+
+def decompress_command(compression):
+    """
+    :return: the first command available to decompress this format, None
+    if the decompression has to be done in the dispatcher.
+    """
+    for command in DECOMPRESS_COMMANDS.get(compression, []):
+        if spawn.find_executable(command[0]):
+            return command
+    return None
+
+
+def threaded_reader(reader, maxsize=DOWNLOAD_QUEUE_SIZE):
+    """
+    Iterate over the reader in a separate thread so that the network (or
+    disk) reads overlap with the processing of the previous chunks. At most
+    maxsize chunks are buffered. Exceptions raised by the reader are raised
+    again in the calling thread.
+    """
+    chunks = Queue.Queue(maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for buff in reader:
+                if not put(buff):
+                    return
+            put(end)
+        except Exception as exc:  # pylint: disable=broad-except
+            put(exc)
+        finally:
+            reader.close()
+
+    thread = threading.Thread(target=produce, name='download-reader')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            # wait with a timeout, so that the timeout alarm is handled
+            try:
+                item = chunks.get(timeout=1)
+            except Queue.Empty:
+                continue
+            if item is end:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # a stalled reader is left behind, the thread is a daemon
+        thread.join(1)
+
+
+class ChecksumThread(threading.Thread):
+    """
+    Compute the md5 and sha256 of the downloaded content in a separate
+    thread. hashlib releases the GIL, so the checksums are computed while
+    the main thread decompresses and writes the file.
+    """
+
+    def __init__(self, maxsize=DOWNLOAD_QUEUE_SIZE):
+        super(ChecksumThread, self).__init__(name='download-checksum')
+        self.daemon = True
+        self.chunks = Queue.Queue(maxsize)
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+
+    def run(self):
+        buff = self.chunks.get()
+        while buff is not None:
+            self.md5.update(buff)
+            self.sha256.update(buff)
+            buff = self.chunks.get()
+
+    def update(self, buff):
+        self.chunks.put(buff)
+
+    def checksums(self):
+        """
+        Wait for the pending chunks.
+        :return: the hexdigests of the content
+        """
+        self.chunks.put(None)
+        # wait with a timeout, so that the timeout alarm is handled
+        while self.is_alive():
+            self.join(1)
+        return {'md5': self.md5.hexdigest(), 'sha256': self.sha256.hexdigest()}
+
+
+class DownloadBatch(object):
+    """
+    Fetches the independent artifacts of a deploy action concurrently.
+
+    Each DownloaderAction added to the batch is still part of the pipeline
+    of the deploy action. When the first of them runs, all the downloads of
+    the batch are started in a pool of threads, with at most
+    per_host connections to the same server, sharing the http connections.
+    Each DownloaderAction then waits for its own download, so the
+    downloads of the batch overlap and remain bounded by the timeout of
+    the deploy action.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, per_host=DOWNLOAD_HOST_CONNECTIONS):
+        self.workers = workers
+        self.per_host = per_host
+        self.downloads = []
+        self.session = None
+        self.pending = Queue.Queue()
+        self.hosts = {}
+        self.done = {}
+        self.connection = None
+        self.started = False
+        self.lock = threading.Lock()
+
+    def add(self, download):
+        download.batch = self
+        self.downloads.append(download)
+        self.done[download] = threading.Event()
+
+    def _host_lock(self, download):
+        host = urlparse.urlparse(download.parameters[download.key]).netloc
+        with self.lock:
+            return self.hosts.setdefault(host, threading.BoundedSemaphore(self.per_host))
+
+    def _worker(self):
+        while True:
+            try:
+                download = self.pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                with self._host_lock(download):
+                    download.fetch(self.connection, self.session)
+            except Exception as exc:  # pylint: disable=broad-except
+                download.errors = str(exc)
+            finally:
+                self.done[download].set()
+
+    def start(self, connection):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        self.connection = connection
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        for download in self.downloads:
+            self.pending.put(download)
+        for _ in range(min(self.workers, len(self.downloads))):
+            thread = threading.Thread(target=self._worker, name='download-batch')
+            thread.daemon = True
+            thread.start()
+
+    def wait(self, download, connection):
+        """
+        Start the batch if needed and wait for the download.
+        """
+        self.start(connection)
+        # wait with a timeout, so that the timeout alarm is handled
+        while not self.done[download].wait(1):
+            pass
+        return connection
+
+
 # FIXME: separate download actions for decompressed and uncompressed downloads
 # so that the logic can be held in the Strategy class, not the Action.
 # FIXME: create a download3.py which uses urllib.urlparse
@@ -63,6 +261,32 @@ class DownloaderAction(RetryAction):
         self.summary = "download-retry"
         self.key = key  # the key in the parameters of what to download
         self.path = path  # where to download
+        self.batch = None  # DownloadBatch fetching the download concurrently
+
+    def run(self, connection, args=None):
+        if self.batch:
+            return self.batch.wait(self, connection)
+        return super(DownloaderAction, self).run(connection, args)
+
+    def fetch(self, connection, session=None):
+        """
+        Download with retry, in a thread of the DownloadBatch.
+        The timeout alarms can only be used in the main thread, so the
+        download action is run without them, with the same logging, results
+        and cleanup as when run by the pipeline.
+        """
+        action = self.internal_pipeline.actions[0]
+        action.session = session
+        while self.retries < self.max_retries:
+            try:
+                return self.internal_pipeline.run_action(action, connection, threaded=True)
+            except (JobError, InfrastructureError) as exc:
+                self.retries += 1
+                self.errors = "%s failed: %d of %d attempts. '%s'" % (self.name, self.retries, self.max_retries, exc)
+                time.sleep(self.sleep)
+        if not self.valid:
+            self.errors = "%s retries failed for %s" % (self.retries, self.name)
+        return connection
 
     def populate(self, parameters):
         self.internal_pipeline = Pipeline(parent=self, job=self.job, parameters=parameters)
@@ -101,6 +325,11 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
         self.key = key
         self.path = path
         self.size = -1
+        # ETag or Last-Modified of the resource, when known the download
+        # can be cached
+        self.version = None
+        # requests.Session shared by the downloads of a DownloadBatch
+        self.session = None
 
     def reader(self):
         raise NotImplementedError
@@ -122,30 +351,52 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
     @contextlib.contextmanager
     def _decompressor_stream(self):
         dwnld_file = None
+        process = None
         compression = self.parameters.get('compression', False)
         fname, _ = self._url_to_fname_suffix(self.path, compression)
 
         decompressor = None
+        command = None
         if compression:
-            if compression == 'gz':
-                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
-            elif compression == 'bz2':
-                decompressor = bz2.BZ2Decompressor()
-            elif compression == 'xz':
-                decompressor = lzma.LZMADecompressor()  # pylint: disable=no-member
-            self.logger.debug("Using %s decompression" % compression)
+            command = decompress_command(compression)
+            if command:
+                self.logger.debug("Using %s decompression with %s" % (compression, command[0]))
+            else:
+                if compression == 'gz':
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                elif compression == 'bz2':
+                    decompressor = bz2.BZ2Decompressor()
+                elif compression == 'xz':
+                    decompressor = lzma.LZMADecompressor()  # pylint: disable=no-member
+                self.logger.debug("Using %s decompression" % compression)
         else:
             self.logger.debug("No compression specified.")
 
         def write(buff):
+            if process:
+                try:
+                    process.stdin.write(buff)
+                except IOError:
+                    raise JobError("%s failed to decompress '%s'" % (command[0], self.url.geturl()))
+                return
             if decompressor:
                 buff = decompressor.decompress(buff)
             dwnld_file.write(buff)
 
         try:
             dwnld_file = open(fname, 'wb')
+            if command:
+                # the decompression runs on other cores, overlapping the download
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=dwnld_file)
             yield (write, fname)
+            if process:
+                process.stdin.close()
+                if process.wait() != 0:
+                    raise JobError("%s failed to decompress '%s'" % (command[0], self.url.geturl()))
         finally:
+            if process and process.returncode is None:
+                process.kill()
+                process.wait()
             if dwnld_file:
                 dwnld_file.close()
 
@@ -162,7 +413,65 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
             if compression not in ['gz', 'bz2', 'xz']:
                 self.errors = "Unknown 'compression' format '%s'" % compression
 
+    def _verify(self, checksums):
+        """
+        Compare the checksums of the download with the md5sum or sha256sum
+        given in the parameters, either as a string or as a dictionary
+        indexed by the key of the download.
+        """
+        for name in ['md5', 'sha256']:
+            expected = self.parameters.get('%ssum' % name, None)
+            if isinstance(expected, dict):
+                expected = expected.get(self.key, None)
+            if expected and expected.lower() != checksums[name]:
+                raise JobError("%ssum mismatch for '%s': expected %s, downloaded %s" % (
+                    name, self.url.geturl(), expected, checksums[name]))
+
     def run(self, connection, args=None):
+        connection = super(DownloadHandler, self).run(connection, args)
+        # self.cookies = self.job.context.config.lava_cookies  # FIXME: work out how to restore
+        compression = self.parameters.get('compression', False)
+        fname, _ = self._url_to_fname_suffix(self.path, compression)
+        if self.version and DownloadCache.available():
+            cache = DownloadCache()
+            key = DownloadCache.key(self.url.geturl(), self.version, compression)
+            with cache.entry(key) as entry:
+                if entry.hit:
+                    self.logger.info("using cached copy of %s as %s" % (self.parameters[self.key], fname))
+                    self.results = {'cache': 'hit'}
+                    entry.copy_to(fname)
+                    checksums = entry.meta
+                    self._verify(checksums)
+                else:
+                    self.results = {'cache': 'miss'}
+                    checksums = self._download()
+                    self._verify(checksums)
+                    entry.store(fname, checksums)
+        else:
+            checksums = self._download()
+            self._verify(checksums)
+
+        # set the dynamic data into the context
+        self.data['download_action'][self.key] = {
+            'file': fname,
+            'md5': checksums['md5'],
+            'sha256': checksums['sha256']
+        }
+        # certain deployments need prefixes set
+        if self.parameters['to'] == 'tftp':
+            suffix = self.data['tftp-deploy'].get('suffix', '')
+            self.set_common_data('file', self.key, os.path.join(suffix, os.path.basename(fname)))
+        else:
+            self.set_common_data('file', self.key, fname)
+        self.logger.info("md5sum of downloaded content: %s" % checksums['md5'])
+        self.logger.info("sha256sum of downloaded content: %s" % checksums['sha256'])
+        return connection
+
+    def _download(self):
+        """
+        Download and decompress the file.
+        :return: the checksums of the downloaded content
+        """
         def progress_unknown_total(downloaded_size, last_value):
             """ Compute progress when the size is unknown """
             condition = downloaded_size >= last_value + 25 * 1024 * 1024
@@ -176,10 +485,8 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
             return (condition, percent,
                     "progress %3d%% (%dMB)" % (percent, int(downloaded_size / (1024 * 1024))) if condition else "")
 
-        connection = super(DownloadHandler, self).run(connection, args)
-        # self.cookies = self.job.context.config.lava_cookies  # FIXME: work out how to restore
-        md5 = hashlib.md5()
-        sha256 = hashlib.sha256()
+        checksum = ChecksumThread()
+        checksum.start()
         with self._decompressor_stream() as (writer, fname):
             self.logger.info("downloading %s as %s" % (self.parameters[self.key], fname))
 
@@ -195,38 +502,26 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
                 last_value = -5
                 progress = progress_known_total
 
-            # Download the file and log the progresses
-            for buff in self.reader():
-                downloaded_size += len(buff)
-                (printing, new_value, msg) = progress(downloaded_size, last_value)
-                if printing:
-                    last_value = new_value
-                    self.logger.debug(msg)
-                md5.update(buff)
-                sha256.update(buff)
-                writer(buff)
+            # Download the file and log the progresses. Reading, computing
+            # the checksums and decompressing are done in parallel.
+            try:
+                for buff in threaded_reader(self.reader()):
+                    downloaded_size += len(buff)
+                    (printing, new_value, msg) = progress(downloaded_size, last_value)
+                    if printing:
+                        last_value = new_value
+                        self.logger.debug(msg)
+                    checksum.update(buff)
+                    writer(buff)
+            finally:
+                checksums = checksum.checksums()
 
             # Log the download speed
             ending = time.time()
             self.logger.info("%dMB downloaded in %0.2fs (%0.2fMB/s)" %
                              (downloaded_size / (1024 * 1024), round(ending - beginning, 2),
                               round(downloaded_size / (1024 * 1024 * (ending - beginning)), 2)))
-
-        # set the dynamic data into the context
-        self.data['download_action'][self.key] = {
-            'file': fname,
-            'md5': md5.hexdigest(),
-            'sha256': sha256.hexdigest()
-        }
-        # certain deployments need prefixes set
-        if self.parameters['to'] == 'tftp':
-            suffix = self.data['tftp-deploy'].get('suffix', '')
-            self.set_common_data('file', self.key, os.path.join(suffix, os.path.basename(fname)))
-        else:
-            self.set_common_data('file', self.key, fname)
-        self.logger.info("md5sum of downloaded content: %s" % (md5.hexdigest()))
-        self.logger.info("sha256sum of downloaded content: %s" % (sha256.hexdigest()))
-        return connection
+        return checksums
 
 
 class FileDownloadAction(DownloadHandler):
@@ -273,6 +568,7 @@ class HttpDownloadAction(DownloadHandler):
         self.name = "http_download"
         self.description = "use http to download the file"
         self.summary = "http download"
+        self.ranges = False  # the server accepts Range requests
 
     def validate(self):
         super(HttpDownloadAction, self).validate()
@@ -282,26 +578,143 @@ class HttpDownloadAction(DownloadHandler):
                 self.errors = "Resources not available at '%s'" % (self.url.geturl())
             else:
                 self.size = int(res.headers.get('content-length', -1))
+                self.version = res.headers.get('etag', res.headers.get('last-modified', None))
+                self.ranges = res.headers.get('accept-ranges', '') == 'bytes'
         except requests.Timeout:
             self.errors = "'%s' timed out" % (self.url.geturl())
         except requests.RequestException as exc:
             # TODO: find a better way to report the error
             self.errors = str(exc)
 
-    def reader(self):
-        res = None
+    def _range(self, start=0, end=None):
+        """
+        Download the content from start to end (excluded, None for the end
+        of the file). When the connection fails, the download is resumed
+        from the last byte received with a Range request, at most
+        HTTP_RESUME_RETRIES times.
+        """
+        resumes = 0
+        while True:
+            headers = {}
+            if start or end is not None:
+                headers['Range'] = 'bytes=%d-%s' % (start, '' if end is None else end - 1)
+                if self.version:
+                    # only resume if the resource did not change
+                    headers['If-Range'] = self.version
+            res = None
+            try:
+                res = (self.session or requests).get(self.url.geturl(), allow_redirects=True, stream=True,
+                                                     timeout=HTTP_DOWNLOAD_TIMEOUT, headers=headers)
+                expected = requests.codes.PARTIAL_CONTENT if headers else requests.codes.OK  # pylint: disable=no-member
+                if res.status_code != expected:
+                    raise JobError("Unable to download '%s'" % (self.url.geturl()))
+                for buff in res.iter_content(HTTP_DOWNLOAD_CHUNK_SIZE):
+                    start += len(buff)
+                    yield buff
+                total = self.size if end is None else end
+                if total == -1 or start >= total:
+                    return
+                raise requests.ConnectionError("Connection closed after %d of %d bytes" % (start, total))
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as exc:
+                if not self.ranges or resumes >= HTTP_RESUME_RETRIES:
+                    raise JobError(exc)
+                resumes += 1
+                self.logger.warning("Download of '%s' interrupted at %d bytes, resuming (%d of %d): %s" % (
+                    self.url.geturl(), start, resumes, HTTP_RESUME_RETRIES, exc))
+            except requests.RequestException as exc:
+                # TODO: improve error reporting
+                raise JobError(exc)
+            finally:
+                if res is not None:
+                    res.close()
+
+    def _segments(self, workers=HTTP_DOWNLOAD_SEGMENTS, segment_size=HTTP_SEGMENT_SIZE):
+        """
+        Download the segments of a large file in parallel, each one into
+        a temporary file, and yield the content in order. At most twice as
+        many segments as workers are kept on disk.
+        """
+        tmpdir = tempfile.mkdtemp(dir=self.path, prefix='.segments-')
+        segments = Queue.Queue()
+        done = []
+        for index, start in enumerate(range(0, self.size, segment_size)):
+            segments.put((index, start, min(start + segment_size, self.size)))
+            done.append({'event': threading.Event(), 'error': None})
+        ahead = threading.Semaphore(2 * workers)
+        stop = threading.Event()
+        # the reader and the segment threads still using tmpdir
+        users = [workers + 1]
+        users_lock = threading.Lock()
+
+        def release_tmpdir():
+            # the last one to leave removes tmpdir, so the reader never waits
+            # for a segment thread blocked in a socket read
+            with users_lock:
+                users[0] -= 1
+                last = users[0] == 0
+            if last:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+        def fetch_segments():
+            while True:
+                # take a slot before a segment, the slots are used in order
+                ahead.acquire()
+                if stop.is_set():
+                    return
+                try:
+                    index, start, end = segments.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    with open(os.path.join(tmpdir, str(index)), 'wb') as segment:
+                        for buff in self._range(start, end):
+                            if stop.is_set():
+                                break
+                            segment.write(buff)
+                except Exception as exc:  # pylint: disable=broad-except
+                    done[index]['error'] = exc
+                finally:
+                    done[index]['event'].set()
+
+        def fetch():
+            try:
+                fetch_segments()
+            finally:
+                release_tmpdir()
+
+        threads = [threading.Thread(target=fetch, name='download-segment') for _ in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
         try:
-            res = requests.get(self.url.geturl(), allow_redirects=True, stream=True, timeout=HTTP_DOWNLOAD_TIMEOUT)
-            if res.status_code != requests.codes.OK:  # pylint: disable=no-member
-                raise JobError("Unable to download '%s'" % (self.url.geturl()))
-            for buff in res.iter_content(HTTP_DOWNLOAD_CHUNK_SIZE):
-                yield buff
-        except requests.RequestException as exc:
-            # TODO: improve error reporting
-            raise JobError(exc)
+            for index, segment in enumerate(done):
+                # wait with a timeout, so that the timeout alarm is handled
+                while not segment['event'].wait(1):
+                    pass
+                if segment['error']:
+                    raise JobError(segment['error'])
+                path = os.path.join(tmpdir, str(index))
+                with open(path, 'rb') as data:
+                    buff = data.read(HTTP_DOWNLOAD_CHUNK_SIZE)
+                    while buff:
+                        yield buff
+                        buff = data.read(HTTP_DOWNLOAD_CHUNK_SIZE)
+                os.unlink(path)
+                ahead.release()
         finally:
-            if res is not None:
-                res.close()
+            stop.set()
+            for _ in threads:
+                ahead.release()
+            # the segment threads are daemons, do not join them: the timeout
+            # alarm may have fired while they are blocked in a read
+            release_tmpdir()
+
+    def reader(self):
+        if self.ranges and HTTP_DOWNLOAD_SEGMENTS > 1 and self.size >= 2 * HTTP_SEGMENT_SIZE:
+            self.logger.debug("Downloading %s in %dMB segments" % (self.url.geturl(), HTTP_SEGMENT_SIZE / (1024 * 1024)))
+            return self._segments()
+        return self._range()
 
 
 class ScpDownloadAction(DownloadHandler):
@@ -28,7 +28,10 @@ from lava_dispatcher.pipeline.actions.deploy import DeployAction
 from lava_dispatcher.pipeline.actions.deploy.apply_overlay import ExtractRootfs, ExtractModules
 from lava_dispatcher.pipeline.actions.deploy.environment import DeployDeviceEnvironment
 from lava_dispatcher.pipeline.actions.deploy.overlay import OverlayAction
-from lava_dispatcher.pipeline.actions.deploy.download import DownloaderAction
+from lava_dispatcher.pipeline.actions.deploy.download import (
+    DownloadBatch,
+    DownloaderAction,
+)
 from lava_dispatcher.pipeline.utils.constants import DISPATCHER_DOWNLOAD_DIR
 
 # Deploy SSH can mean a few options:
@@ -95,11 +98,13 @@ class ScpOverlay(DeployAction):
     def populate(self, parameters):
         self.internal_pipeline = Pipeline(parent=self, job=self.job, parameters=parameters)
         self.internal_pipeline.add_action(OverlayAction())
+        batch = DownloadBatch()
         for item in self.items:
             if item in parameters:
                 download = DownloaderAction(item, path=self.scp_dir)
                 download.max_retries = 3
                 self.internal_pipeline.add_action(download, parameters)
+                batch.add(download)
                 self.set_common_data('scp', item, True)
         # we might not have anything to download, just the overlay to push
         self.internal_pipeline.add_action(PrepareOverlayScp())
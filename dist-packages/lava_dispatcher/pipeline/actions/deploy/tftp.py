@@ -25,7 +25,10 @@ import os
 from lava_dispatcher.pipeline.action import Pipeline, InfrastructureError
 from lava_dispatcher.pipeline.logical import Deployment
 from lava_dispatcher.pipeline.actions.deploy import DeployAction
-from lava_dispatcher.pipeline.actions.deploy.download import DownloaderAction
+from lava_dispatcher.pipeline.actions.deploy.download import (
+    DownloadBatch,
+    DownloaderAction,
+)
 from lava_dispatcher.pipeline.actions.deploy.apply_overlay import PrepareOverlayTftp
 from lava_dispatcher.pipeline.actions.deploy.environment import DeployDeviceEnvironment
 from lava_dispatcher.pipeline.utils.shell import which
@@ -115,27 +118,34 @@ class TftpAction(DeployAction):  # pylint:disable=too-many-instance-attributes
 
     def populate(self, parameters):
         self.internal_pipeline = Pipeline(parent=self, job=self.job, parameters=parameters)
+        # the artifacts are independent, download them concurrently
+        batch = DownloadBatch()
         if 'ramdisk' in parameters:
             download = DownloaderAction('ramdisk', path=self.tftp_dir)
             download.max_retries = 3  # overridden by failure_retry in the parameters, if set.
             self.internal_pipeline.add_action(download)
+            batch.add(download)
             self.set_common_data('tftp', 'ramdisk', True)
         if 'kernel' in parameters:
             download = DownloaderAction('kernel', path=self.tftp_dir)
             download.max_retries = 3
             self.internal_pipeline.add_action(download)
+            batch.add(download)
         if 'dtb' in parameters:
             download = DownloaderAction('dtb', path=self.tftp_dir)
             download.max_retries = 3
             self.internal_pipeline.add_action(download)
+            batch.add(download)
         if 'nfsrootfs' in parameters:
             download = DownloaderAction('nfsrootfs', path=self.download_dir)
             download.max_retries = 3
             self.internal_pipeline.add_action(download)
+            batch.add(download)
         if 'modules' in parameters:
             download = DownloaderAction('modules', path=self.tftp_dir)
             download.max_retries = 3
             self.internal_pipeline.add_action(download)
+            batch.add(download)
         # TftpAction is a deployment, so once the files are in place, just do the overlay
         self.internal_pipeline.add_action(PrepareOverlayTftp())
         self.internal_pipeline.add_action(DeployDeviceEnvironment())
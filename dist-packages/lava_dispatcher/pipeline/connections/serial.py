@@ -26,6 +26,7 @@ from lava_dispatcher.pipeline.action import (
     TestError,
 )
 from lava_dispatcher.pipeline.shell import ShellCommand, ShellSession
+from lava_dispatcher.pipeline.utils.pacing import WritePacer
 
 # pylint: disable=too-many-public-methods
 
@@ -67,7 +68,7 @@ class ConnectDevice(Action):
         self.logger.info("%s Connecting to device using '%s'", self.name, command)
         signal.alarm(0)  # clear the timeouts used without connections.
         # ShellCommand executes the connection command
-        shell = ShellCommand("%s\n" % command, self.timeout)
+        shell = ShellCommand("%s\n" % command, self.timeout, pacer=WritePacer.from_device(self.job.device))
         if shell.exitstatus:
             raise JobError("%s command exited %d: %s" % (command, shell.exitstatus, shell.readlines()))
         # ShellSession monitors the pexpect
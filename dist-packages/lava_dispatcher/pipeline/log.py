@@ -21,10 +21,20 @@
 
 import datetime
 import logging
+import threading
 import yaml
 import zmq
 
 
+class ActionMetadata(threading.local):  # pylint: disable=too-few-public-methods
+    """
+    The action currently logging, per thread: the downloads of a
+    DownloadBatch run their actions in other threads than the main one.
+    """
+    level = '0'
+    name = 'dispatcher'
+
+
 class ZMQPushHandler(logging.Handler):
     def __init__(self, socket_addr, job_id):
         super(ZMQPushHandler, self).__init__()
@@ -36,17 +46,16 @@ class ZMQPushHandler(logging.Handler):
         self.socket.connect(socket_addr)
 
         self.job_id = str(job_id)
-        self.action_level = '0'
-        self.action_name = 'dispatcher'
+        self.metadata = ActionMetadata()
 
         self.formatter = logging.Formatter("%(message)s")
 
     def setMetadata(self, level, name):
-        self.action_level = level
-        self.action_name = name
+        self.metadata.level = level
+        self.metadata.name = name
 
     def emit(self, record):
-        msg = [self.job_id, self.action_level, self.action_name,
+        msg = [self.job_id, self.metadata.level, self.metadata.name,
                self.formatter.format(record)]
         self.socket.send_multipart(msg)
 
@@ -101,6 +110,7 @@ class YAMLLogger(logging.Logger):
         self.log_message(logging.INFO, 'target', message, *args, **kwargs)
 
     def results(self, results, *args, **kwargs):
+        # the master only parses the messages starting with '- results:'
         self.log_message(logging.INFO, 'results', results, *args, **kwargs)
 
 
@@ -24,7 +24,6 @@ import os
 import pexpect
 import signal
 import sys
-import time
 from lava_dispatcher.pipeline.action import (
     Action,
     JobError,
@@ -34,6 +33,7 @@ from lava_dispatcher.pipeline.action import (
 )
 from lava_dispatcher.pipeline.connection import Connection, CommandRunner
 from lava_dispatcher.pipeline.utils.constants import SHELL_SEND_DELAY
+from lava_dispatcher.pipeline.utils.pacing import WritePacer
 from lava_dispatcher.pipeline.utils.shell import which
 
 
@@ -75,7 +75,7 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
     A ShellCommand is a raw_connection for a ShellConnection instance.
     """
 
-    def __init__(self, command, lava_timeout, cwd=None):
+    def __init__(self, command, lava_timeout, cwd=None, pacer=None):
         if not lava_timeout or type(lava_timeout) is not Timeout:
             raise RuntimeError("ShellCommand needs a timeout set by the calling Action")
         pexpect.spawn.__init__(
@@ -88,6 +88,7 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
         # serial can be slow, races do funny things, so allow for a delay
         self.delaybeforesend = SHELL_SEND_DELAY
         self.lava_timeout = lava_timeout
+        self.pacer = pacer or WritePacer()
 
     def sendline(self, s='', delay=0, send_char=True):  # pylint: disable=arguments-differ
         """
@@ -108,16 +109,17 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
     def send(self, string, delay=0, send_char=True):  # pylint: disable=arguments-differ
         """
         Extends pexpect.send to support extra arguments, delay and send by character flags.
+        With send_char, the string is written in chunks paced by the WritePacer, or one
+        character at a time if a delay is set.
         """
-        sent = 0
-        delay = float(delay) / 1000
         if send_char:
-            for char in string:
-                sent += super(ShellCommand, self).send(char)
-                time.sleep(delay)
-        else:
-            sent = super(ShellCommand, self).send(string)
-        return sent
+            # the pacer waits between the chunks
+            delaybeforesend, self.delaybeforesend = self.delaybeforesend, 0
+            try:
+                return self.pacer.write(self, super(ShellCommand, self).send, string, delay)
+            finally:
+                self.delaybeforesend = delaybeforesend
+        return super(ShellCommand, self).send(string)
 
     def expect(self, *args, **kw):
         """
@@ -0,0 +1,70 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lava_dispatcher.pipeline.utils.cache import DownloadCache
+
+
+class TestDownloadCache(unittest.TestCase):  # pylint: disable=too-many-public-methods
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = DownloadCache(os.path.join(self.tmpdir, 'cache'), max_size=10)
+        os.mkdir(self.cache.path)
+        self.source = os.path.join(self.tmpdir, 'image')
+        with open(self.source, 'w') as image:
+            image.write('123456')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_key(self):
+        url = 'http://images.validation.linaro.org/kvm.img.gz'
+        self.assertEqual(DownloadCache.key(url, '"123"', 'gz'), DownloadCache.key(url, '"123"', 'gz'))
+        self.assertNotEqual(DownloadCache.key(url, '"123"', 'gz'), DownloadCache.key(url, '"124"', 'gz'))
+        self.assertNotEqual(DownloadCache.key(url, '"123"', 'gz'), DownloadCache.key(url, '"123"', None))
+
+    def test_hit_and_miss(self):
+        self.assertTrue(DownloadCache.available(self.cache.path))
+        with self.cache.entry('first') as entry:
+            self.assertFalse(entry.hit)
+            entry.store(self.source, {'md5': 'abc', 'sha256': 'def'})
+        dest = os.path.join(self.tmpdir, 'copy')
+        with self.cache.entry('first') as entry:
+            self.assertTrue(entry.hit)
+            self.assertEqual('abc', entry.meta['md5'])
+            self.assertEqual(6, entry.meta['size'])
+            entry.copy_to(dest)
+        with open(dest) as copy:
+            self.assertEqual('123456', copy.read())
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0}, self.cache.stats())
+
+    def test_eviction(self):
+        for key in ['first', 'second']:
+            with self.cache.entry(key) as entry:
+                entry.store(self.source, {'md5': key, 'sha256': key})
+        # only one entry fits in the cache, the oldest one is evicted
+        with self.cache.entry('first') as entry:
+            self.assertFalse(entry.hit)
+        with self.cache.entry('second') as entry:
+            self.assertTrue(entry.hit)
+        self.assertEqual(1, self.cache.stats()['evictions'])
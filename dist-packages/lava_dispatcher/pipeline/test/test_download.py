@@ -0,0 +1,265 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import urlparse
+import requests
+
+from lava_dispatcher.pipeline.action import Action, InfrastructureError, JobError, Pipeline
+from lava_dispatcher.pipeline.log import ActionMetadata, YAMLLogger
+from lava_dispatcher.pipeline.actions.deploy.download import (
+    ChecksumThread,
+    DownloadBatch,
+    DownloaderAction,
+    HttpDownloadAction,
+    decompress_command,
+    threaded_reader,
+)
+
+
+class TestDownloadStages(unittest.TestCase):  # pylint: disable=too-many-public-methods
+
+    def test_threaded_reader(self):
+        chunks = [str(index) * 10 for index in range(100)]
+        self.assertEqual(chunks, list(threaded_reader((chunk for chunk in chunks), maxsize=2)))
+
+    def test_threaded_reader_error(self):
+        def reader():
+            yield 'data'
+            raise InfrastructureError('connection lost')
+        chunks = threaded_reader(reader())
+        self.assertEqual('data', next(chunks))
+        self.assertRaises(InfrastructureError, next, chunks)
+
+    def test_threaded_reader_stalled(self):
+        def reader():
+            yield 'data'
+            time.sleep(10)
+            yield 'late'
+        chunks = threaded_reader(reader())
+        self.assertEqual('data', next(chunks))
+        start = time.time()
+        # the consumer does not wait for the stalled read
+        chunks.close()
+        self.assertLess(time.time() - start, 5)
+
+    def test_segments_stalled(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        url = 'http://images.example.com/image.img'
+        action = HttpDownloadAction('image', path, urlparse.urlparse(url))
+        action.size = 12
+
+        def fake_range(start, end):
+            if start == 8:
+                time.sleep(3)
+            yield str(start / 4) * (end - start)
+        action._range = fake_range  # pylint: disable=protected-access
+        chunks = action._segments(workers=3, segment_size=4)  # pylint: disable=protected-access
+        self.assertEqual('0000', next(chunks))
+        start = time.time()
+        # the reader does not wait for the stalled segment
+        chunks.close()
+        self.assertLess(time.time() - start, 2)
+        self.assertNotEqual([], os.listdir(path))
+        # the segments are removed by the last thread
+        time.sleep(4)
+        self.assertEqual([], os.listdir(path))
+
+    def test_checksums(self):
+        checksum = ChecksumThread(maxsize=1)
+        checksum.start()
+        for buff in ['hello', ' ', 'world']:
+            checksum.update(buff)
+        self.assertEqual({'md5': '5eb63bbbe01eeed093cb22bb8f5acdc3',
+                          'sha256': 'b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9'},
+                         checksum.checksums())
+
+    def test_resume(self):
+
+        class FakeResponse(object):  # pylint: disable=too-few-public-methods
+            def __init__(self, status_code, chunks):
+                self.status_code = status_code
+                self.chunks = chunks
+
+            def iter_content(self, size):  # pylint: disable=unused-argument
+                for chunk in self.chunks:
+                    if chunk is None:
+                        raise requests.ConnectionError('connection reset')
+                    yield chunk
+
+            def close(self):
+                pass
+
+        class FakeSession(object):  # pylint: disable=too-few-public-methods
+            def __init__(self, responses):
+                self.responses = responses
+                self.ranges = []
+
+            def get(self, url, **kwargs):  # pylint: disable=unused-argument
+                self.ranges.append(kwargs['headers'].get('Range', None))
+                return self.responses.pop(0)
+
+        url = 'http://images.example.com/image.img'
+        action = HttpDownloadAction('image', '/tmp', urlparse.urlparse(url))
+        action.size = 10
+        action.ranges = True
+        action.version = '"1234"'
+        action.session = FakeSession([FakeResponse(200, ['0123', None]),
+                                      FakeResponse(206, ['45', None]),
+                                      FakeResponse(206, ['6789'])])
+        self.assertEqual('0123456789', ''.join(action.reader()))
+        self.assertEqual([None, 'bytes=4-', 'bytes=6-'], action.session.ranges)
+
+        # the server does not accept Range requests
+        action.ranges = False
+        action.session = FakeSession([FakeResponse(200, ['0123', None])])
+        self.assertRaises(JobError, ''.join, action.reader())
+
+        # the image changed on the server, If-Range returns the whole file
+        action.ranges = True
+        action.session = FakeSession([FakeResponse(200, ['0123', None]),
+                                      FakeResponse(200, ['abcdefghij'])])
+        self.assertRaises(JobError, ''.join, action.reader())
+
+    def test_verify(self):
+        url = 'http://images.example.com/image.img'
+        action = HttpDownloadAction('image', '/tmp', urlparse.urlparse(url))
+        checksums = {'md5': '5eb63bbbe01eeed093cb22bb8f5acdc3',
+                     'sha256': 'b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9'}
+        action.parameters = {'image': url}
+        action._verify(checksums)  # pylint: disable=protected-access
+        action.parameters = {'md5sum': {'image': '5EB63BBBE01EEED093CB22BB8F5ACDC3', 'kernel': '0'}}
+        action._verify(checksums)  # pylint: disable=protected-access
+        action.parameters = {'sha256sum': '0' * 64}
+        self.assertRaises(JobError, action._verify, checksums)  # pylint: disable=protected-access
+
+    def test_decompress_command(self):
+        self.assertIsNone(decompress_command('zip'))
+        command = decompress_command('gz')
+        if command:
+            self.assertIn(command[0], ['pigz', 'gzip'])
+
+
+class TestDownloadBatch(unittest.TestCase):  # pylint: disable=too-many-public-methods
+
+    def test_batch(self):
+
+        class FakeDownload(object):  # pylint: disable=too-few-public-methods
+            running = []
+            concurrent = 0
+
+            def __init__(self, url):
+                self.key = 'image'
+                self.parameters = {'image': url}
+                self.batch = None
+                self.fetched = False
+                self.errors = None
+
+            def fetch(self, connection, session):  # pylint: disable=unused-argument
+                self.running.append(self)
+                FakeDownload.concurrent = max(FakeDownload.concurrent, len(self.running))
+                time.sleep(0.1)
+                self.running.remove(self)
+                self.fetched = True
+
+        batch = DownloadBatch(workers=4, per_host=2)
+        downloads = [FakeDownload('http://images.example.com/%d' % index) for index in range(4)]
+        for download in downloads:
+            batch.add(download)
+        self.assertIs(batch, downloads[0].batch)
+        self.assertEqual('connection', batch.wait(downloads[0], 'connection'))
+        for download in downloads:
+            batch.wait(download, 'connection')
+            self.assertTrue(download.fetched)
+        # all on the same host
+        self.assertEqual(2, FakeDownload.concurrent)
+
+    def test_fetch(self):
+
+        class FakeDownload(Action):  # pylint: disable=too-few-public-methods
+            def __init__(self):
+                super(FakeDownload, self).__init__()
+                self.name = 'fake_download'
+                self.attempts = 0
+                self.cleaned = 0
+                self.metadata = None
+
+            def run(self, connection, args=None):
+                self.attempts += 1
+                self.metadata = (self.logger.metadata.level, self.logger.metadata.name)
+                if self.attempts == 1:
+                    raise JobError('connection reset')
+                self.results = {'cache': 'miss'}
+                return connection
+
+            def cleanup(self):
+                self.cleaned += 1
+
+        class FakeLogger(YAMLLogger):
+            """
+            Records the messages with the metadata of the logging thread.
+            """
+            def __init__(self):
+                super(FakeLogger, self).__init__('fake')
+                self.metadata = ActionMetadata()
+                self.messages = []
+
+            def setMetadata(self, level, name):
+                self.metadata.level = level
+                self.metadata.name = name
+
+            def debug(self, message, *args, **kwargs):
+                self.messages.append((self.metadata.name, message))
+
+            def results(self, results, *args, **kwargs):
+                self.messages.append((self.metadata.name, results))
+
+        class FakeJob(object):  # pylint: disable=too-few-public-methods
+            triggers = []
+
+        download = DownloaderAction('image', '/tmp')
+        download.level = '1'
+        download.max_retries = 2
+        download.sleep = 0
+        download.internal_pipeline = Pipeline(parent=download)
+        action = FakeDownload()
+        download.internal_pipeline.add_action(action)
+        # diagnose the failed attempts
+        download.internal_pipeline.job = FakeJob()
+        download.parameters = {'image': 'http://images.example.com/image.img'}
+        logger = FakeLogger()
+        action.logger = logger
+        logger.setMetadata(download.level, download.name)
+
+        batch = DownloadBatch()
+        batch.add(download)
+        self.assertEqual('connection', batch.wait(download, 'connection'))
+        self.assertEqual(2, action.attempts)
+        # the failed attempt is cleaned up, as in the pipeline
+        self.assertEqual(1, action.cleaned)
+        self.assertEqual(('1.1', 'fake_download'), action.metadata)
+        self.assertIsNotNone(action.elapsed_time)
+        self.assertIn(('fake_download', {'fake_download': action.results}), logger.messages)
+        self.assertEqual('miss', action.results['cache'])
+        # the log metadata of the main thread is left alone
+        self.assertEqual(('1', 'download_retry'), (logger.metadata.level, logger.metadata.name))
@@ -0,0 +1,118 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import os
+import time
+import unittest
+
+from lava_dispatcher.pipeline.device import NewDevice
+from lava_dispatcher.pipeline.utils.pacing import WritePacer
+
+
+class TestWritePacer(unittest.TestCase):  # pylint: disable=too-many-public-methods
+
+    class FakeConsole(object):  # pylint: disable=too-few-public-methods
+        """
+        Echoes the characters written, like a shell on a serial console.
+        """
+        maxread = 2000
+
+        def __init__(self, echo=True):
+            self.buffer = ''
+            self.echo = echo
+            self.written = []
+            self.pending = ''
+
+        def send(self, chunk):
+            self.written.append(chunk)
+            if self.echo:
+                self.pending += chunk
+            return len(chunk)
+
+        def read_nonblocking(self, size, timeout):  # pylint: disable=unused-argument
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+
+    def test_chunks(self):
+        pacer = WritePacer(chunk_size=4, chunk_delay=0)
+        self.assertEqual([('0123', 0), ('4567', 0), ('89', 0)], pacer.chunks('0123456789'))
+        # the delay is added to the delay of each character
+        pacer = WritePacer(char_delay=0.5)
+        self.assertEqual([('0', 1.0), ('1', 1.0)], pacer.chunks('01', delay=500))
+
+    def test_from_device(self):
+        pacer = WritePacer.from_device({'pacing': {'chunk_size': 8, 'chunk_delay': 20, 'echo': False}})
+        self.assertEqual(8, pacer.chunk_size)
+        self.assertEqual(0.02, pacer.chunk_delay)
+        self.assertFalse(pacer.echo)
+        pacer = WritePacer.from_device({'pacing': {'chunk_size': 8}})
+        self.assertEqual(0.05, pacer.chunk_delay)
+        self.assertTrue(pacer.echo)
+        # without a profile, the chunks wait for their echo
+        pacer = WritePacer.from_device({})
+        self.assertEqual(16, pacer.chunk_size)
+        self.assertTrue(pacer.echo)
+
+    def test_device_profiles(self):
+        for name in ['bbb-01', 'cubie1']:
+            device = NewDevice(os.path.join(os.path.dirname(__file__), '../devices/%s.yaml' % name))
+            pacer = WritePacer.from_device(device)
+            self.assertEqual(32, pacer.chunk_size)
+            self.assertTrue(pacer.echo)
+
+    def test_echo(self):
+        console = self.FakeConsole()
+        pacer = WritePacer(chunk_size=4, chunk_delay=10, echo=True)
+        start = time.time()
+        self.assertEqual(10, pacer.write(console, console.send, 'echo hello'))
+        # the echo replaces the delay after each chunk
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(['echo', ' hel', 'lo'], console.written)
+        self.assertEqual(3, pacer.echoed)
+        # the echo is left for the following expect calls
+        self.assertEqual('echo hello', console.buffer)
+
+    def test_no_echo(self):
+        console = self.FakeConsole(echo=False)
+        pacer = WritePacer(chunk_size=4, chunk_delay=0.01, echo=True,
+                           echo_timeout=0.01, char_delay=0.01)
+        self.assertEqual(10, pacer.write(console, console.send, 'my secret!'))
+        self.assertEqual(0, pacer.echoed)
+        # the rest of the string is sent one character at a time
+        self.assertEqual(['my s', 'e', 'c', 'r', 'e', 't', '!'], console.written)
+        self.assertEqual(1, pacer.misses)
+        self.assertTrue(pacer.echo)
+
+    def test_echo_misses(self):
+        console = self.FakeConsole()
+        pacer = WritePacer(chunk_size=4, chunk_delay=0.01, echo=True,
+                           echo_timeout=0.01, char_delay=0.01)
+        console.echo = False
+        pacer.write(console, console.send, 'password')
+        # an echoed string resets the misses
+        console.echo = True
+        pacer.write(console, console.send, 'ls -l')
+        self.assertEqual(0, pacer.misses)
+        console.echo = False
+        for _ in range(3):
+            pacer.write(console, console.send, 'password')
+        # the console does not echo, the characters are sent one at a time
+        self.assertFalse(pacer.echo)
+        console.written = []
+        pacer.write(console, console.send, 'ls')
+        self.assertEqual(['l', 's'], console.written)
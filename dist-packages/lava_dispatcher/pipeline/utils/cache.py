@@ -0,0 +1,233 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+"""
+Worker local cache of the downloaded artifacts.
+
+Entries are keyed on the url, the version of the resource announced by
+the server (ETag or Last-Modified) and the decompression applied, so a
+new build published at the same url is a new entry. Each entry holds the
+file as handed to the job and the checksums of the download.
+
+Every job of the worker shares the cache: an entry is locked while it is
+filled, so when several jobs ask for the same artifact only one of them
+downloads it and the others wait and copy the result. Copies use
+reflinks where the filesystem supports them. The files are not
+hardlinked, as some deployments modify the image in place.
+
+The cache is bounded: once an entry is stored, the least recently used
+entries are removed until the cache fits in its size.
+"""
+
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from lava_dispatcher.pipeline.utils.constants import (
+    DOWNLOAD_CACHE_DIR,
+    DOWNLOAD_CACHE_SIZE,
+)
+
+
+def _mkdir(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+
+def copy_file(src, dest):
+    """
+    Copy src to dest, sharing the blocks when the filesystem can.
+    """
+    try:
+        subprocess.check_call(['cp', '--reflink=auto', src, dest])
+    except (OSError, subprocess.CalledProcessError):
+        shutil.copyfile(src, dest)
+
+
+class CacheEntry(object):
+    """
+    An entry of the cache, locked by DownloadCache.entry()
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.path = os.path.join(cache.path, 'entries', key)
+        self.data = os.path.join(self.path, 'data')
+        self.meta_file = os.path.join(self.path, 'meta.json')
+        self.meta = None
+
+    def load(self):
+        try:
+            with open(self.meta_file, 'r') as meta:
+                self.meta = json.load(meta)
+        except (IOError, ValueError):
+            self.meta = None
+        if self.meta is not None and not os.path.exists(self.data):
+            self.meta = None
+        return self.meta is not None
+
+    @property
+    def hit(self):
+        return self.meta is not None
+
+    def copy_to(self, dest):
+        """
+        Hand out the cached file to the job and mark the entry as used.
+        """
+        copy_file(self.data, dest)
+        os.utime(self.meta_file, None)
+
+    def store(self, src, meta):
+        """
+        Copy the downloaded file into the cache.
+        :param meta: the checksums of the download, returned on each hit.
+        """
+        _mkdir(self.path)
+        tmp = tempfile.NamedTemporaryFile(dir=self.path, delete=False)
+        tmp.close()
+        try:
+            copy_file(src, tmp.name)
+            os.rename(tmp.name, self.data)
+        finally:
+            if os.path.exists(tmp.name):
+                os.unlink(tmp.name)
+        meta = dict(meta, size=os.path.getsize(self.data))
+        with open(self.meta_file, 'w') as output:
+            json.dump(meta, output)
+        self.meta = meta
+
+
+class DownloadCache(object):
+    """
+    Size bounded (LRU) cache of downloads, shared by all the jobs of a
+    worker through file locks.
+    """
+
+    def __init__(self, path=DOWNLOAD_CACHE_DIR, max_size=DOWNLOAD_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    @classmethod
+    def available(cls, path=DOWNLOAD_CACHE_DIR):
+        """
+        The cache is only used if the admin created the directory.
+        """
+        return os.path.isdir(path) and os.access(path, os.W_OK)
+
+    @staticmethod
+    def key(url, version, compression=None):
+        """
+        :param version: ETag or Last-Modified of the resource
+        """
+        return hashlib.sha256("%s\n%s\n%s" % (url, version, compression or '')).hexdigest()
+
+    @contextlib.contextmanager
+    def _lock(self, name, mode):
+        lock_dir = os.path.join(self.path, 'locks')
+        _mkdir(lock_dir)
+        with open(os.path.join(lock_dir, name), 'a') as lockfile:
+            fcntl.flock(lockfile, mode)
+            try:
+                yield lockfile
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def entry(self, key):
+        """
+        Lock the entry for the key. If entry.hit, the entry can be copied
+        to the job. Otherwise the caller holds the only lock on the entry,
+        downloads the file and stores it; other jobs asking for the same
+        entry wait for it.
+        """
+        entry = CacheEntry(self, key)
+        with self._lock(key, fcntl.LOCK_SH):
+            if entry.load():
+                self._count('hits')
+                yield entry
+                return
+        with self._lock(key, fcntl.LOCK_EX):
+            # another job may have stored the entry in the meantime
+            if entry.load():
+                self._count('hits')
+            else:
+                self._count('misses')
+            yield entry
+        if entry.hit:
+            self.evict()
+
+    def _count(self, name, value=1):
+        with self._lock('stats', fcntl.LOCK_EX):
+            stats = self.stats()
+            stats[name] = stats.get(name, 0) + value
+            with open(os.path.join(self.path, 'stats.json'), 'w') as output:
+                json.dump(stats, output)
+
+    def stats(self):
+        """
+        :return: dictionary of the number of hits, misses and evictions
+        """
+        try:
+            with open(os.path.join(self.path, 'stats.json'), 'r') as stats:
+                return json.load(stats)
+        except (IOError, ValueError):
+            return {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size. Entries in use by another job are kept.
+        """
+        entries_dir = os.path.join(self.path, 'entries')
+        with self._lock('evict', fcntl.LOCK_EX):
+            entries = []
+            for key in os.listdir(entries_dir):
+                entry = CacheEntry(self, key)
+                try:
+                    used = os.path.getmtime(entry.meta_file)
+                    size = os.path.getsize(entry.data)
+                except OSError:
+                    continue
+                entries.append((used, size, entry))
+            total = sum(entry_size for _, entry_size, _ in entries)
+            evicted = 0
+            for _, size, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= self.max_size:
+                    break
+                with open(os.path.join(self.path, 'locks', entry.key), 'a') as lockfile:
+                    try:
+                        fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except IOError:
+                        continue
+                    try:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    finally:
+                        fcntl.flock(lockfile, fcntl.LOCK_UN)
+                total -= size
+                evicted += 1
+        if evicted:
+            self._count('evictions', evicted)
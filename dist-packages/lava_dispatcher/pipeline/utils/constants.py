@@ -22,8 +22,20 @@
 # each constant.
 
 # Delay between each character sent to the shell. This is required for some
-# slow serial consoles.
+# slow serial consoles. The characters are sent in chunks of
+# SHELL_SEND_CHUNK_SIZE (the size of a common UART FIFO), each chunk waiting
+# for its echo. Without the echo, the characters are sent one at a time,
+# waiting SHELL_SEND_DELAY after each one.
+# Override: set the pacing profile of the device type or device.
 SHELL_SEND_DELAY = 0.05
+SHELL_SEND_CHUNK_SIZE = 16
+
+# Maximum time to wait for the echo of a chunk.
+SHELL_ECHO_TIMEOUT = 1
+
+# Strings in a row without echo after which a console is only written to
+# one character at a time.
+SHELL_ECHO_MISSES = 3
 
 # Default timeout for shell operations
 SHELL_DEFAULT_TIMEOUT = 60
@@ -50,9 +62,28 @@ FILE_DOWNLOAD_CHUNK_SIZE = 32768
 # Size of the chunks when downloading over http
 HTTP_DOWNLOAD_CHUNK_SIZE = 32768
 
+# Number of times an interrupted http download is resumed with a Range
+# request before failing
+HTTP_RESUME_RETRIES = 5
+
+# Files of at least two segments are downloaded in parallel segments,
+# when the server accepts Range requests
+HTTP_SEGMENT_SIZE = 64 * 1024 * 1024
+HTTP_DOWNLOAD_SEGMENTS = 4
+
 # Size of the chunks when downloading over scp
 SCP_DOWNLOAD_CHUNK_SIZE = 32768
 
+# Number of chunks buffered between the download, checksum and
+# decompression stages
+DOWNLOAD_QUEUE_SIZE = 256
+
+# Number of artifacts of a deploy action downloaded concurrently
+DOWNLOAD_WORKERS = 4
+
+# Maximum number of concurrent downloads from the same server
+DOWNLOAD_HOST_CONNECTIONS = 2
+
 # Clamp on the maximum timeout allowed for overrides
 OVERRIDE_CLAMP_DURATION = 300
 
@@ -64,6 +95,13 @@ AUTOLOGIN_DEFAULT_TIMEOUT = 120
 # Files here are for download using the Apache /tmp alias.
 DISPATCHER_DOWNLOAD_DIR = "/var/lib/lava/dispatcher/tmp"
 
+# Cache of the downloaded artifacts, shared by the jobs of the worker.
+# The cache is only used if this directory exists.
+DOWNLOAD_CACHE_DIR = "/var/lib/lava/dispatcher/cache"
+
+# Maximum size of the download cache, in bytes
+DOWNLOAD_CACHE_SIZE = 20 * 1024 * 1024 * 1024
+
 # OS shutdown message
 # Override: set as the shutdown-message parameter of an Action.
 SHUTDOWN_MESSAGE = 'The system is going down for reboot NOW'
@@ -0,0 +1,159 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+"""
+Pacing of the characters written to a console.
+
+Slow serial consoles drop characters when they are written faster than
+the device reads them. Rather than waiting after every character, the
+characters are written in chunks no larger than the receive FIFO of the
+UART, and each chunk waits until the device echoes it back: the echo
+shows that the device has read the chunk, so the next one can be sent
+at once. This is measured on every chunk, rather than assumed.
+
+When a chunk is not echoed in time (a password, a line wrapped by the
+shell, a console which does not echo), the rest of the string is sent
+one character at a time with the delay used before the pacer. A console
+which misses the echo of SHELL_ECHO_MISSES strings in a row is only
+written to one character at a time from then on.
+"""
+
+import time
+import pexpect
+from lava_dispatcher.pipeline.utils.constants import (
+    SHELL_ECHO_MISSES,
+    SHELL_ECHO_TIMEOUT,
+    SHELL_SEND_CHUNK_SIZE,
+    SHELL_SEND_DELAY,
+)
+
+
+class WritePacer(object):
+    """
+    Writes strings to a pexpect connection in paced chunks.
+
+    The profile of a device type or device overrides the defaults:
+
+    pacing:
+      chunk_size: 32  # characters written at once, at most the UART FIFO
+      chunk_delay: 50  # milliseconds to wait after each chunk, without echo
+      echo: true  # wait for the echo of each chunk rather than chunk_delay
+    """
+
+    def __init__(self, chunk_size=SHELL_SEND_CHUNK_SIZE, chunk_delay=SHELL_SEND_DELAY,
+                 echo=True, echo_timeout=SHELL_ECHO_TIMEOUT, char_delay=SHELL_SEND_DELAY):
+        """
+        :param char_delay: seconds to wait after each character, once the
+        echo of a chunk is missing
+        """
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunk_delay = chunk_delay
+        self.echo = echo
+        self.echo_timeout = echo_timeout
+        self.char_delay = char_delay
+        # strings in a row with a missing echo
+        self.misses = 0
+        self.echoed = 0
+        self.echo_time = 0
+
+    @classmethod
+    def from_device(cls, device):
+        """
+        :param device: the device configuration, the pacing profile is optional
+        :return: the pacer of the profile, with the defaults for the missing values
+        """
+        profile = device.get('pacing', None) or {}
+        return cls(chunk_size=profile.get('chunk_size', SHELL_SEND_CHUNK_SIZE),
+                   chunk_delay=float(profile.get('chunk_delay', SHELL_SEND_DELAY * 1000)) / 1000,
+                   echo=profile.get('echo', True))
+
+    def chunks(self, string, delay=0):
+        """
+        :param delay: delay in milliseconds between each character, when
+        the caller requires sending one character at a time. It is added
+        to char_delay, as it was added to the delay before each send.
+        :return: list of (chunk, seconds to wait after the chunk)
+        """
+        if delay:
+            return [(char, float(delay) / 1000 + self.char_delay) for char in string]
+        return [(string[index:index + self.chunk_size], self.chunk_delay)
+                for index in range(0, len(string), self.chunk_size)]
+
+    def _wait_echo(self, connection, chunk, start):
+        """
+        Read the output until the chunk is echoed. The output is kept in
+        the buffer of the connection for the following expect calls.
+        :param start: length of the buffer when the chunk was sent
+        :return: True if the chunk was echoed before echo_timeout, False
+        if not, None if the chunk has nothing to echo
+        """
+        expected = chunk.strip('\r\n')
+        if not expected:
+            return None
+        began = time.time()
+        deadline = began + self.echo_timeout
+        while expected not in connection.buffer[start:]:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                connection.buffer += connection.read_nonblocking(connection.maxread, remaining)
+            except (pexpect.TIMEOUT, pexpect.EOF):
+                return False
+        self.echoed += 1
+        self.echo_time += time.time() - began
+        return True
+
+    def _missed(self):
+        self.misses += 1
+        if self.misses >= SHELL_ECHO_MISSES:
+            # the console does not echo, send as before the pacer
+            self.echo = False
+            self.chunk_size = 1
+            self.chunk_delay = self.char_delay
+
+    def write(self, connection, send, string, delay=0):
+        """
+        :param connection: the pexpect connection
+        :param send: function writing a string to the connection
+        :param delay: delay in milliseconds between each character
+        :return: number of characters written
+        """
+        sent = 0
+        echoed = False
+        for index, (chunk, wait) in enumerate(self.chunks(string, delay)):
+            start = len(connection.buffer)
+            sent += send(chunk)
+            if not self.echo or delay:
+                time.sleep(wait)
+                continue
+            echo = self._wait_echo(connection, chunk, start)
+            if echo is None:
+                time.sleep(wait)
+            elif echo:
+                echoed = True
+            else:
+                rest = string[(index + 1) * self.chunk_size:]
+                self._missed()
+                for char in rest:
+                    sent += send(char)
+                    time.sleep(self.char_delay)
+                return sent
+        if echoed:
+            self.misses = 0
+        return sent
@@ -7,6 +7,8 @@ def test_suite():
         'lava_dispatcher.tests.test_device_version',
         'linaro_dashboard_bundle.tests',
         'lava_dispatcher.tests.test_job',
+        'lava_dispatcher.tests.test_lava_test_shell',
+        'lava_dispatcher.tests.test_utils',
         'lava_dispatcher.pipeline.test.test_basic',
         'lava_dispatcher.pipeline.test.test_defs',
         'lava_dispatcher.pipeline.test.test_devices',
@@ -19,6 +21,9 @@ def test_suite():
         'lava_dispatcher.pipeline.test.test_kvm',
         'lava_dispatcher.pipeline.test.test_multinode',
         'lava_dispatcher.pipeline.test.test_connections',
+        'lava_dispatcher.pipeline.test.test_cache',
+        'lava_dispatcher.pipeline.test.test_download',
+        'lava_dispatcher.pipeline.test.test_pacing',
         #  'lava_dispatcher.pipeline.test.test_utils',
         'lava_dispatcher.pipeline.test.test_repeat',
     ]
@@ -0,0 +1,104 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses>.
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from lava_dispatcher.lava_test_shell import (
+    _get_test_results,
+    _read_lines,
+    _stdout_attachment,
+    parse_testcase_result,
+)
+from lava_dispatcher.test_data import create_attachment
+
+STDOUT_LOG = (
+    '+ lava-test-case boot --result pass\n'
+    '<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=boot RESULT=pass>\n'
+    'network : PASS\n'
+    '<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=bandwidth RESULT=pass UNITS=MB/s MEASUREMENT=112.5>\n'
+    '  <LAVA_SIGNAL_TESTCASE TEST_CASE_ID=padded RESULT=FAIL>  \r\n'
+    '<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=bad RESULT=maybe>\n'
+    '<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=dmesg RESULT=pass>\n'
+    '\n'
+    'last : SKIP'
+)
+
+# the patterns of the lava-test-case signals before they were combined
+SLIM_PATTERN = re.compile(
+    "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=(?P<test_case_id>.*)\\s+"
+    "RESULT=(?P<result>(PASS|pass|FAIL|fail|SKIP|skip|UNKNOWN|unknown))>")
+MEASUREMENT_PATTERN = re.compile(
+    "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=(?P<test_case_id>.*)\\s+"
+    "RESULT=(?P<result>(PASS|pass|FAIL|fail|SKIP|skip|UNKNOWN|unknown))\\s"
+    "UNITS=(?P<units>.*)\\s"
+    "MEASUREMENT=(?P<measurement>.*)>")
+
+
+class TestStdoutParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.test_run_dir = tempfile.mkdtemp()
+        self.stdout = os.path.join(self.test_run_dir, 'stdout.log')
+        with open(self.stdout, 'w') as stdout:
+            stdout.write(STDOUT_LOG)
+        attachments = os.path.join(self.test_run_dir, 'results', 'dmesg', 'attachments')
+        os.makedirs(attachments)
+        with open(os.path.join(self.test_run_dir, 'results', 'dmesg', 'result'), 'w') as result:
+            result.write('pass\n')
+        with open(os.path.join(attachments, 'dmesg.log'), 'w') as attachment:
+            attachment.write('[    0.000000] Booting Linux\n')
+        self.err_log = os.path.join(self.test_run_dir, 'err.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_run_dir)
+
+    def test_read_lines(self):
+        self.assertEqual(STDOUT_LOG.split('\n'), list(_read_lines(self.stdout)))
+        with open(self.stdout, 'a') as stdout:
+            stdout.write('\n')
+        self.assertEqual((STDOUT_LOG + '\n').split('\n'), list(_read_lines(self.stdout)))
+
+    def test_streaming_results_are_the_whole_file_results(self):
+        testdef = {'metadata': {'name': 'smoke'}}
+        expected = _get_test_results(self.test_run_dir, testdef, STDOUT_LOG.split('\n'), self.err_log)
+        results = _get_test_results(self.test_run_dir, testdef, _read_lines(self.stdout), self.err_log)
+        self.assertEqual(expected, results)
+        self.assertEqual(['boot', 'network', 'bandwidth', 'padded', 'dmesg', 'last'],
+                         [res['test_case_id'] for res in results])
+        self.assertEqual(('112.5', 'MB/s'), (results[2]['measurement'], results[2]['units']))
+        self.assertEqual(['dmesg.log'], [attachment['pathname'] for attachment in results[4]['attachments']])
+
+    def test_signals_match_the_former_patterns(self):
+        fixupdict = {'PASS': 'pass', 'FAIL': 'fail', 'SKIP': 'skip', 'UNKNOWN': 'unknown'}
+        expected = []
+        for lineno, line in enumerate(STDOUT_LOG.split('\n'), 1):
+            match = SLIM_PATTERN.match(line.strip()) or MEASUREMENT_PATTERN.match(line.strip())
+            if match:
+                expected.append((lineno, parse_testcase_result(match.groupdict(), fixupdict)))
+        # only the results of the log
+        shutil.rmtree(os.path.join(self.test_run_dir, 'results'))
+        testdef = {'metadata': {'name': 'smoke'}, 'parse': {'pattern': '^$ignored'}}
+        results = _get_test_results(self.test_run_dir, testdef, _read_lines(self.stdout), self.err_log)
+        self.assertEqual(expected, [
+            (res.pop('log_lineno'), res) for res in results if res.pop('log_filename', None)])
+
+    def test_stdout_attachment(self):
+        self.assertEqual(create_attachment('stdout.log', STDOUT_LOG), _stdout_attachment(self.test_run_dir))
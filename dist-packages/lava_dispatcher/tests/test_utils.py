@@ -0,0 +1,82 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses>.
+
+import re
+import unittest
+
+import pexpect
+
+from lava_dispatcher.utils import ConsoleReader
+
+
+class FakeConnection(object):
+    """
+    The output of a console, returned by read_nonblocking one read at a
+    time.
+    """
+
+    def __init__(self, reads, buffer=''):
+        self.reads = list(reads)
+        self.buffer = buffer
+        self.before = None
+        self.after = None
+        self.match = None
+
+    def read_nonblocking(self, size, timeout):
+        if not self.reads:
+            raise pexpect.EOF('End Of File (EOF) in read_nonblocking().')
+        return self.reads.pop(0)
+
+
+class TestConsoleReader(unittest.TestCase):
+
+    def test_match_spanning_reads(self):
+        connection = FakeConnection(['boot\nlog', 'in: rest'])
+        reader = ConsoleReader(connection)
+        self.assertEqual(0, reader.expect([('login: ', None)], timeout=5))
+        self.assertEqual('boot\n', connection.before)
+        self.assertEqual('login: ', connection.after)
+        self.assertEqual('rest', connection.buffer)
+
+    def test_match_longer_than_window(self):
+        connection = FakeConnection(['A' * 10] * 5)
+        reader = ConsoleReader(connection, window=16)
+        patterns = [(re.compile('A{40}'), None), (pexpect.EOF, None)]
+        self.assertEqual(1, reader.expect(patterns, timeout=5))
+        self.assertEqual(pexpect.EOF, connection.after)
+        self.assertEqual(50, reader.bytes_read)
+
+    def test_before_and_after(self):
+        connection = FakeConnection(['foo bar# ', 'next'], buffer='noise\n')
+        reader = ConsoleReader(connection)
+        # the first match in the output, whatever the order of the patterns
+        patterns = [(r'bar# ', '#'), (r'fo+', 'fo'), (r'missing', 'none')]
+        self.assertEqual(1, reader.expect(patterns, timeout=5))
+        self.assertEqual('noise\n', connection.before)
+        self.assertEqual('foo', connection.after)
+        self.assertEqual('foo', connection.match.group(0))
+        self.assertEqual(' bar# ', connection.buffer)
+        # the following expect starts from the rest of the output
+        self.assertEqual(0, reader.expect(patterns, timeout=5))
+        self.assertEqual(' ', connection.before)
+        self.assertEqual('bar# ', connection.after)
+        self.assertEqual('', connection.buffer)
+
+    def test_eof(self):
+        connection = FakeConnection([])
+        reader = ConsoleReader(connection)
+        self.assertRaises(pexpect.EOF, reader.expect, [('prompt', None)], timeout=5)
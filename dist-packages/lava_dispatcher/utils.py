@@ -38,6 +38,7 @@ from distutils import spawn
 import pexpect
 
 from lava_dispatcher.errors import CriticalError
+from lava_dispatcher.pipeline.utils.pacing import WritePacer
 
 
 def kill_process_with_option(process=None, key_option=None):
@@ -447,6 +448,10 @@ class logging_spawn(pexpect.spawn):
         # serial can be slow, races do funny things, so increase delay
         # self.delaybeforesend = 0.05
         self.delaybeforesend = 0.1
+        # chunks wait for their echo, or else the characters are sent one at
+        # a time waiting delaybeforesend after each one
+        self.pacer = WritePacer(chunk_delay=self.delaybeforesend,
+                                char_delay=self.delaybeforesend)
 
     def sendline(self, s='', delay=0, send_char=True):
         """
@@ -466,15 +471,14 @@ class logging_spawn(pexpect.spawn):
 
     def send(self, string, delay=0, send_char=True):
         logging.debug("send (delay_ms=%s): %s ", delay, string)
-        sent = 0
-        delay = float(delay) / 1000
         if send_char:
-            for char in string:
-                sent += super(logging_spawn, self).send(char)
-                time.sleep(delay)
-        else:
-            sent = super(logging_spawn, self).send(string)
-        return sent
+            # the pacer waits between the chunks
+            delaybeforesend, self.delaybeforesend = self.delaybeforesend, 0
+            try:
+                return self.pacer.write(self, super(logging_spawn, self).send, string, delay)
+            finally:
+                self.delaybeforesend = delaybeforesend
+        return super(logging_spawn, self).send(string)
 
     def expect(self, *args, **kw):
         # some expect should not be logged because it is so much noise.
@@ -509,6 +513,123 @@ class logging_spawn(pexpect.spawn):
                 ['.+', pexpect.EOF, pexpect.TIMEOUT],
                 timeout=0.1, lava_no_logging=1)
 
+
+# Bytes of console output kept for matching by ConsoleReader. Longer
+# matches are not found.
+CONSOLE_SEARCH_WINDOW = 8192
+
+# Size of the reads of ConsoleReader
+CONSOLE_READ_SIZE = 4096
+
+
+class ConsoleReader(object):
+    """
+    Matches patterns against the output of a pexpect connection.
+
+    pexpect.spawn.expect searches the whole unmatched buffer with every
+    pattern after each read, and the buffer grows with the console
+    output. ConsoleReader only keeps the last CONSOLE_SEARCH_WINDOW bytes
+    and searches the new data, plus the end of the window for matches
+    spanning two reads. A pattern with a prefilter is only searched if the
+    prefilter string is in that data.
+
+    The first match (lowest start, then first pattern) is returned like
+    pexpect does, with match, before, after and buffer set on the
+    connection so the following expect calls see the rest of the output.
+    """
+
+    def __init__(self, connection, window=CONSOLE_SEARCH_WINDOW):
+        self.connection = connection
+        self.window = window
+        self.start = time.time()
+        self.bytes_read = 0
+        self.matches = 0
+        self.search_time = 0
+        self.max_search_time = 0
+
+    def expect(self, patterns, timeout):
+        """
+        :param patterns: list of (pattern, prefilter) tuples; the pattern is
+        a string or a compiled regular expression, or pexpect.EOF or
+        pexpect.TIMEOUT. The prefilter is a string which is part of every
+        match of the pattern, or None.
+        :return: the index of the matching pattern
+        """
+        compiled = []
+        for pattern, prefilter in patterns:
+            if isinstance(pattern, basestring):
+                pattern = re.compile(pattern, re.DOTALL)
+            compiled.append((pattern, prefilter))
+        deadline = time.time() + timeout
+        data = self.connection.buffer
+        fresh = len(data)
+        while True:
+            index = self._search(compiled, data, fresh)
+            if index is not None:
+                return index
+            data = data[-self.window:]
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return self._event(compiled, pexpect.TIMEOUT, data)
+            try:
+                new = self.connection.read_nonblocking(CONSOLE_READ_SIZE, min(remaining, 1))
+            except pexpect.TIMEOUT:
+                new = ''
+            except pexpect.EOF:
+                return self._event(compiled, pexpect.EOF, data)
+            self.bytes_read += len(new)
+            data += new
+            fresh = len(new)
+
+    def _search(self, patterns, data, fresh):
+        if not fresh:
+            return None
+        begin = time.time()
+        offset = max(0, len(data) - fresh - self.window)
+        best = None
+        for index, (pattern, prefilter) in enumerate(patterns):
+            if pattern in (pexpect.EOF, pexpect.TIMEOUT):
+                continue
+            if prefilter and data.find(prefilter, offset) == -1:
+                continue
+            match = pattern.search(data, offset)
+            if match and (best is None or match.start() < best[1].start()):
+                best = (index, match)
+        elapsed = time.time() - begin
+        self.search_time += elapsed
+        self.max_search_time = max(self.max_search_time, elapsed)
+        if best is None:
+            return None
+        index, match = best
+        self.matches += 1
+        self.connection.before = data[:match.start()]
+        self.connection.after = match.group(0)
+        self.connection.match = match
+        self.connection.buffer = data[match.end():]
+        return index
+
+    def _event(self, patterns, event, data):
+        self.connection.buffer = ''
+        self.connection.before = data
+        self.connection.after = event
+        self.connection.match = event
+        for index, (pattern, _) in enumerate(patterns):
+            if pattern is event:
+                return index
+        if event is pexpect.EOF:
+            raise pexpect.EOF('End Of File (EOF) in read_nonblocking().')
+        raise pexpect.TIMEOUT('Timeout exceeded in ConsoleReader.expect().')
+
+    def stats(self):
+        """
+        :return: a summary of the output read and of the time spent matching
+        """
+        elapsed = max(time.time() - self.start, 0.001)
+        return "%d bytes read (%d bytes/s), %d matches, %.3fs matching (max %.1fms)" % (
+            self.bytes_read, self.bytes_read / elapsed, self.matches,
+            self.search_time, self.max_search_time * 1000)
+
+
 ############################################################
 # modified by Wang Bo (wang.bo@whaley.cn), 2016.06.15
 ############################################################
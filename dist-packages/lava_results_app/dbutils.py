@@ -18,7 +18,8 @@
 
 import yaml
 import logging
-from django.db import transaction
+import time
+from django.db import DatabaseError, transaction
 from collections import OrderedDict
 from lava_results_app.models import (
     TestSuite,
@@ -28,9 +29,26 @@ from lava_results_app.models import (
     ActionData,
     MetaType,
 )
+from lava_scheduler_app.models import TestJob
 from lava_dispatcher.pipeline.action import Timeout
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
 # pylint: disable=no-member
 
+# The results logger of the dispatcher dumps a list of one dictionary and
+# yaml sorts the keys, so a results message always starts with this.
+# Other log messages start with their own level name.
+RESULTS_PREFIX = '- results:'
+
+# Test cases queued before the ResultsQueue writes them to the database
+RESULTS_BATCH = 500
+# Maximum delay (in seconds) before the queued test cases are written
+RESULTS_INTERVAL = 1
+# Jobs for which the ResultsQueue caches the TestJob and TestSuite objects
+RESULTS_CACHED_JOBS = 1000
+
 
 METADATA_MAPPING_DESCRIPTION = {
     "boot.commands": ["job", "actions", "boot", "commands"],
@@ -43,7 +61,93 @@ METADATA_MAPPING_DESCRIPTION = {
 }
 
 
-def _test_case(name, suite, result, testset=None, testshell=False):
+class ResultsQueue(object):
+    """
+    Coalesces the results logged by the slaves, so that the test cases of
+    a lava-test-shell are written with bulk_create in batches instead of
+    one INSERT each, and caches the TestJob and TestSuite lookups.
+    The queue is written when RESULTS_BATCH test cases are pending, when
+    flush() is called once RESULTS_INTERVAL has expired and when a job
+    ends, see forget().
+    """
+
+    def __init__(self, batch_size=RESULTS_BATCH, interval=RESULTS_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.jobs = {}
+        self.suites = {}
+        self.pending = []
+        self.last_flush = time.time()
+
+    def add(self, job_id, scanned_dict):
+        """
+        Map the results scanned from a log message of the job.
+        :raises TestJob.DoesNotExist: if the job is unknown
+        :return: False on error, else True
+        """
+        job_id = int(job_id)
+        job = self.jobs.get(job_id)
+        if job is None:
+            if len(self.jobs) >= RESULTS_CACHED_JOBS:
+                self.jobs.clear()
+                self.suites.clear()
+            job = TestJob.objects.get(id=job_id)
+            self.jobs[job_id] = job
+        return map_scanned_results(scanned_dict, job, queue=self)
+
+    def suite(self, job, name):
+        key = (job.id, name)
+        if key not in self.suites:
+            self.suites[key] = TestSuite.objects.get_or_create(name=name, job=job)[0]
+        return self.suites[key]
+
+    def append(self, case):
+        self.pending.append(case)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def expired(self):
+        return bool(self.pending) and time.time() - self.last_flush >= self.interval
+
+    def flush(self):
+        """
+        Write the pending test cases. When the batch is refused by the
+        database, the test cases are written one by one and the ones which
+        cannot be stored are logged and dropped, so that a bad row does not
+        lose the results of the other jobs.
+        """
+        if self.pending:
+            try:
+                with transaction.atomic():
+                    TestCase.objects.bulk_create(self.pending)
+            except DatabaseError:
+                self._save_each()
+            finally:
+                self.pending = []
+        self.last_flush = time.time()
+
+    def _save_each(self):
+        logger = logging.getLogger('dispatcher-master')
+        for case in self.pending:
+            try:
+                with transaction.atomic():
+                    case.save()
+            except DatabaseError as exc:
+                logger.error("Unable to store test case %s of suite %s: %s", case.name, case.suite_id, exc)
+
+    def forget(self, job_id):
+        """
+        Write the pending results and drop the cached objects of a job
+        which has ended.
+        """
+        self.flush()
+        job_id = int(job_id)
+        self.jobs.pop(job_id, None)
+        for key in [key for key in self.suites if key[0] == job_id]:
+            del self.suites[key]
+
+
+def _test_case(name, suite, result, testset=None, testshell=False, queue=None):
     """
     Create a TestCase for the specified name and result
     :param name: name of the testcase to create
@@ -51,23 +155,25 @@ def _test_case(name, suite, result, testset=None, testshell=False):
     :param result: the result for this TestCase
     :param testset: Use a TestSet if supplied.
     :param testshell: handle lava-test-shell outside a TestSet.
+    :param queue: ResultsQueue to batch the lava-test-shell results, if any.
     :return:
     """
     logger = logging.getLogger('dispatcher-master')
-    if testshell:
-        TestCase.objects.create(
-            name=name,
-            suite=suite,
-            result=TestCase.RESULT_MAP[result]
-        ).save()
-    elif testset:
-        TestCase.objects.create(
+    if testshell or testset:
+        case = TestCase(
             name=name,
             suite=suite,
             test_set=testset,
             result=TestCase.RESULT_MAP[result]
-        ).save()
+        )
+        if queue:
+            queue.append(case)
+        else:
+            case.save()
     else:
+        if queue:
+            # keep the test cases of the suite in the order of the log
+            queue.flush()
         try:
             metadata = yaml.dump(result)
         except yaml.YAMLError:
@@ -100,13 +206,14 @@ def _test_case(name, suite, result, testset=None, testshell=False):
                 match_action.save(update_fields=['testcase', 'duration', 'timeout'])
 
 
-def _check_for_testset(result_dict, suite):
+def _check_for_testset(result_dict, suite, queue=None):
     """
     Within a lava-test-shell, an OrderedDict indicates the start of a
     TestSet. Handle all results in the OrderedDict as part of that set.
     Handle all other results within the lava-test-shell items without using a TestSet.
     :param result_dict: lava-test-shell results
     :param suite: current test suite
+    :param queue: ResultsQueue, if any
     """
     for shell_testcase, shell_result in result_dict.items():
         if type(shell_result) == OrderedDict:
@@ -117,19 +224,39 @@ def _check_for_testset(result_dict, suite):
             )
             testset.save()
             for set_casename, set_result in shell_result.items():
-                _test_case(set_casename, suite, set_result, testset=testset)
+                _test_case(set_casename, suite, set_result, testset=testset, queue=queue)
         elif shell_testcase == 'level':
             # needs to be stored in the existing testcase, not a new one
             pass
         else:
-            _test_case(shell_testcase, suite, shell_result, testshell=True)
+            _test_case(shell_testcase, suite, shell_result, testshell=True, queue=queue)
+
+
+def scan_results(message):
+    """
+    Extract the results logged via the slave from a log message,
+    without parsing the messages of the other levels.
+    :param message: the log message as received by the master
+    :return: the scanned dictionary or None if message is not a results message
+    :raises yaml.YAMLError: if a results message cannot be parsed
+    """
+    if not message.startswith(RESULTS_PREFIX):
+        return None
+    scanned = yaml.load(message, Loader=Loader)
+    # the results logger wraps the OrderedDict in a dict called results, for identification,
+    # YAML then puts that into a list of one item for each call to log.results.
+    if type(scanned) is list and len(scanned) == 1:
+        if type(scanned[0]) is dict and 'results' in scanned[0]:
+            return scanned[0]
+    return None
 
 
-def map_scanned_results(scanned_dict, job):
+def map_scanned_results(scanned_dict, job, queue=None):
     """
     Sanity checker on the logged results dictionary
     :param scanned_dict: results logged via the slave
-    :param suite: the current test suite
+    :param job: the TestJob which logged the results
+    :param queue: ResultsQueue to batch the test cases, if any.
     :return: False on error, else True
     """
     logger = logging.getLogger('dispatcher-master')
@@ -140,19 +267,20 @@ def map_scanned_results(scanned_dict, job):
         logger.debug("missing results in %s", scanned_dict.keys())
         return False
     results = scanned_dict['results']
-    if 'testsuite' in results:
-        suite = TestSuite.objects.get_or_create(name=results['testsuite'], job=job)[0]
-        logger.debug("%s" % suite)
+    suite_name = results['testsuite'] if 'testsuite' in results else 'lava'
+    if queue:
+        suite = queue.suite(job, suite_name)
     else:
-        suite = TestSuite.objects.get_or_create(name='lava', job=job)[0]
+        suite = TestSuite.objects.get_or_create(name=suite_name, job=job)[0]
+    logger.debug("%s" % suite)
     for name, result in results.items():
         if name == 'testsuite':
             # already handled
             pass
         elif name == 'testset':
-            _check_for_testset(result, suite)
+            _check_for_testset(result, suite, queue=queue)
         else:
-            _test_case(name, suite, result, testshell=(suite.name != 'lava'))
+            _test_case(name, suite, result, testshell=(suite.name != 'lava'), queue=queue)
     return True
 
 
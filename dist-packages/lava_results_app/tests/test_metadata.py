@@ -7,7 +7,7 @@ from lava_scheduler_app.models import (
     TestJob,
     Device,
 )
-from lava_results_app.dbutils import map_metadata, testcase_export_fields, export_testcase
+from lava_results_app.dbutils import map_metadata, testcase_export_fields, export_testcase, scan_results
 from lava_results_app.models import ActionData, MetaType, TestData, TestCase, TestSuite
 from lava_dispatcher.pipeline.parser import JobParser
 from lava_dispatcher.pipeline.device import PipelineDevice
@@ -91,3 +91,22 @@ class TestMetaTypes(TestCaseWithFactory):
         action_data.timeout = 300
         action_data.save(update_fields=['timeout'])
         self.assertEqual(action_data.timeout, 300)
+
+
+class TestScanResults(unittest.TestCase):
+    """
+    Messages formatted as by the YAMLLogger of the dispatcher
+    """
+
+    def test_results(self):
+        results = {'testsuite': 'smoke', 'linux-linaro-ubuntu-pwd': 'pass'}
+        message = yaml.dump([{'results': results}])[:-1]
+        self.assertEqual({'results': results}, scan_results(message))
+        message = yaml.dump([{'results': results, 'ts': '2016-01-01'}])[:-1]
+        self.assertEqual(results, scan_results(message)['results'])
+
+    def test_other_levels(self):
+        for level in ['info', 'debug', 'target', 'error']:
+            message = yaml.dump([{level: '- results: pass'}])[:-1]
+            self.assertIsNone(scan_results(message))
+        self.assertRaises(yaml.YAMLError, scan_results, '- results: {fail')
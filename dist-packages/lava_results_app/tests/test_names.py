@@ -7,7 +7,7 @@ from django.core.validators import URLValidator
 from lava_results_app.models import (
     TestCase, TestSuite
 )
-from lava_results_app.dbutils import map_scanned_results
+from lava_results_app.dbutils import map_scanned_results, ResultsQueue
 from lava_scheduler_app.models import (
     TestJob, Device,
     DeviceType, DeviceDictionary,
@@ -328,3 +328,51 @@ results:
                 self.assertTrue(testcase.name.startswith('linux-linaro'))
                 val('http://localhost/%s' % testcase.get_absolute_url())
         self.factory.cleanup()
+
+    def test_results_queue(self):
+        user = self.factory.make_user()
+        job = TestJob.from_yaml_and_user(
+            self.factory.make_job_yaml(), user)
+        queue = ResultsQueue(batch_size=3)
+        for index in range(5):
+            ret = queue.add(str(job.id), {'results': {
+                'testsuite': 'smoke', 'case-%d' % index: 'pass' if index % 2 else 'fail'}})
+            self.assertTrue(ret)
+        # one batch written, the last two test cases are pending
+        suite = TestSuite.objects.get(job=job, name='smoke')
+        self.assertEqual(3, TestCase.objects.filter(suite=suite).count())
+        self.assertEqual(2, len(queue.pending))
+        # the lava suite flushes the queue to keep the order of the log
+        self.assertTrue(queue.add(job.id, {'results': {'power_off': {'status': 'Complete'}}}))
+        self.assertEqual([], queue.pending)
+        self.assertEqual(
+            ['case-0', 'case-1', 'case-2', 'case-3', 'case-4'],
+            [case.name for case in TestCase.objects.filter(suite=suite).order_by('id')])
+        self.assertEqual(TestCase.RESULT_PASS, TestCase.objects.get(suite=suite, name='case-1').result)
+        self.assertTrue(TestCase.objects.filter(suite__job=job, suite__name='lava', name='power_off').exists())
+        self.assertIn(job.id, queue.jobs)
+        queue.forget(job.id)
+        self.assertEqual({}, queue.jobs)
+        self.assertEqual({}, queue.suites)
+        self.factory.cleanup()
+
+    def test_results_queue_bad_case(self):
+        user = self.factory.make_user()
+        job = TestJob.from_yaml_and_user(
+            self.factory.make_job_yaml(), user)
+        queue = ResultsQueue(batch_size=10)
+        for index in range(3):
+            self.assertTrue(queue.add(job.id, {'results': {'testsuite': 'smoke', 'case-%d' % index: 'pass'}}))
+        suite = TestSuite.objects.get(job=job, name='smoke')
+        # a test case the database refuses, in the middle of the batch
+        queue.pending.insert(1, TestCase(name='bad', suite=suite, result=None))
+        queue.flush()
+        self.assertEqual([], queue.pending)
+        self.assertEqual(
+            ['case-0', 'case-1', 'case-2'],
+            [case.name for case in TestCase.objects.filter(suite=suite).order_by('id')])
+        # the queue is still usable
+        self.assertTrue(queue.add(job.id, {'results': {'testsuite': 'smoke', 'case-3': 'fail'}}))
+        queue.flush()
+        self.assertTrue(TestCase.objects.filter(suite=suite, name='case-3').exists())
+        self.factory.cleanup()
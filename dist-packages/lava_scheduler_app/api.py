@@ -464,6 +464,47 @@ class SchedulerAPI(ExposedAPI):
 
         return job_status
 
+    def job_errors(self, job_id):
+        """
+        Name
+        ----
+        `job_errors` (`job_id`)
+
+        Description
+        -----------
+        Get the errors reported by the dispatcher in the log of the given
+        job id.
+
+        Arguments
+        ---------
+        `job_id`: string
+            Job id for which the errors are required.
+
+        Return value
+        ------------
+        This function returns an XML-RPC array of the errors, in the order
+        of the log, each error being reported once, where it first appears.
+        An error repeated at the failure of the job is therefore not
+        necessarily the last one. The list grows while the job is running.
+        The user is authenticated with an username and token.
+        """
+        self._authenticate()
+        if not job_id:
+            raise xmlrpclib.Fault(400, "Bad request: TestJob id was not "
+                                  "specified.")
+        try:
+            job = get_restricted_job(self.user, job_id)
+        except PermissionDenied:
+            raise xmlrpclib.Fault(
+                401, "Permission denied for user to job %s" % job_id)
+        except TestJob.DoesNotExist:
+            raise xmlrpclib.Fault(404, "Specified job not found.")
+
+        errors = job.dispatcher_errors()
+        if errors is None:
+            raise xmlrpclib.Fault(404, "Job output not found.")
+        return errors
+
     def worker_heartbeat(self, heartbeat_data):
         """
         Name
@@ -1,28 +1,47 @@
+import json
+import os
 import re
+import tempfile
 
 
-def getDispatcherErrors(logfile):
+ERROR_TYPES = ["Infrastructure Error:",
+               "Bootloader Error:",
+               "Kernel Error:",
+               "Userspace Error:",
+               "Test Shell Error:",
+               "Master Image Error:",
+               "OperationFailed:"]
+
+# Finds any of the error types in a single pass over the line
+ERROR_PATTERN = re.compile('|'.join([re.escape(error) for error in ERROR_TYPES]))
+
+
+def _line_errors(line):
+    """
+    :return: the end of the line from each error type found in the line
+    """
+    if ERROR_PATTERN.search(line) is None:
+        return []
     errors = []
-    error_types = ["Infrastructure Error:",
-                   "Bootloader Error:",
-                   "Kernel Error:",
-                   "Userspace Error:",
-                   "Test Shell Error:",
-                   "Master Image Error:",
-                   "OperationFailed:"]
+    for error in ERROR_TYPES:
+        index = line.find(error)
+        if index != -1:
+            errors.append(line[index:])
+    return errors
+
 
+def getDispatcherErrors(logfile):
+    errors = []
     for line in logfile:
-        for error in error_types:
-            index = line.find(error)
-            if index != -1:
-                try:
-                    # decode the byte sequence to
-                    # check that it's already unicode.
-                    line[index:].decode('utf-8')
-                    errors.append(line[index:])
-                except UnicodeError:
-                    # string was not unicode, encode it.
-                    errors.append(line[index:].encode('utf-8'))
+        for error in _line_errors(line):
+            try:
+                # decode the byte sequence to
+                # check that it's already unicode.
+                error.decode('utf-8')
+                errors.append(error)
+            except UnicodeError:
+                # string was not unicode, encode it.
+                errors.append(error.encode('utf-8'))
     return list(set(errors))
 
 
@@ -101,3 +120,204 @@ def formatLogFile(logfile):
     sections.close()
 
     return sections.sections
+
+
+def _section_type(line, current):
+    """
+    :return: the section type of the line as in formatLogFile, and whether
+    the line closes the section
+    """
+    if line == 'Traceback (most recent call last):\n':
+        return 'traceback', False
+    elif current == 'traceback':
+        return 'traceback', not line.startswith(' ')
+    elif line.find("<LAVA_DISPATCHER>") != -1 \
+            or line.find("lava_dispatcher") != -1 \
+            or line.find("CriticalError:") != -1:
+        return 'log', False
+    return 'console', False
+
+
+class LogFileSummary(object):
+    """
+    Data extracted from a log file, kept in a file next to the log and
+    extended with the lines appended to the log since it was saved.
+
+    Subclasses add each line to the summary in _push() and list the
+    attributes to save in FIELDS.
+    """
+
+    VERSION = 1
+    SUFFIX = None
+    FIELDS = []
+
+    def __init__(self, path, summary_path=None):
+        self.path = path
+        self.summary_path = summary_path or path + self.SUFFIX
+        # number of bytes of the log file in the summary
+        self.size = 0
+
+    def load(self):
+        try:
+            with open(self.summary_path, 'r') as summary:
+                data = json.load(summary)
+        except (IOError, ValueError):
+            return False
+        if data.get('version') != self.VERSION or \
+                data['size'] > os.path.getsize(self.path):
+            # the log file was replaced
+            return False
+        self.size = data['size']
+        for field in self.FIELDS:
+            setattr(self, field, data[field])
+        return True
+
+    def save(self):
+        data = {'version': self.VERSION, 'size': self.size}
+        for field in self.FIELDS:
+            data[field] = getattr(self, field)
+        try:
+            tmp = tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(self.summary_path), delete=False)
+            with tmp:
+                json.dump(data, tmp)
+            os.rename(tmp.name, self.summary_path)
+        except (IOError, OSError):
+            # the summary is made again by the next request
+            pass
+
+    def update(self, complete=False):
+        """
+        Add the lines appended to the log file since the last update.
+        :param complete: add the last line even if it has no newline, the
+        log file is not expected to change anymore. Such a summary is not
+        saved, see open().
+        :return: True if the summary changed
+        """
+        changed = False
+        with open(self.path, 'rb') as logfile:
+            logfile.seek(self.size)
+            for line in logfile:
+                if not line.endswith('\n') and not complete:
+                    break
+                self._push(line)
+                changed = True
+        return changed
+
+    def _push(self, line):
+        raise NotImplementedError
+
+    @classmethod
+    def open(cls, path, complete=False):
+        """
+        Load the summary of the log file and update it.
+        :param complete: also add the last line if it has no newline.
+        Only the complete lines are saved: the writer of the log may still
+        hold the end of that line.
+        """
+        summary = cls(path)
+        summary.load()
+        if summary.update():
+            summary.save()
+        if complete:
+            summary.update(complete=True)
+        return summary
+
+
+class LogSectionIndex(LogFileSummary):
+    """
+    Byte offsets of the sections of a log file, as found by formatLogFile,
+    so that the sections can be read with a seek rather than by formatting
+    the whole file.
+
+    Each section is a list of [type, start offset, end offset, line count].
+    """
+
+    SUFFIX = '.sections'
+    FIELDS = ['sections', 'is_open']
+
+    def __init__(self, path, summary_path=None):
+        super(LogSectionIndex, self).__init__(path, summary_path)
+        self.sections = []
+        # whether the next lines can be added to the last section
+        self.is_open = False
+
+    def _push(self, line):
+        start = self.size
+        self.size += len(line)
+        line = line.replace('\r', '')
+        current = self.sections[-1][0] if self.is_open else None
+        sect_type, close = _section_type(line, current)
+        if not line:
+            # formatLogFile skips the line, the bytes stay in the section
+            if self.sections:
+                self.sections[-1][2] = self.size
+            return
+        if sect_type == current:
+            section = self.sections[-1]
+            section[2] = self.size
+            section[3] += 1
+        else:
+            self.sections.append([sect_type, start, self.size, 1])
+        self.is_open = not close
+
+    def pages(self, page_size):
+        """
+        :return: the index of the first section of each page, a page
+        holding sections up to page_size bytes or a single larger section.
+        """
+        pages = [0]
+        length = 0
+        for number, section in enumerate(self.sections):
+            length += section[2] - section[1]
+            if length > page_size and number > pages[-1]:
+                pages.append(number)
+                length = section[2] - section[1]
+        return pages
+
+    def read(self, first=0, last=None, start=0):
+        """
+        Read the sections from first to last (excluded), skipping the
+        bytes before the start offset.
+        :return: list of (type, line count, text) as formatLogFile
+        """
+        sections = []
+        with open(self.path, 'rb') as logfile:
+            for sect_type, begin, end, lines in self.sections[first:last]:
+                if end <= start:
+                    continue
+                logfile.seek(max(begin, start))
+                text = logfile.read(end - max(begin, start)).decode('utf-8', 'replace')
+                text = text.replace('\r', '')
+                if begin < start:
+                    lines = text.count('\n')
+                sections.append((sect_type, lines, text))
+        return sections
+
+
+class DispatcherErrors(LogFileSummary):
+    """
+    The errors reported by the dispatcher in a log file, in the order of
+    the log, without duplicates.
+    """
+
+    SUFFIX = '.errors'
+    FIELDS = ['errors']
+
+    def __init__(self, path, summary_path=None):
+        super(DispatcherErrors, self).__init__(path, summary_path)
+        self.errors = []
+        # the errors already in the list, for a constant time lookup
+        self._known = set()
+
+    def load(self):
+        loaded = super(DispatcherErrors, self).load()
+        self._known = set(self.errors)
+        return loaded
+
+    def _push(self, line):
+        self.size += len(line)
+        for error in _line_errors(line.decode('utf-8', 'replace')):
+            if error not in self._known:
+                self._known.add(error)
+                self.errors.append(error)
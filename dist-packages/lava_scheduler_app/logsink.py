@@ -0,0 +1,195 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Writing of the pipeline job logs received by the dispatcher-master.
+
+The master loop only queues the log messages; a writer thread appends them
+to the per job files through buffered file objects which stay open while
+the job is logging. Files are flushed every flush_interval seconds, so the
+web UI sees new lines within that delay, and optionally synced to disk
+every fsync_interval seconds.
+"""
+
+import errno
+import logging
+import os
+import Queue
+import threading
+import time
+
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+
+# Close the files of a job which has not logged for this many seconds
+FD_TIMEOUT = 60
+# Seconds between flushes of the buffered files
+FLUSH_INTERVAL = 1
+# Messages waiting for the writer thread
+QUEUE_SIZE = 10000
+# Buffer size of each log file
+BUFFER_SIZE = 64 * 1024
+
+
+def mkdir(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno == errno.EEXIST and os.path.isdir(path):
+            pass
+        else:
+            raise
+
+
+class JobLogWriter(object):
+    """
+    The open log files of one job: the pipeline log file of the current
+    level and name, and output.txt which holds the complete log.
+    """
+
+    def __init__(self, job_id, output_dir):
+        self.job_id = job_id
+        self.output_dir = output_dir
+        self.filename = None
+        self.fd = None  # pylint: disable=invalid-name
+        self.output = None
+        self.last_usage = time.time()
+
+    def _open(self, path):
+        mkdir(os.path.dirname(path))
+        return open(path, 'a+', BUFFER_SIZE)
+
+    def write(self, level, name, message):
+        filename = "%s/job-%s/pipeline/%s/%s-%s.log" % (self.output_dir,
+                                                        self.job_id, level.split('.')[0],
+                                                        level, name)
+        if filename != self.filename:
+            if self.fd:
+                self.fd.close()
+            path = os.path.join('/tmp', 'lava-dispatcher', 'jobs',
+                                self.job_id, filename)
+            self.fd = self._open(path)
+            self.filename = filename
+        if self.output is None:
+            # FIXME: to be removed when the web UI knows how to deal with
+            # pipeline logs
+            self.output = self._open(os.path.join(
+                self.output_dir, "job-%s" % self.job_id, 'output.txt'))
+        self.fd.write(message)
+        self.fd.write('\n')
+        self.output.write(message)
+        self.output.write('\n')
+        self.last_usage = time.time()
+
+    def flush(self, sync=False):
+        for fd in (self.fd, self.output):  # pylint: disable=invalid-name
+            if fd:
+                fd.flush()
+                if sync:
+                    os.fsync(fd.fileno())
+
+    def close(self):
+        for fd in (self.fd, self.output):  # pylint: disable=invalid-name
+            if fd:
+                fd.close()
+        self.fd = None
+        self.output = None
+
+
+class LogSink(threading.Thread):
+    """
+    Writer thread for the pipeline job logs.
+    The queue is bounded: the dispatcher-master checks full() and stops
+    reading the log socket until the writer catches up, so that a chatty
+    job applies back pressure on the slaves instead of delaying the
+    handling of the other messages.
+    """
+
+    def __init__(self, output_dir, logger=None, maxsize=QUEUE_SIZE,
+                 flush_interval=FLUSH_INTERVAL, fsync_interval=None):
+        super(LogSink, self).__init__(name='log-sink')
+        self.daemon = True
+        self.output_dir = output_dir
+        self.logger = logger or logging.getLogger('dispatcher-master')
+        self.queue = Queue.Queue(maxsize)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.writers = {}
+        self._last_flush = time.time()
+        self._last_sync = time.time()
+
+    def put(self, job_id, level, name, message):
+        """
+        Queue a log message, blocking if the queue is full.
+        """
+        self.queue.put((job_id, level, name, message))
+
+    def full(self):
+        return self.queue.full()
+
+    def stop(self):
+        """
+        Write the queued messages, close all the files and wait for the
+        thread to finish.
+        """
+        self.queue.put(None)
+        self.join()
+
+    def _write(self, item):
+        (job_id, level, name, message) = item
+        if job_id not in self.writers:
+            self.logger.info("[%s] Receiving logs from a new job", job_id)
+            self.writers[job_id] = JobLogWriter(job_id, self.output_dir)
+        try:
+            self.writers[job_id].write(level, name, message)
+        except (IOError, OSError) as exc:
+            self.logger.error("[%s] Unable to write the logs: %s", job_id, exc)
+
+    def _housekeeping(self):
+        now = time.time()
+        if now - self._last_flush < self.flush_interval:
+            return
+        sync = self.fsync_interval is not None and now - self._last_sync >= self.fsync_interval
+        for job_id in self.writers.keys():
+            writer = self.writers[job_id]
+            try:
+                if now - writer.last_usage > FD_TIMEOUT:
+                    self.logger.info("[%s] Collecting file handler '%s'",
+                                     job_id, writer.filename)
+                    writer.close()
+                    del self.writers[job_id]
+                else:
+                    writer.flush(sync)
+            except (IOError, OSError) as exc:
+                self.logger.error("[%s] Unable to write the logs: %s", job_id, exc)
+        self._last_flush = now
+        if sync:
+            self._last_sync = now
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except Queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                self._write(item)
+            self._housekeeping()
+        for writer in self.writers.values():
+            writer.flush(self.fsync_interval is not None)
+            writer.close()
+        self.writers = {}
@@ -0,0 +1,174 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Shared tail of the logs of the running jobs.
+
+The browsers following a running job ask for the end of its log again and
+again. Rather than each request opening and reading the log file, a single
+watcher thread of the web server process reads what was appended to the
+logs being followed into a bounded buffer per log. The requests wait on
+that buffer until the log grows (long polling), so any number of viewers
+of a job cost one reader.
+"""
+
+import os
+import threading
+import time
+
+# Bytes of the end of a log kept in memory
+LOG_TAIL_BUFFER = 1024 * 1024
+# Seconds between two checks of the size of the logs
+LOG_TAIL_INTERVAL = 0.5
+# Logs without viewers for this many seconds are no longer followed
+LOG_TAIL_IDLE = 120
+
+
+class LogTail(object):
+    """
+    The end of a log file, in complete lines, shared by the requests
+    following the log.
+    """
+
+    _tails = {}
+    _lock = threading.Lock()
+    _watcher = None
+
+    def __init__(self, path, max_size=LOG_TAIL_BUFFER):
+        self.path = path
+        self.max_size = max_size
+        self.condition = threading.Condition()
+        self.last_access = time.time()
+        # buffer holds the bytes from start to end of the file
+        self.start = 0
+        self.end = 0
+        self.buffer = ''
+        # values derived from the buffer by the readers, reset when it grows
+        self.cache = {}
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        self.start = self.end = max(0, size - max_size)
+        self.poll()
+        if self.start:
+            # start on a line
+            cut = self.buffer.find('\n') + 1
+            self.buffer = self.buffer[cut:]
+            self.start += cut
+
+    @classmethod
+    def get(cls, path):
+        """
+        :return: the tail of the log, followed until it has no viewer
+        """
+        with cls._lock:
+            tail = cls._tails.get(path)
+            if tail is None:
+                tail = cls._tails[path] = cls(path)
+            tail.last_access = time.time()
+            if cls._watcher is None or not cls._watcher.is_alive():
+                cls._watcher = threading.Thread(target=cls._watch, name='log-tail')
+                cls._watcher.daemon = True
+                cls._watcher.start()
+        return tail
+
+    @classmethod
+    def _watch(cls):
+        while True:
+            time.sleep(LOG_TAIL_INTERVAL)
+            with cls._lock:
+                now = time.time()
+                for path, tail in cls._tails.items():
+                    if now - tail.last_access > LOG_TAIL_IDLE:
+                        del cls._tails[path]
+                tails = list(cls._tails.values())
+            for tail in tails:
+                tail.poll()
+
+    def poll(self):
+        """
+        Read the lines appended to the log file and wake up the readers.
+        """
+        try:
+            with open(self.path, 'rb') as log:
+                log.seek(self.end)
+                data = log.read()
+        except IOError:
+            return
+        # only complete lines are shared
+        data = data[:data.rfind('\n') + 1]
+        if not data:
+            return
+        with self.condition:
+            self.buffer += data
+            self.end += len(data)
+            if len(self.buffer) > self.max_size:
+                cut = self.buffer.find('\n', len(self.buffer) - self.max_size) + 1
+                self.buffer = self.buffer[cut:]
+                self.start += cut
+            self.cache = {}
+            self.condition.notify_all()
+
+    def read(self, start, timeout):
+        """
+        Wait until the log grows after start, or the timeout.
+        :return: the data from start and the offset of the end of the data
+        """
+        self.last_access = time.time()
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.end <= start:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return '', max(start, self.end)
+                self.condition.wait(remaining)
+            if start >= self.start:
+                return self.buffer[start - self.start:], self.end
+            end = self.end
+        # older than the buffer
+        with open(self.path, 'rb') as log:
+            log.seek(start)
+            return log.read(end - start), end
+
+    def cached(self, key, function):
+        """
+        Share a value computed from the buffer between the readers, for
+        instance the log messages parsed from the same offset.
+
+        The value is computed without holding the lock of the tail, so
+        that the watcher thread is not held up by a slow computation. The
+        other readers asking for the same key wait for the value.
+        """
+        while True:
+            with self.condition:
+                entry = self.cache.get(key)
+                if entry is None:
+                    entry = self.cache[key] = {'done': threading.Event()}
+                    break
+            entry['done'].wait()
+            if 'value' in entry:
+                return entry['value']
+            # the computation failed, try again
+        try:
+            entry['value'] = function()
+        finally:
+            if 'value' not in entry:
+                with self.condition:
+                    if self.cache.get(key) is entry:
+                        del self.cache[key]
+            entry['done'].set()
+        return entry['value']
@@ -18,7 +18,6 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
-import errno
 import fcntl
 import jinja2
 import logging
@@ -26,6 +25,7 @@ from optparse import make_option
 import os
 import signal
 import time
+import psycopg2
 import yaml
 import zmq
 
@@ -33,8 +33,10 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
 from lava_scheduler_app.models import Device, TestJob, JobPipeline
+from lava_scheduler_app.notify import SchedulerListener
+from lava_scheduler_app.logsink import LogSink
 from lava_results_app.models import TestSuite
-from lava_results_app.dbutils import map_scanned_results, map_metadata
+from lava_results_app.dbutils import ResultsQueue, map_metadata, scan_results
 from lava_dispatcher.pipeline.device import PipelineDevice
 from lava_dispatcher.pipeline.parser import JobParser
 from lava_dispatcher.pipeline.action import JobError
@@ -44,25 +46,22 @@ from lava_dispatcher.pipeline.action import JobError
 
 
 # TODO constants to move into external files
-FD_TIMEOUT = 60
 TIMEOUT = 10
+# Poll timeout (in ms) while the log sink is catching up
+LOG_BUSY_TIMEOUT = 100
+# Log messages read from the socket in one go
+LOG_BATCH = 100
 DB_LIMIT = 10
+# When the database notifies scheduling events, only poll at this interval
+DB_FALLBACK = 120
+# Interval (in seconds) between two reports of the results scanning cost
+SCAN_STATS_INTERVAL = 300
 
 # TODO: share this value with dispatcher-slave
 # This should be 3 times the slave ping timeout
 DISPATCHER_TIMEOUT = 3 * 10
 
 
-def mkdir(path):
-    try:
-        os.makedirs(path)
-    except OSError as exc:
-        if exc.errno == errno.EEXIST and os.path.isdir(path):
-            pass
-        else:
-            raise
-
-
 class SlaveDispatcher(object):  # pylint: disable=too-few-public-methods
 
     def __init__(self, hostname, online=False):
@@ -74,17 +73,6 @@ class SlaveDispatcher(object):  # pylint: disable=too-few-public-methods
         self.last_msg = time.time()
 
 
-class FileHandler(object):  # pylint: disable=too-few-public-methods
-
-    def __init__(self, name, path):
-        self.filename = name
-        self.fd = open(path, 'a+')  # pylint: disable=invalid-name
-        self.last_usage = time.time()
-
-    def close(self):
-        self.fd.close()
-
-
 def create_job(job, device):
     # FIXME check the incoming device status
     job.actual_device = device
@@ -320,6 +308,9 @@ class Command(BaseCommand):
     """
     logger = None
     help = "LAVA dispatcher master"
+    # Results messages scanned and the time (in seconds) spent parsing them
+    scan_count = 0
+    scan_time = 0.0
     option_list = BaseCommand.option_list + (
         make_option('--master-socket',
                     default='tcp://*:5556',
@@ -343,6 +334,9 @@ class Command(BaseCommand):
         make_option('--output-dir',
                     default='/var/lib/lava-server/default/media/job-output',
                     help="Directory where to store job outputs"),
+        make_option('--log-fsync',
+                    default=None, type='float',
+                    help="Interval in seconds between fsync of the job logs (default: never)"),
     )
 
     def _cancel_slave_dispatcher_jobs(self, hostname):
@@ -368,6 +362,31 @@ class Command(BaseCommand):
                 self.logger.info("[%d] Canceling", job.id)
                 cancel_job(job)
 
+    def _handle_log(self, msg, log_sink, results):
+        (job_id, level, name, message) = msg
+
+        # Only the messages of the results logger are parsed
+        start = time.time()
+        try:
+            scanned = scan_results(message)
+        except yaml.YAMLError:
+            self.logger.error("Failed to scan: %s", message)
+            scanned = None
+        if scanned is not None:
+            self.scan_count += 1
+            self.scan_time += time.time() - start
+            ret = results.add(job_id, scanned)
+            if not ret:
+                self.logger.warning("[%s] Unable to map scanned results: %s" % (job_id, yaml.dump(scanned)))
+
+        # Clear filename
+        if '/' in level or '/' in name:
+            self.logger.error("[%s] Wrong level or name received, dropping the message", job_id)
+            return
+
+        # n.b. logging here would produce a log entry for every message in every job.
+        log_sink.put(job_id, level, name, message)
+
     def handle(self, *args, **options):
         # FIXME: this function is getting much too long and complex.
         del logging.root.handlers[:]
@@ -393,13 +412,21 @@ class Command(BaseCommand):
         controler = context.socket(zmq.ROUTER)
         controler.bind(options['master_socket'])
 
-        # List of logs
-        logs = {}
+        # Job logs are written by a separate thread
+        log_sink = LogSink(options['output_dir'], self.logger,
+                           fsync_interval=options['log_fsync'])
+        log_sink.start()
+        # Results are written to the database in batches
+        results = ResultsQueue()
         # List of known dispatchers. At startup do not laod this from the
         # database. This will help to know if the slave as restarted or not.
         dispatchers = {}
         # Last access to the database for new jobs and cancelations
         last_db_access = 0
+        last_scan_stats = time.time()
+        # Set when the database notified a submission, cancelation or
+        # device state transition since the last access.
+        db_event = False
 
         # Poll on the sockets (only one for the moment). This allow to have a
         # nice timeout along with polling.
@@ -418,13 +445,29 @@ class Command(BaseCommand):
         signal.signal(signal.SIGTERM, lambda x, y: None)
         signal.signal(signal.SIGQUIT, lambda x, y: None)
         poller.register(pipe_r, zmq.POLLIN)
+
+        # Wait for scheduling events from the database, polling the
+        # database is then only a fallback.
+        listener = SchedulerListener()
+        listener_fd = None
+        if listener.connect():
+            listener_fd = listener.fileno()
+            poller.register(listener_fd, zmq.POLLIN)
+            db_limit = DB_FALLBACK
+        else:
+            listener = None
+            db_limit = DB_LIMIT
         self.logger.info("[INIT] LAVA dispatcher-master has started.")
 
         while True:
             try:
+                # Stop reading the logs while the log sink is catching up, the
+                # messages are kept by zmq, without delaying the commands.
+                log_busy = log_sink.full()
+                poller.register(pull_socket, 0 if log_busy else zmq.POLLIN)
                 # TODO: Fix the timeout computation
                 # Wait for data or a timeout
-                sockets = dict(poller.poll(TIMEOUT * 1000))
+                sockets = dict(poller.poll(LOG_BUSY_TIMEOUT if log_busy else TIMEOUT * 1000))
             except zmq.error.ZMQError:
                 continue
 
@@ -432,80 +475,32 @@ class Command(BaseCommand):
                 self.logger.info("[POLL] Received a signal, leaving")
                 break
 
+            # Database events
+            if listener and sockets.get(listener_fd) == zmq.POLLIN:
+                try:
+                    if listener.drain():
+                        db_event = True
+                except psycopg2.Error as exc:
+                    self.logger.warning("[POLL] Lost the database listener, polling every %ds: %s",
+                                        DB_LIMIT, exc)
+                    poller.unregister(listener_fd)
+                    listener.close()
+                    listener = None
+                    db_limit = DB_LIMIT
+                    db_event = True
+
             # Logging socket
             if sockets.get(pull_socket) == zmq.POLLIN:
-                msg = pull_socket.recv_multipart()
-                (job_id, level, name, message) = msg
-
-                try:
-                    scanned = yaml.load(message)
-                except yaml.YAMLError:
-                    self.logger.error("Failed to scan: %s", message)
-                    scanned = None
-                # the results logger wraps the OrderedDict in a dict called results, for identification,
-                # YAML then puts that into a list of one item for each call to log.results.
-                if type(scanned) is list and len(scanned) == 1:
-                    if type(scanned[0]) is dict and 'results' in scanned[0]:
-                        job = TestJob.objects.get(id=job_id)
-                        ret = map_scanned_results(scanned_dict=scanned[0], job=job)
-                        if not ret:
-                            self.logger.warning("[%s] Unable to map scanned results: %s" % (job_id, yaml.dump(scanned[0])))
-
-                # Clear filename
-                if '/' in level or '/' in name:
-                    self.logger.error("[%s] Wrong level or name received, dropping the message", job_id)
-                    continue
-                filename = "%s/job-%s/pipeline/%s/%s-%s.log" % (options['output_dir'],
-                                                                job_id, level.split('.')[0],
-                                                                level, name)
-
-                # Find the handler (if available)
-                f_handler = None
-                if job_id in logs:
-                    if filename != logs[job_id].filename:
-                        # Close the old file handler
-                        logs[job_id].close()
-
-                        path = os.path.join('/tmp', 'lava-dispatcher', 'jobs',
-                                            job_id, filename)
-                        mkdir(os.path.dirname(path))
-                        logs[job_id] = FileHandler(filename, path)
-                else:
-                    self.logger.info("[%s] Receiving logs from a new job", job_id)
-                    path = os.path.join('/tmp', 'lava-dispatcher', 'jobs',
-                                        job_id, filename)
-                    mkdir(os.path.dirname(path))
-                    logs[job_id] = FileHandler(filename, path)
-
-                # Mark the file handler as used
-                # TODO: try to use a more pythonnic way
-                logs[job_id].last_usage = time.time()
-
-                # n.b. logging here would produce a log entry for every message in every job.
-
-                # Write data
-                f_handler = logs[job_id].fd
-                f_handler.write(message)
-                f_handler.write('\n')
-                f_handler.flush()
-
-                # FIXME: to be removed when the web UI knows how to deal with
-                # pipeline logs
-                filename = os.path.join(options['output_dir'],
-                                        "job-%s" % job_id,
-                                        'output.txt')
-                with open(filename, 'a+') as f_out:
-                    f_out.write(message)
-                    f_out.write('\n')
-
-            # Garbage collect file handlers
-            now = time.time()
-            for job_id in logs.keys():
-                if now - logs[job_id].last_usage > FD_TIMEOUT:
-                    self.logger.info("[%s] Collecting file handler '%s'",
-                                     job_id, logs[job_id].filename)
-                    logs[job_id].close()
-                    del logs[job_id]
+                for _ in range(LOG_BATCH):
+                    try:
+                        msg = pull_socket.recv_multipart(zmq.NOBLOCK)
+                    except zmq.error.Again:
+                        break
+                    self._handle_log(msg, log_sink, results)
+                    if log_sink.full():
+                        break
+            if results.expired():
+                results.flush()
 
             # Command socket
             if sockets.get(controler) == zmq.POLLIN:
@@ -580,6 +575,7 @@ class Command(BaseCommand):
                         status = TestJob.INCOMPLETE
                     else:
                         self.logger.info("[%d] %s => END", job_id, hostname)
+                    results.forget(job_id)
                     try:
                         with transaction.atomic():
                             job = TestJob.objects.select_for_update() \
@@ -641,10 +637,15 @@ class Command(BaseCommand):
                     # TODO: DB: mark the dispatcher as offline and attached
                     # devices
 
+            if now - last_scan_stats > SCAN_STATS_INTERVAL:
+                last_scan_stats = now
+                self.logger.info("Results scanned: %d in %.3fs", self.scan_count, self.scan_time)
+
             # Limit accesses to the database. This will also limit the rate of
             # CANCEL and START messages
-            if now - last_db_access > DB_LIMIT:
+            if db_event or now - last_db_access > db_limit:
                 last_db_access = now
+                db_event = False
                 # Dispatch jobs
                 # TODO: make this atomic
                 not_allocated = 0
@@ -768,7 +769,12 @@ class Command(BaseCommand):
                                               'CANCEL', str(job.id)])
 
         # Closing sockets and droping messages.
+        self.logger.info("Writing the queued logs")
+        results.flush()
+        log_sink.stop()
         self.logger.info("Closing the socket and dropping messages")
+        if listener:
+            listener.close()
         controler.close(linger=0)
         pull_socket.close(linger=0)
         context.term()
@@ -46,6 +46,7 @@ class Command(SchedulerCommand):
         from lava_scheduler_daemon.service import JobQueue
         from lava_scheduler_daemon.worker import WorkerData
         from lava_scheduler_daemon.dbjobsource import DatabaseJobSource
+        from lava_scheduler_app.notify import SchedulerListener
         import xmlrpclib
 
         daemon_options = self._configure(options)
@@ -71,6 +72,7 @@ class Command(SchedulerCommand):
 
         # Start scheduler service.
         service = JobQueue(
-            source, dispatcher, reactor, daemon_options=daemon_options)
+            source, dispatcher, reactor, daemon_options=daemon_options,
+            listener=SchedulerListener())
         reactor.callWhenRunning(service.startService)
         reactor.run()
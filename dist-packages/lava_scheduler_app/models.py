@@ -23,6 +23,8 @@ from django.core.exceptions import (
 from django.core.mail import send_mail
 from django.core.validators import validate_email
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404
@@ -36,6 +38,13 @@ from dashboard_app.models import Bundle, BundleStream
 
 from lava_dispatcher.job import validate_job_data
 from lava_scheduler_app import utils
+from lava_scheduler_app.logfile_helper import DispatcherErrors
+from lava_scheduler_app.notify import (
+    notify_scheduler,
+    SUBMITTED,
+    CANCELING,
+    DEVICE,
+)
 
 from linaro_django_xmlrpc.models import AuthToken
 
@@ -862,6 +871,57 @@ class Device(RestrictedResource):
                     None, "Job submission failed for health job for %s: %s" % (self, e))
                 raise JSONDataError("Health check job submission failed for %s: %s" % (self, e))
 
+    @classmethod
+    def initiate_health_check_jobs(cls, devices):
+        """
+        Submits health checks for a batch of devices.
+        The first device of each device type goes through
+        initiate_health_check_job, so the health check job of that type is
+        validated once. The jobs for the other devices of the type are
+        copies of that job, retargeted and created with a single bulk insert.
+        Exclusive devices and health checks using tags are submitted one
+        at a time as those depend on the device.
+        :param devices: Device objects without a queued or running health check.
+        :return: the number of health check jobs submitted.
+        """
+        logger = logging.getLogger('lava_scheduler_app')
+        submitted = 0
+        by_type = {}
+        for device in devices:
+            by_type.setdefault(device.device_type_id, []).append(device)
+        for type_devices in by_type.values():
+            template = None
+            copies = []
+            for device in type_devices:
+                if template is None or device.is_exclusive:
+                    try:
+                        job = device.initiate_health_check_job()
+                    except JSONDataError as exc:
+                        # the device has been put into maintenance mode.
+                        logger.warning("%s", exc)
+                        continue
+                    if job is None:
+                        continue
+                    submitted += 1
+                    if template is None:
+                        # a template with tags is never copied
+                        template = job if not job.tags.exists() else False
+                    continue
+                if template is False:
+                    try:
+                        if device.initiate_health_check_job():
+                            submitted += 1
+                    except JSONDataError as exc:
+                        logger.warning("%s", exc)
+                    continue
+                copies.append(template.health_check_copy(device))
+            if copies:
+                TestJob.objects.bulk_create(copies)
+                submitted += len(copies)
+                # bulk_create does not send post_save
+                notify_scheduler(SUBMITTED)
+        return submitted
+
     def load_device_configuration(self, job_ctx=None):
         """
         Maps the DeviceDictionary to the static templates in /etc/.
@@ -1522,6 +1582,22 @@ class TestJob(RestrictedResource):
         else:
             return None
 
+    def dispatcher_errors(self, complete=None):
+        """
+        The errors reported by the dispatcher in the log of the job, kept
+        in a file next to the log and extended as the log grows.
+        :param complete: the log will not change anymore, by default once
+        the job is finished.
+        :return: list of errors or None if the log is not available
+        """
+        output_path = os.path.join(self.output_dir, 'output.txt')
+        if not os.path.exists(output_path):
+            return None
+        if complete is None:
+            complete = self.status not in [TestJob.SUBMITTED, TestJob.RUNNING,
+                                           TestJob.CANCELING]
+        return DispatcherErrors.open(output_path, complete).errors
+
     def archived_job_file(self):
         """Checks if the current job's log output file was archived.
         """
@@ -2005,6 +2081,24 @@ class TestJob(RestrictedResource):
                 job.tags.add(tag)
             return job
 
+    def health_check_copy(self, device):
+        """
+        An unsaved copy of this health check job, targeted at another
+        device of the same type.
+        """
+        definition = simplejson.loads(self.definition)
+        definition['target'] = device.hostname
+        original = simplejson.loads(self.original_definition)
+        original['target'] = device.hostname
+        return TestJob(
+            definition=simplejson.dumps(definition, sort_keys=True, indent=4 * ' '),
+            original_definition=simplejson.dumps(original, sort_keys=True, indent=4 * ' '),
+            submitter=self.submitter, requested_device=device,
+            requested_device_type=self.requested_device_type,
+            description=self.description, health_check=True,
+            user=self.user, group=self.group, is_public=self.is_public,
+            priority=self.priority)
+
     def _can_admin(self, user):
         """ used to check for things like if the user can cancel or annotate
         a job failure
@@ -2305,3 +2399,24 @@ class DeviceStateTransition(models.Model):
     def update_message(self, message):
         self.message = message
         self.save()
+
+
+@receiver(post_save, sender=TestJob)
+def testjob_notify_scheduler(sender, instance, created, **kwargs):
+    """
+    Wake the schedulers when a job is submitted or needs to be canceled.
+    """
+    if created:
+        notify_scheduler(SUBMITTED)
+    elif instance.status == TestJob.CANCELING:
+        notify_scheduler(CANCELING)
+
+
+@receiver(post_save, sender=DeviceStateTransition)
+def device_notify_scheduler(sender, instance, created, **kwargs):
+    """
+    Every change of Device.status goes through state_transition_to
+    and creates a DeviceStateTransition.
+    """
+    if created:
+        notify_scheduler(DEVICE)
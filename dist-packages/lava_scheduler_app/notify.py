@@ -0,0 +1,124 @@
+# Copyright (C) 2016 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Scheduling events over PostgreSQL LISTEN/NOTIFY.
+
+TestJob submission and cancellation and every Device state transition send
+a NOTIFY on the scheduler channel. PostgreSQL only delivers the notification
+once the sending transaction commits, so a listener woken up by an event
+always sees the change in the database. Identical notifications sent within
+one transaction are folded into one.
+
+Other database engines have no notification support: notify_scheduler
+does nothing and SchedulerListener.connect() returns False, leaving the
+daemons to poll the database as before.
+"""
+
+import logging
+import select
+
+from django.db import connection, connections
+
+CHANNEL = 'lava_scheduler'
+
+# payloads
+SUBMITTED = 'submitted'
+CANCELING = 'canceling'
+DEVICE = 'device'
+
+
+def notify_scheduler(event):
+    """
+    Wake up the scheduler daemon and the dispatcher-master once the
+    current transaction commits.
+    :param event: one of SUBMITTED, CANCELING or DEVICE
+    """
+    if connection.vendor != 'postgresql':
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, event])
+    finally:
+        cursor.close()
+
+
+class SchedulerListener(object):
+    """
+    A dedicated autocommit connection listening on the scheduler channel.
+    fileno() can be watched with select, a zmq.Poller or the twisted
+    reactor; once readable, drain() returns the pending events.
+    """
+
+    def __init__(self, alias='default'):
+        self.logger = logging.getLogger('lava_scheduler_app.notify')
+        self.alias = alias
+        self.conn = None
+
+    def connect(self):
+        """
+        :return: True if the listener is active, False if the database
+            cannot send notifications and the caller needs to poll.
+        """
+        wrapper = connections[self.alias]
+        if wrapper.vendor != 'postgresql':
+            self.logger.info("%s database: polling for scheduler events", wrapper.vendor)
+            return False
+        import psycopg2
+        import psycopg2.extensions
+        try:
+            self.conn = psycopg2.connect(**wrapper.get_connection_params())
+            self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cursor = self.conn.cursor()
+            cursor.execute("LISTEN %s;" % CHANNEL)
+            cursor.close()
+        except psycopg2.Error as exc:
+            self.logger.warning("Unable to listen for scheduler events: %s", exc)
+            self.close()
+            return False
+        self.logger.info("Listening for scheduler events on %s", CHANNEL)
+        return True
+
+    @property
+    def active(self):
+        return self.conn is not None and not self.conn.closed
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def drain(self):
+        """
+        Read all pending notifications without blocking.
+        :return: list of event payloads, possibly empty.
+        """
+        self.conn.poll()
+        events = [notify.payload for notify in self.conn.notifies]
+        del self.conn.notifies[:]
+        return events
+
+    def wait(self, timeout):
+        """
+        Block until an event arrives or the timeout (in seconds) expires.
+        :return: list of event payloads, empty on timeout.
+        """
+        if select.select([self.conn], [], [], timeout) == ([], [], []):
+            return []
+        return self.drain()
+
+    def close(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
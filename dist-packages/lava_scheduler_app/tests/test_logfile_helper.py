@@ -0,0 +1,155 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lava_scheduler_app.logfile_helper import (
+    DispatcherErrors,
+    formatLogFile,
+    getDispatcherErrors,
+    LogSectionIndex,
+)
+
+# pylint: disable=invalid-name
+
+
+LOG = (
+    'console line\n'
+    '<LAVA_DISPATCHER>2016-01-01 10:00:00 AM INFO: start\n'
+    'Traceback (most recent call last):\n'
+    '  File "job.py", line 1\n'
+    'ValueError: boom\n'
+    'Traceback (most recent call last):\n'
+    'RuntimeError\n'
+    'caf\xc3\xa9\r\n'
+    'lava_dispatcher.job\n'
+)
+
+
+class TestLogSectionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.output_dir, 'output.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _write(self, data, mode='wb'):
+        with open(self.path, mode) as log:
+            log.write(data)
+
+    def test_sections(self):
+        self._write(LOG)
+        index = LogSectionIndex.open(self.path)
+        expected = formatLogFile(io.StringIO(LOG.decode('utf-8')))
+        self.assertEqual(expected, index.read())
+        self.assertEqual(['console', 'log', 'traceback', 'traceback', 'console', 'log'],
+                         [section[0] for section in index.sections])
+        self.assertTrue(os.path.exists(self.path + '.sections'))
+
+    def test_incremental(self):
+        self._write(LOG[:60])
+        index = LogSectionIndex.open(self.path)
+        # the partial last line is not indexed
+        self.assertEqual(LOG.rfind('\n', 0, 60) + 1, index.size)
+        self._write(LOG[60:], 'ab')
+        index = LogSectionIndex.open(self.path)
+        self.assertEqual(len(LOG), index.size)
+        self.assertEqual(formatLogFile(io.StringIO(LOG.decode('utf-8'))), index.read())
+        # the sections added since an offset
+        start = LOG.index('caf')
+        self.assertEqual([('console', 1, u'caf\xe9\n'), ('log', 1, 'lava_dispatcher.job\n')],
+                         index.read(start=start))
+
+    def test_complete(self):
+        self._write('console line\nlast')
+        self.assertEqual(13, LogSectionIndex.open(self.path).size)
+        index = LogSectionIndex.open(self.path, complete=True)
+        self.assertEqual([('console', 2, 'console line\nlast')], index.read())
+        # the partial last line is not saved
+        self.assertEqual(13, LogSectionIndex.open(self.path).size)
+        self._write(' line\n', 'ab')
+        index = LogSectionIndex.open(self.path, complete=True)
+        self.assertEqual([('console', 2, 'console line\nlast line\n')], index.read())
+
+    def test_replaced_log(self):
+        self._write(LOG)
+        LogSectionIndex.open(self.path)
+        self._write('short\n')
+        self.assertEqual([('console', 1, 'short\n')], LogSectionIndex.open(self.path).read())
+
+    def test_pages(self):
+        self._write(LOG)
+        index = LogSectionIndex.open(self.path)
+        self.assertEqual([0], index.pages(len(LOG)))
+        self.assertEqual(range(len(index.sections)), index.pages(1))
+        pages = index.pages(60)
+        sections = []
+        for first, last in zip(pages, pages[1:] + [None]):
+            sections.extend(index.read(first, last))
+        self.assertEqual(index.read(), sections)
+
+
+ERRORS_LOG = (
+    'console line\n'
+    '<LAVA_DISPATCHER>2016-01-01 10:00:00 AM ERROR: Bootloader Error: no prompt\n'
+    'Kernel Error: caf\xc3\xa9\n'
+    '<LAVA_DISPATCHER>2016-01-01 10:00:01 AM ERROR: Bootloader Error: no prompt\n'
+    'OperationFailed: Infrastructure Error: timeout\n'
+)
+
+
+class TestDispatcherErrors(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.output_dir, 'output.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _write(self, data, mode='wb'):
+        with open(self.path, mode) as log:
+            log.write(data)
+
+    def test_errors(self):
+        self._write(ERRORS_LOG)
+        errors = DispatcherErrors.open(self.path).errors
+        self.assertEqual([u'Bootloader Error: no prompt\n',
+                          u'Kernel Error: caf\xe9\n',
+                          u'Infrastructure Error: timeout\n',
+                          u'OperationFailed: Infrastructure Error: timeout\n'],
+                         errors)
+        # the same errors as the scan of the whole log
+        ascii_log = ERRORS_LOG.decode('utf-8').replace(u'caf\xe9', u'cafe')
+        self.assertEqual(sorted([error.replace(u'caf\xe9', u'cafe') for error in errors]),
+                         sorted(getDispatcherErrors(io.StringIO(ascii_log))))
+        self.assertTrue(os.path.exists(self.path + '.errors'))
+
+    def test_incremental(self):
+        self._write(ERRORS_LOG[:50])
+        self.assertEqual([], DispatcherErrors.open(self.path).errors)
+        self._write(ERRORS_LOG[50:], 'ab')
+        errors = DispatcherErrors(self.path)
+        self.assertTrue(errors.load())
+        self.assertEqual(ERRORS_LOG.index('\n') + 1, errors.size)
+        self.assertTrue(errors.update())
+        self.assertEqual(4, len(errors.errors))
+
+    def test_duplicates_after_load(self):
+        self._write(ERRORS_LOG)
+        errors = DispatcherErrors.open(self.path).errors
+        # a repeated error is kept at its first appearance
+        self._write('Bootloader Error: no prompt\n', 'ab')
+        self.assertEqual(errors, DispatcherErrors.open(self.path).errors)
+
+    def test_partial_error(self):
+        self._write('console line\nInfrastructure Error: time')
+        self.assertEqual([u'Infrastructure Error: time'],
+                         DispatcherErrors.open(self.path, complete=True).errors)
+        # the rest of the line was still buffered by the writer of the log
+        self._write('out\n', 'ab')
+        self.assertEqual([u'Infrastructure Error: timeout\n'],
+                         DispatcherErrors.open(self.path, complete=True).errors)
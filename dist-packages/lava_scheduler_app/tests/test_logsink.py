@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lava_scheduler_app.logsink import LogSink
+
+# pylint: disable=invalid-name
+
+
+class TestLogSink(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _read(self, *path):
+        with open(os.path.join(self.output_dir, *path)) as log:
+            return log.read()
+
+    def test_write_and_stop(self):
+        sink = LogSink(self.output_dir)
+        sink.start()
+        sink.put('1', '1.1', 'deploy', 'first')
+        sink.put('2', '1', 'boot', 'other job')
+        sink.put('1', '1.1', 'deploy', 'second')
+        sink.put('1', '2.1', 'boot', 'third')
+        sink.stop()
+        self.assertEqual('first\nsecond\n', self._read('job-1', 'pipeline', '1', '1.1-deploy.log'))
+        self.assertEqual('third\n', self._read('job-1', 'pipeline', '2', '2.1-boot.log'))
+        self.assertEqual('first\nsecond\nthird\n', self._read('job-1', 'output.txt'))
+        self.assertEqual('other job\n', self._read('job-2', 'output.txt'))
+        self.assertEqual({}, sink.writers)
+
+    def test_flush_interval(self):
+        sink = LogSink(self.output_dir, flush_interval=0, fsync_interval=0)
+        sink._write(('3', '1', 'test', 'line'))  # pylint: disable=protected-access
+        sink._housekeeping()  # pylint: disable=protected-access
+        self.assertEqual('line\n', self._read('job-3', 'output.txt'))
+        sink.writers['3'].close()
+
+    def test_bounded_queue(self):
+        sink = LogSink(self.output_dir, maxsize=2)
+        sink.put('4', '1', 'test', 'one')
+        self.assertFalse(sink.full())
+        sink.put('4', '1', 'test', 'two')
+        self.assertTrue(sink.full())
+        sink.start()
+        sink.stop()
+        self.assertEqual('one\ntwo\n', self._read('job-4', 'output.txt'))
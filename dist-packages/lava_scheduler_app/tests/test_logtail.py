@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lava_scheduler_app.logtail import LogTail
+
+# pylint: disable=invalid-name,protected-access
+
+
+class TestLogTail(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.output_dir, 'output.txt')
+        self._write('first\n', 'wb')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _write(self, data, mode='ab'):
+        with open(self.path, mode) as log:
+            log.write(data)
+
+    def test_read(self):
+        tail = LogTail(self.path)
+        self.assertEqual(('first\n', 6), tail.read(0, 0))
+        self.assertEqual(('', 6), tail.read(6, 0))
+        self._write('second\nthi')
+        tail.poll()
+        # only the complete lines
+        self.assertEqual(('second\n', 13), tail.read(6, 0))
+        self._write('rd\n')
+        tail.poll()
+        self.assertEqual(('ond\nthird\n', 19), tail.read(9, 0))
+
+    def test_wait(self):
+        tail = LogTail(self.path)
+        result = []
+        readers = [threading.Thread(target=lambda: result.append(tail.read(6, 10)))
+                   for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        self._write('second\n')
+        tail.poll()
+        for reader in readers:
+            reader.join()
+        self.assertEqual([('second\n', 13)] * 3, result)
+
+    def test_bounded_buffer(self):
+        tail = LogTail(self.path, max_size=10)
+        self._write('second\nthird\n')
+        tail.poll()
+        self.assertEqual('third\n', tail.buffer)
+        self.assertEqual(13, tail.start)
+        # older data is read from the file
+        self.assertEqual(('first\nsecond\nthird\n', 19), tail.read(0, 0))
+
+    def test_shared(self):
+        tail = LogTail.get(self.path)
+        self.assertIs(tail, LogTail.get(self.path))
+        calls = []
+        for _ in range(2):
+            tail.cached(('messages', 0, 6), lambda: calls.append(1))
+        self.assertEqual([1], calls)
+        del LogTail._tails[self.path]
+
+    def test_cached_outside_lock(self):
+        tail = LogTail(self.path)
+        started = threading.Event()
+        release = threading.Event()
+        result = []
+
+        def parse():
+            started.set()
+            release.wait(10)
+            return 'messages'
+
+        readers = [threading.Thread(target=lambda: result.append(tail.cached('key', parse)))
+                   for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        started.wait(10)
+        # the watcher can poll during the computation
+        self._write('second\n')
+        tail.poll()
+        self.assertEqual('first\nsecond\n', tail.buffer)
+        release.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(['messages', 'messages'], result)
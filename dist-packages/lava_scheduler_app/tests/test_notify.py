@@ -0,0 +1,58 @@
+import unittest
+from django.db import connection
+from lava_scheduler_app.models import (
+    Device,
+    TestJob,
+)
+from lava_scheduler_app.notify import (
+    SchedulerListener,
+    SUBMITTED,
+    CANCELING,
+    DEVICE,
+)
+from lava_scheduler_app.tests.test_submission import TransactionTestCaseWithFactory
+
+# pylint: disable=invalid-name
+
+
+class TestSchedulerListener(TransactionTestCaseWithFactory):
+    """
+    Notifications are only delivered on commit, so these tests need
+    real transactions.
+    """
+
+    def setUp(self):
+        super(TestSchedulerListener, self).setUp()
+        self.listener = SchedulerListener()
+        if not self.listener.connect():
+            self.skipTest("%s database does not notify events" % connection.vendor)
+
+    def tearDown(self):
+        self.listener.close()
+        super(TestSchedulerListener, self).tearDown()
+
+    def test_submission_event(self):
+        self.factory.make_testjob()
+        self.assertIn(SUBMITTED, self.listener.wait(5))
+
+    def test_cancel_event(self):
+        job = self.factory.make_testjob()
+        self.listener.wait(5)
+        job.status = TestJob.RUNNING
+        job.save()
+        self.assertEqual([], self.listener.wait(0))
+        job.cancel()
+        self.assertIn(CANCELING, self.listener.wait(5))
+
+    def test_device_event(self):
+        device = self.factory.make_device(hostname='notify01')
+        device.state_transition_to(Device.OFFLINE)
+        self.assertIn(DEVICE, self.listener.wait(5))
+
+
+class TestPollingFallback(unittest.TestCase):
+
+    def test_other_databases_poll(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest("postgresql supports notifications")
+        self.assertFalse(SchedulerListener().connect())
@@ -117,6 +117,9 @@ urlpatterns = patterns(
     url(r'^job/(?P<pk>[0-9]+)/log_incremental$',
         'job_log_incremental',
         name='lava.scheduler.job.log_incremental'),
+    url(r'^job/(?P<pk>[0-9]+)/log_tail$',
+        'job_log_tail',
+        name='lava.scheduler.job.log_tail'),
     url(r'^job/(?P<pk>[0-9]+)/full_log_incremental$',
         'job_full_log_incremental',
         name='lava.scheduler.job.full_log_incremental'),
@@ -8,6 +8,7 @@ import datetime
 import urllib2
 from dateutil.relativedelta import relativedelta
 from django import forms
+from django.conf import settings
 
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
@@ -49,8 +50,10 @@ from lava_server.bread_crumbs import (
 from lava_scheduler_app.logfile_helper import (
     formatLogFile,
     getDispatcherErrors,
-    getDispatcherLogMessages
+    getDispatcherLogMessages,
+    LogSectionIndex,
 )
+from lava_scheduler_app.logtail import LogTail
 from lava_scheduler_app.models import (
     Device,
     DeviceType,
@@ -1304,7 +1307,9 @@ def job_detail(request, pk):
                 "lava_scheduler_app/job.html", data, RequestContext(request))
 
         if not job.failure_comment:
-            job_errors = getDispatcherErrors(job.output_file())
+            job_errors = job.dispatcher_errors()
+            if job_errors is None:
+                job_errors = getDispatcherErrors(job.output_file())
             if len(job_errors) > 0:
                 msg = job_errors[-1]
                 if msg != "ErrorMessage: None":
@@ -1526,11 +1531,28 @@ def job_log_file(request, pk):
         job_file_size = f.tell()
 
     size_warning = 0
+    content = None
+    log_size = job_file_size
+    pages = [0]
+    page = 1
     if job_file_size >= job.size_limit:
         size_warning = job.size_limit
-        content = None
     else:
-        content = formatLogFile(job.output_file())
+        index = _log_section_index(job)
+        if index is None:
+            content = formatLogFile(job.output_file())
+        else:
+            pages = index.pages(LOG_PAGE_SIZE)
+            # running jobs are followed on the last page
+            default_page = len(pages) if job.status == TestJob.RUNNING else 1
+            try:
+                page = int(request.GET.get('page', default_page))
+            except ValueError:
+                return HttpResponseBadRequest("invalid page")
+            page = min(max(page, 1), len(pages))
+            last = pages[page] if page < len(pages) else None
+            content = index.read(pages[page - 1], last)
+            log_size = index.size
 
     return render_to_response(
         "lava_scheduler_app/job_log_file.html",
@@ -1540,6 +1562,11 @@ def job_log_file(request, pk):
             'job': TestJob.objects.get(pk=pk),
             'job_file_present': bool(log_file),
             'sections': content,
+            'first_section': pages[page - 1],
+            'page': page,
+            'page_count': len(pages),
+            'is_last_page': page == len(pages),
+            'log_size': log_size,
             'size_warning': size_warning,
             'job_file_size': job_file_size,
             'bread_crumb_trail': BreadCrumbTrail.leading_to(job_log_file, pk=pk),
@@ -1575,19 +1602,73 @@ def job_log_incremental(request, pk):
     return response
 
 
+def job_log_tail(request, pk):
+    """
+    Long poll for the log of a running job: the request waits until the log
+    grows after the start offset, for at most LOG_TAIL_TIMEOUT seconds,
+    reading the log from the tail shared by all the viewers of the job.
+
+    With format=messages, the dispatcher log messages are returned as in
+    job_log_incremental, otherwise the new lines of the log.
+    """
+    try:
+        start = int(request.GET.get('start', 0))
+    except ValueError:
+        return HttpResponseBadRequest("invalid start")
+    job = get_restricted_job(request.user, pk)
+    path = os.path.join(job.output_dir, 'output.txt')
+    if not os.path.exists(path):
+        raise Http404
+    tail = None
+    is_finished = job.status not in [TestJob.RUNNING, TestJob.CANCELING]
+    if is_finished:
+        # the end of the log, including a last line without newline
+        with open(path, 'rb') as log_file:
+            log_file.seek(start)
+            content = log_file.read()
+        size = start + len(content)
+    else:
+        tail = LogTail.get(path)
+        content, size = tail.read(start, getattr(settings, 'LOG_TAIL_TIMEOUT', LOG_TAIL_TIMEOUT))
+    if request.GET.get('format') == 'messages':
+
+        def parse():
+            return getDispatcherLogMessages(StringIO.StringIO(content))
+
+        if tail is not None:
+            # the viewers following the job ask for the same messages
+            m = tail.cached(('messages', start, size), parse)
+        else:
+            m = parse()
+        response = HttpResponse(
+            simplejson.dumps(m), content_type='application/json')
+    else:
+        response = HttpResponse(content, content_type='text/plain; charset=utf-8')
+    response['X-Current-Size'] = str(size)
+    if is_finished:
+        response['X-Is-Finished'] = '1'
+    return response
+
+
 def job_full_log_incremental(request, pk):
     start = int(request.GET.get('start', 0))
     job = get_restricted_job(request.user, pk)
-    log_file = job.output_file()
-    log_file.seek(start)
-    new_content = log_file.read()
-    nl_index = new_content.rfind('\n', -NEWLINE_SCAN_SIZE)
-    if nl_index >= 0:
-        new_content = new_content[:nl_index + 1]
-    m = formatLogFile(StringIO.StringIO(new_content))
+    index = _log_section_index(job)
+    if index is not None:
+        m = index.read(start=start)
+        size = max(start, index.size)
+    else:
+        log_file = job.output_file()
+        log_file.seek(start)
+        new_content = log_file.read()
+        nl_index = new_content.rfind('\n', -NEWLINE_SCAN_SIZE)
+        if nl_index >= 0:
+            new_content = new_content[:nl_index + 1]
+        m = formatLogFile(StringIO.StringIO(new_content))
+        size = start + len(new_content)
     response = HttpResponse(
         simplejson.dumps(m), content_type='application/json')
-    response['X-Current-Size'] = str(start + len(new_content))
+    response['X-Current-Size'] = str(size)
     if job.status not in [TestJob.RUNNING, TestJob.CANCELING]:
         response['X-Is-Finished'] = '1'
     return response
@@ -1595,6 +1676,24 @@ def job_full_log_incremental(request, pk):
 
 LOG_CHUNK_SIZE = 512 * 1024
 NEWLINE_SCAN_SIZE = 80
+# Seconds a request following a running job waits for the log to grow, by
+# default. Each waiting request holds a web server worker, see the
+# LOG_TAIL_TIMEOUT setting.
+LOG_TAIL_TIMEOUT = 3
+# Bytes of log sections shown in a page of the complete log
+LOG_PAGE_SIZE = 2 * 1024 * 1024
+
+
+def _log_section_index(job):
+    """
+    :return: the up to date section index of the log of the job, or None
+    if the log is not in output.txt
+    """
+    path = os.path.join(job.output_dir, 'output.txt')
+    if not os.path.exists(path):
+        return None
+    return LogSectionIndex.open(
+        path, complete=job.status not in [TestJob.RUNNING, TestJob.CANCELING])
 
 
 def job_output(request, pk):
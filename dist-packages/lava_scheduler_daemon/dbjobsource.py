@@ -28,15 +28,18 @@ from lava_scheduler_app.models import (
     Device,
     TestJob,
     TemporaryDevice,
-    JSONDataError,
 )
 from lava_scheduler_app import utils
 from lava_scheduler_daemon.worker import WorkerData
 from lava_scheduler_daemon.jobsource import IJobSource
+from lava_scheduler_daemon.matcher import JobMatcher
 
 
 MAX_RETRIES = 3
 
+# health checks queued or running at once
+MAX_HEALTH_CHECKS = 20
+
 
 try:
     from psycopg2 import InterfaceError, OperationalError
@@ -58,7 +61,8 @@ def find_device_for_job(job, device_list):
     allowed to run non-pipeline jobs.
 
     Note: with a large queue and a lot of devices, this function can be a
-    significant delay.
+    significant delay. The scheduler uses the JobMatcher which applies the
+    same rules to an index of the idle devices.
     """
     if job.dynamic_connection:
         # secondary connection, the "host" has a real device
@@ -151,6 +155,7 @@ class DatabaseJobSource(object):
             self.my_devices = get_configured_devices
         else:
             self.my_devices = my_devices
+        self.matcher = JobMatcher()
 
     deferToThread = staticmethod(deferToThread)
 
@@ -195,35 +200,60 @@ class DatabaseJobSource(object):
                 self.logger.warn('retrying transaction %s', err)
                 continue
 
+    def _get_health_check_devices(self):
+        """
+        Devices which need a health check job, in a single query:
+        idle (or looping) devices of a type with a health check job, which
+        have no health check queued or running and which have either an
+        unknown health or no health check completed in the last day.
+        Devices with the oldest health check come first.
+        """
+        pending = TestJob.objects.filter(
+            health_check=True, status__in=[TestJob.SUBMITTED, TestJob.RUNNING])
+        devices = Device.objects.filter(
+            Q(status=Device.IDLE) | Q(status=Device.OFFLINE, health_status=Device.HEALTH_LOOPING))
+        devices = devices.exclude(device_type__health_check_job__isnull=True)
+        devices = devices.exclude(device_type__health_check_job='')
+        devices = devices.filter(
+            Q(health_status__in=[Device.HEALTH_UNKNOWN, Device.HEALTH_LOOPING]) |
+            Q(last_health_report_job__isnull=True) |
+            Q(last_health_report_job__end_time__isnull=True) |
+            Q(last_health_report_job__end_time__lt=timezone.now() - datetime.timedelta(days=1)))
+        devices = devices.exclude(hostname__in=pending.filter(
+            requested_device__isnull=False).values('requested_device'))
+        devices = devices.exclude(hostname__in=pending.filter(
+            actual_device__isnull=False).values('actual_device'))
+        devices = devices.select_related('device_type', 'last_health_report_job')
+        devices = list(devices)
+        devices.sort(key=self._last_health_check)
+        return devices
+
+    def _last_health_check(self, device):
+        job = device.last_health_report_job
+        if job and job.end_time:
+            return 1, job.end_time
+        return 0, None
+
     def _submit_health_check_jobs(self):
         """
         Checks which devices need a health check job and submits the needed
         health checks.
         Looping is only active once a device is offline.
+        Health checks are queued ahead of all other jobs, so no more than
+        MAX_HEALTH_CHECKS can be queued or running at once, otherwise a
+        health check sweep over the whole lab would hold up every user job.
         """
-
-        for device in Device.objects.filter(
-                Q(status=Device.IDLE) | Q(status=Device.OFFLINE, health_status=Device.HEALTH_LOOPING)):
-            if not device.device_type.health_check_job:
-                run_health_check = False
-            elif device.health_status == Device.HEALTH_UNKNOWN:
-                run_health_check = True
-            elif device.health_status == Device.HEALTH_LOOPING:
-                run_health_check = True
-            elif not device.last_health_report_job:
-                run_health_check = True
-            elif not device.last_health_report_job.end_time:
-                run_health_check = True
-            else:
-                run_health_check = device.last_health_report_job.end_time < \
-                    timezone.now() - datetime.timedelta(days=1)
-
-            if run_health_check:
-                try:
-                    device.initiate_health_check_job()
-                except JSONDataError:
-                    # already logged, don't allow the daemon to fail.
-                    pass
+        devices = self._get_health_check_devices()
+        if not devices:
+            return
+        pending = TestJob.objects.filter(
+            health_check=True, status__in=[TestJob.SUBMITTED, TestJob.RUNNING]).count()
+        limit = max(MAX_HEALTH_CHECKS - pending, 0)
+        if len(devices) > limit:
+            self.logger.info("%d devices need a health check, submitting %d",
+                             len(devices), limit)
+        if limit:
+            Device.initiate_health_check_jobs(devices[:limit])
 
     def _get_job_queue(self):
         """
@@ -247,6 +277,9 @@ class DatabaseJobSource(object):
         jobs = jobs.filter(actual_device=None)
         jobs = jobs.order_by('-health_check', '-priority', 'submit_time',
                              'vm_group', 'target_group', 'id')
+        jobs = jobs.select_related(
+            'requested_device', 'requested_device_type', 'submitter')
+        jobs = jobs.prefetch_related('tags')
 
         if len(jobs):
             self.logger.info("Job queue length: %d", len(jobs))
@@ -263,8 +296,36 @@ class DatabaseJobSource(object):
         Forced health checks ignore this constraint.
         """
         devices = Device.objects.filter(status=Device.IDLE).order_by('is_public')
+        devices = devices.select_related('device_type').prefetch_related('tags')
         return devices
 
+    def _get_referenced_devices(self, hostnames):
+        """
+        Bulk lookup for _validate_idle_device.
+        :param hostnames: hostnames of the idle devices
+        :return: dict of each hostname to the list of active jobs referencing that device
+        """
+        referenced = dict((hostname, []) for hostname in hostnames)
+        jobs = TestJob.objects.filter(
+            status__in=[TestJob.RUNNING, TestJob.SUBMITTED, TestJob.CANCELING],
+            actual_device__in=hostnames)
+        for job in jobs:
+            referenced[job.actual_device_id].append(job)
+        return referenced
+
+    def _get_submit_token(self, user, tokens):
+        """
+        One AuthToken lookup per submitter per tick.
+        :param user: the submitter of the job
+        :param tokens: dict cache of user id to AuthToken
+        """
+        if user.id not in tokens:
+            token = AuthToken.objects.filter(user=user).first()
+            if not token:
+                token = AuthToken.objects.create(user=user)
+            tokens[user.id] = token
+        return tokens[user.id]
+
     def _validate_non_idle_devices(self, reserved_devices, idle_devices):
         """
         only check those devices which we *know* should have been changed
@@ -310,7 +371,7 @@ class DatabaseJobSource(object):
                 device.current_job = job
                 device.save(update_fields=['status', 'current_job'])
 
-    def _validate_idle_device(self, job, device):
+    def _validate_idle_device(self, job, device, referenced=None):
         """
         The problem here is that instances with a lot of devices would spend a lot of time
         refetching all of the device details every scheduler tick when it is only under
@@ -319,6 +380,8 @@ class DatabaseJobSource(object):
         get() evaluates immediately.
         :param job: job to have a device assigned
         :param device: device to refresh and check
+        :param referenced: optional result of _get_referenced_devices for this tick,
+            the database is queried for the devices which are not in it
         :return: True if device can be reserved
         """
         # FIXME: do this properly in the dispatcher master.
@@ -330,9 +393,13 @@ class DatabaseJobSource(object):
         else:
             device = Device.objects.get(hostname=device.hostname)
         # to be valid for reservation, no queued TestJob can reference this device
-        jobs = TestJob.objects.filter(
-            status__in=[TestJob.RUNNING, TestJob.SUBMITTED, TestJob.CANCELING],
-            actual_device=device)
+        # (a forced health check uses an OFFLINE device, which was not looked up)
+        if referenced is not None and device.hostname in referenced:
+            jobs = referenced[device.hostname]
+        else:
+            jobs = TestJob.objects.filter(
+                status__in=[TestJob.RUNNING, TestJob.SUBMITTED, TestJob.CANCELING],
+                actual_device=device)
         if jobs:
             self.logger.warning(
                 "%s (which has current_job %s) is already referenced by %d jobs %s",
@@ -361,17 +428,18 @@ class DatabaseJobSource(object):
 
     def _assign_jobs(self):
         """
-        Check all jobs against all available devices and assign only if all conditions are met
-        This routine needs to remain fast, so has to manage local cache variables of device status but
-        still cope with a job queue over 1,000 and a device matrix of over 100. The main load is in
-        find_device_for_job as *all* jobs in the queue must be checked at each tick. (A job far back in
-        the queue may be the only job which exactly matches the most recent devices to become available.)
+        Check queued jobs against available devices and assign only if all conditions are met
+        This routine needs to remain fast and cope with a job queue over 1,000 and a device
+        matrix of over 100. The idle devices are indexed once per tick by the JobMatcher, which
+        remembers the jobs which could not be matched. Those jobs are only checked again once a
+        device they could use has changed state. (A job far back in the queue may be the only
+        job which exactly matches the most recent devices to become available.)
 
         When viewing the logs of these operations, the device will be Idle when Assigning to a Submitted
         job. That job may be for a device_type or a specific device (typically health checks use a specific
         device). The device will be Reserved when Assigned to a Submitted job on that device - the type will
         not be mentioned. The total number of assigned jobs and devices will be output at the end of each tick.
-        Finally, the reserved device is removed from the local cache of available devices.
+        Finally, the reserved device is removed from the index of available devices.
 
         Warnings are emitted if the device states are not as expected, before or after assignment.
         """
@@ -385,44 +453,53 @@ class DatabaseJobSource(object):
             return
         assigned_jobs = []
         reserved_devices = []
+        skipped = 0
+        tokens = {}
         # this takes a significant amount of time when under load, only do it once per tick
-        devices = list(self._get_available_devices())
+        self.matcher.refresh(self._get_available_devices())
+        self.matcher.prune(jobs)
+        referenced = self._get_referenced_devices(self.matcher.hostnames())
         # a forced health check can be assigned even if the device is not in the list of idle devices.
         for job in jobs:
-            device = find_device_for_job(job, devices)
-            if device:
-                if not self._validate_idle_device(job, device):
-                    self.logger.debug("Removing %s from the list of available devices",
-                                      str(device.hostname))
-                    devices.remove(device)
-                    continue
-                self.logger.info("Assigning %s for %s", device, job)
-                # avoid catching exceptions inside atomic (exceptions are slow too)
-                # https://docs.djangoproject.com/en/1.7/topics/db/transactions/#controlling-transactions-explicitly
-                if AuthToken.objects.filter(user=job.submitter).count():
-                    job.submit_token = AuthToken.objects.filter(user=job.submitter).first()
-                else:
-                    job.submit_token = AuthToken.objects.create(user=job.submitter)
-                try:
-                    # Make this sequence atomic
-                    with transaction.atomic():
-                        job.actual_device = device
-                        job.save()
-                        device.current_job = job
-                        # implicit device save in state_transition_to()
-                        device.state_transition_to(
-                            Device.RESERVED, message="Reserved for job %s" % job.display_id, job=job)
-                except IntegrityError:
-                    # Retry in the next call to _assign_jobs
-                    self.logger.warning(
-                        "Transaction failed for job %s, device %s", job.display_id, device.hostname)
-                assigned_jobs.append(job.id)
-                reserved_devices.append(device.hostname)
-                self.logger.info("Assigned %s to %s", device, job)
-                if device in devices:
-                    self.logger.debug("Removing %s from the list of available devices",
-                                      str(device.hostname))
-                    devices.remove(device)
+            if not self.matcher.needs_check(job):
+                skipped += 1
+                continue
+            device = self.matcher.match(job)
+            if not device:
+                self.matcher.unmatched(job)
+                continue
+            if not self._validate_idle_device(job, device, referenced):
+                self.logger.debug("Removing %s from the list of available devices",
+                                  str(device.hostname))
+                self.matcher.remove(device)
+                self.matcher.forget(job)
+                continue
+            self.logger.info("Assigning %s for %s", device, job)
+            # avoid catching exceptions inside atomic (exceptions are slow too)
+            # https://docs.djangoproject.com/en/1.7/topics/db/transactions/#controlling-transactions-explicitly
+            job.submit_token = self._get_submit_token(job.submitter, tokens)
+            try:
+                # Make this sequence atomic
+                with transaction.atomic():
+                    job.actual_device = device
+                    job.save()
+                    device.current_job = job
+                    # implicit device save in state_transition_to()
+                    device.state_transition_to(
+                        Device.RESERVED, message="Reserved for job %s" % job.display_id, job=job)
+            except IntegrityError:
+                # Retry in the next call to _assign_jobs
+                self.logger.warning(
+                    "Transaction failed for job %s, device %s", job.display_id, device.hostname)
+            assigned_jobs.append(job.id)
+            reserved_devices.append(device.hostname)
+            self.logger.info("Assigned %s to %s", device, job)
+            self.logger.debug("Removing %s from the list of available devices",
+                              str(device.hostname))
+            self.matcher.remove(device)
+            self.matcher.forget(job)
+        if skipped:
+            self.logger.debug("Skipped %d queued jobs with no newly available devices", skipped)
         # re-evaluate the devices query set using list() now that the job loop is complete
         devices = list(self._get_available_devices())
         postprocess = self._validate_non_idle_devices(reserved_devices, devices)
@@ -652,6 +729,14 @@ class DatabaseJobSource(object):
         self._commit_transaction(src='jobCompleted_impl')
         self.logger.info('job %s completed on %s', job.id, device.hostname)
 
+        if job.output_dir:
+            # summary of the errors shown on the job page and by the API,
+            # built once the device is released as it reads the whole log
+            try:
+                job.dispatcher_errors(complete=True)
+            except (IOError, OSError):
+                self.logger.exception("[%d] unable to read the job log", job.id)
+
         if utils.is_master():
             try:
                 job.send_summary_mails()
@@ -0,0 +1,229 @@
+import logging
+
+from lava_scheduler_app.models import (
+    Device,
+    TemporaryDevice,
+)
+
+# pylint: disable=no-self-use,too-many-instance-attributes
+
+
+# Changes to group membership or to a device dictionary do not show up in
+# the device signatures, so re-examine the whole queue every so many ticks.
+FULL_SCAN_INTERVAL = 30
+
+
+class JobMatcher(object):
+    """
+    In-memory matching of queued jobs to idle devices, kept by the
+    DatabaseJobSource across scheduler ticks.
+
+    The idle devices are indexed by device type and hostname once per tick.
+    Each device is reduced to a signature of everything which affects
+    matching (device type, tags, visibility, ownership, pipeline support and
+    current job), so comparing the signatures with those of the previous tick
+    shows which devices have changed state since then.
+
+    Jobs which could not be matched are remembered with the key they were
+    matched with: (device type, requested device, tags, submitter, ...).
+    Such a job is only examined again when its key changes or when a device
+    of the requested type (or the requested device itself) has become idle
+    or changed, so a long queue waiting on busy device types costs nothing.
+
+    The rules are those of find_device_for_job, applied to the index.
+    """
+
+    def __init__(self, full_scan_interval=FULL_SCAN_INTERVAL):
+        self.logger = logging.getLogger(__name__ + '.JobMatcher')
+        self.full_scan_interval = full_scan_interval
+        self.full_scan = True
+        self._ticks = 0
+        # state carried over between ticks
+        self._signatures = {}
+        self._unmatched = {}
+        self._dynamic = {}
+        self._exclusive = {}
+        # state rebuilt on each tick
+        self._order = {}
+        self._tags = {}
+        self._by_type = {}
+        self._by_hostname = {}
+        self._vm_groups = {}
+        self._permissions = {}
+        self._changed_types = set()
+        self._changed_hosts = set()
+
+    def _device_signature(self, device):
+        return (
+            device.device_type_id,
+            device.is_public,
+            device.is_pipeline,
+            device.user_id,
+            device.group_id,
+            device.current_job_id,
+            self._tags[device.hostname],
+        )
+
+    def _job_key(self, job):
+        return (
+            job.requested_device_type_id,
+            job.requested_device_id,
+            frozenset(tag.id for tag in job.tags.all()),
+            job.submitter_id,
+            job.is_pipeline,
+            job.vm_group,
+        )
+
+    def refresh(self, devices):
+        """
+        Rebuild the index from the idle devices, which must be ordered with
+        private devices first. Compares the devices with the previous tick
+        to find the device types and hostnames which need to be rechecked.
+        :param devices: iterable of idle Device objects, ideally with
+            device_type and tags already fetched.
+        """
+        self._ticks += 1
+        self.full_scan = (self._ticks - 1) % self.full_scan_interval == 0
+        signatures = {}
+        self._order = {}
+        self._tags = {}
+        self._by_type = {}
+        self._by_hostname = {}
+        self._permissions = {}
+        self._changed_types = set()
+        self._changed_hosts = set()
+        for position, device in enumerate(devices):
+            self._tags[device.hostname] = frozenset(tag.id for tag in device.tags.all())
+            signature = self._device_signature(device)
+            signatures[device.hostname] = signature
+            changed = self._signatures.get(device.hostname) != signature
+            if changed:
+                self._changed_types.add(device.device_type_id)
+                self._changed_hosts.add(device.hostname)
+                self._exclusive.pop(device.hostname, None)
+            if device.current_job_id:
+                # find_device_for_job refuses these devices too
+                if changed:
+                    self.logger.warning(
+                        "Refusing to reserve %s - current job is %s",
+                        device, device.current_job_id)
+                continue
+            self._order[device.hostname] = position
+            self._by_hostname[device.hostname] = device
+            self._by_type.setdefault(device.device_type_id, []).append(device)
+        self._signatures = signatures
+        if self.full_scan:
+            self._exclusive = {}
+        for hostname in self._exclusive.keys():
+            if hostname not in self._by_hostname:
+                del self._exclusive[hostname]
+        self._vm_groups = {}
+        if self._by_hostname:
+            self._vm_groups = dict(TemporaryDevice.objects.filter(
+                hostname__in=self._by_hostname.keys()).values_list('hostname', 'vm_group'))
+
+    def prune(self, jobs):
+        """
+        Forget about jobs which have left the queue since the previous tick.
+        :param jobs: the current job queue
+        """
+        queued = set(job.id for job in jobs)
+        for cache in (self._unmatched, self._dynamic):
+            for job_id in cache.keys():
+                if job_id not in queued:
+                    del cache[job_id]
+
+    def hostnames(self):
+        return self._by_hostname.keys()
+
+    def needs_check(self, job):
+        """
+        Health checks are always examined, they are few and can be assigned
+        to offline devices which are not part of the index.
+        :return: True if the job could match a device which it did not
+            match on the previous tick.
+        """
+        if self.full_scan or job.health_check:
+            return True
+        key = self._unmatched.get(job.id)
+        if key is None or key != self._job_key(job):
+            return True
+        return job.requested_device_type_id in self._changed_types or \
+            job.requested_device_id in self._changed_hosts
+
+    def _is_dynamic(self, job):
+        # a job definition does not change once submitted
+        if job.id not in self._dynamic:
+            self._dynamic[job.id] = job.dynamic_connection
+        return self._dynamic[job.id]
+
+    def _is_exclusive(self, device):
+        if device.hostname not in self._exclusive:
+            self._exclusive[device.hostname] = device.is_exclusive
+        return self._exclusive[device.hostname]
+
+    def _can_submit(self, device, user):
+        key = (device.hostname, user.id)
+        if key not in self._permissions:
+            self._permissions[key] = device.can_submit(user)
+        return self._permissions[key]
+
+    def _candidates(self, job):
+        candidates = list(self._by_type.get(job.requested_device_type_id, []))
+        if job.requested_device_id in self._by_hostname:
+            requested = self._by_hostname[job.requested_device_id]
+            if requested not in candidates:
+                candidates.append(requested)
+                candidates.sort(key=lambda device: self._order[device.hostname])
+        return candidates
+
+    def match(self, job):
+        """
+        Find an idle device for the job.
+        :param job: a queued TestJob
+        :return: a Device or None
+        """
+        if self._is_dynamic(job):
+            # secondary connection, the "host" has a real device
+            return None
+        # forced health check support
+        if job.health_check and job.requested_device:
+            if job.requested_device.status == Device.OFFLINE:
+                return job.requested_device
+        tags = frozenset(tag.id for tag in job.tags.all())
+        for device in self._candidates(job):
+            if job.is_pipeline and not device.is_pipeline:
+                continue
+            if not job.is_pipeline and self._is_exclusive(device):
+                continue
+            if job.is_vmgroup and device.hostname in self._vm_groups:
+                if job.vm_group != self._vm_groups[device.hostname]:
+                    continue
+            if not tags <= self._tags[device.hostname]:
+                continue
+            if self._can_submit(device, job.submitter):
+                return device
+        return None
+
+    def unmatched(self, job):
+        """
+        Record that no device could be found for this job on this tick.
+        """
+        self._unmatched[job.id] = self._job_key(job)
+
+    def forget(self, job):
+        """
+        Make sure the job is examined again on the next tick.
+        """
+        self._unmatched.pop(job.id, None)
+
+    def remove(self, device):
+        """
+        Take a device out of the index for the rest of this tick, either
+        because it has been reserved or because it failed validation.
+        The device counts as changed on the next tick if it is still idle.
+        """
+        device = self._by_hostname.pop(device.hostname, device)
+        if device in self._by_type.get(device.device_type_id, []):
+            self._by_type[device.device_type_id].remove(device)
+        self._signatures.pop(device.hostname, None)
@@ -17,29 +17,78 @@
 # along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import time
 import xmlrpclib
 
 from twisted.application.service import Service
 from twisted.internet import defer
+from twisted.internet.interfaces import IReadDescriptor
 from twisted.internet.task import LoopingCall
 
+from zope.interface import implements
+
 from lava_scheduler_app import utils
 from lava_scheduler_daemon.job import JobRunner, catchall_errback
 from lava_scheduler_daemon.worker import WorkerData
 
+# seconds between heartbeats, and between checks of the job queue
+# when no database notifications are available.
+TICK = 20
+# with database notifications, still check the queue at this interval
+# to pick up health checks which have become due.
+FALLBACK_TICK = 120
+# seconds to wait after a notification, to collect the other events of a
+# burst (e.g. the sub jobs of a multinode submission) into one check.
+NOTIFY_DELAY = 0.1
+
+
+class NotificationReader(object):
+    """
+    Feeds the events of a SchedulerListener into the twisted reactor.
+    """
+
+    implements(IReadDescriptor)
+
+    def __init__(self, listener, queue):
+        self.listener = listener
+        self.queue = queue
+
+    def fileno(self):
+        return self.listener.fileno()
+
+    def doRead(self):  # pylint: disable=invalid-name
+        try:
+            events = self.listener.drain()
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+        if events:
+            self.queue.notified(events)
+
+    def connectionLost(self, reason):  # pylint: disable=invalid-name
+        self.queue.listener_lost(reason)
+
+    def logPrefix(self):  # pylint: disable=invalid-name
+        return 'NotificationReader'
+
 
 class JobQueue(Service):
 
-    def __init__(self, source, dispatcher, reactor, daemon_options):
+    def __init__(self, source, dispatcher, reactor, daemon_options, listener=None):
         self.logger = logging.getLogger(__name__ + '.JobQueue')
         self.source = source
         self.dispatcher = dispatcher
         self.reactor = reactor
         self.daemon_options = daemon_options
-        self._check_job_call = LoopingCall(self._checkJobs)
+        self.listener = listener
+        self._reader = None
+        self._pending = None
+        self._checking = None
+        self._recheck = False
+        self._last_check = 0
+        self._check_job_call = LoopingCall(self._tick)
         self._check_job_call.clock = reactor
 
-    def _checkJobs(self):
+    def _heartbeat(self):
         # Update Worker Heartbeat
         #
         # NOTE: This will recide here till we finalize scheduler refactoring
@@ -55,9 +104,47 @@ class JobQueue(Service):
         except (xmlrpclib.Fault, xmlrpclib.ProtocolError) as err:
             worker.logger.error("Heartbeat update failed!")
 
+    def _tick(self):
+        self._heartbeat()
+        interval = FALLBACK_TICK if self._reader else TICK
+        if time.time() - self._last_check >= interval:
+            return self._checkJobs()
+
+    def _checkJobs(self):
+        self._pending = None
+        if self._checking:
+            # a check is already running, run another one once it completes
+            # so that the events received meanwhile are not missed.
+            self._recheck = True
+            return self._checking
+        self._last_check = time.time()
         self.logger.debug("Refreshing jobs")
-        return self.source.getJobList().addCallback(
+        self._checking = self.source.getJobList().addCallback(
             self._startJobs).addErrback(catchall_errback(self.logger))
+        self._checking.addBoth(self._checked)
+        return self._checking
+
+    def _checked(self, result):
+        self._checking = None
+        if self._recheck:
+            self._recheck = False
+            self.notified([])
+        return result
+
+    def notified(self, events):
+        """
+        Schedule a check of the job queue, events arriving in the
+        meantime are folded into the same check.
+        """
+        self.logger.debug("Scheduler events: %s", ", ".join(events))
+        if self._pending is None:
+            self._pending = self.reactor.callLater(NOTIFY_DELAY, self._checkJobs)
+
+    def listener_lost(self, reason):
+        self.logger.warning("Lost the scheduler event listener, polling every %ds: %s",
+                            TICK, reason)
+        self._reader = None
+        self.listener.close()
 
     def _startJobs(self, jobs):
         for job in jobs:
@@ -69,8 +156,18 @@ class JobQueue(Service):
 
     def startService(self):
         self.logger.info("\n\nLAVA Scheduler starting\n\n")
-        self._check_job_call.start(20)
+        if self.listener and self.listener.connect():
+            self._reader = NotificationReader(self.listener, self)
+            self.reactor.addReader(self._reader)
+        self._check_job_call.start(TICK)
 
     def stopService(self):
         self._check_job_call.stop()
+        if self._pending:
+            self._pending.cancel()
+            self._pending = None
+        if self._reader:
+            self.reactor.removeReader(self._reader)
+            self._reader = None
+            self.listener.close()
         return None
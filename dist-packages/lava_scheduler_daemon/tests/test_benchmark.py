@@ -0,0 +1,231 @@
+import logging
+import os
+import random
+import sys
+import time
+import unittest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from lava_scheduler_app.models import (
+    Device,
+    DeviceType,
+    TestJob,
+    Tag,
+)
+from lava_scheduler_daemon.dbjobsource import DatabaseJobSource
+from lava_scheduler_daemon.tests.base import DatabaseJobSourceTestEngine
+
+# pylint: disable=attribute-defined-outside-init,superfluous-parens,too-many-ancestors,no-self-use,no-member
+# pylint: disable=invalid-name,too-few-public-methods,too-many-arguments,protected-access
+
+logger = logging.getLogger()
+logger.level = logging.INFO  # change to DEBUG to see *all* output
+stream_handler = logging.StreamHandler(sys.stdout)
+logger.addHandler(stream_handler)
+
+# the phases of DatabaseJobSource.getJobList_impl, in order.
+# _validate_queue is called from within _assign_jobs, so the figures
+# for _assign_jobs include those of _validate_queue.
+PHASES = [
+    '_handle_cancelling_jobs',
+    '_submit_health_check_jobs',
+    '_validate_queue',
+    '_assign_jobs',
+]
+
+# the default synthetic lab when LAVA_BENCHMARK is set without values
+BENCHMARK_LAB = {
+    'types': 20,
+    'devices': 400,
+    'tags': 8,
+    'jobs': 3000,
+    'multinode': 50,
+    'vmgroups': 20,
+    'health': 5,
+    'ticks': 5,
+    'churn': 0.25,
+}
+
+
+def benchmark_parameters():
+    """
+    Read the size of the synthetic lab from the environment, e.g.
+    LAVA_BENCHMARK="devices=100,jobs=1000,ticks=3"
+    """
+    params = dict(BENCHMARK_LAB)
+    for item in os.environ.get('LAVA_BENCHMARK', '').split(','):
+        if '=' not in item:
+            continue
+        key, value = item.split('=', 1)
+        key = key.strip()
+        if key not in params:
+            raise ValueError("Unknown benchmark parameter: %s" % key)
+        params[key] = type(params[key])(value)
+    return params
+
+
+class SyntheticLab(object):
+    """
+    Builds a lab of device types, devices and queued jobs in the test
+    database using the ModelFactory of the scheduler tests.
+    A fixed seed gives the same lab on each run, so that tick figures
+    can be compared between revisions.
+    """
+
+    def __init__(self, factory, user, seed=0):
+        self.factory = factory
+        self.user = user
+        self.random = random.Random(seed)
+        self.device_types = []
+        self.devices = {}
+        self.tags = []
+        self.jobs = []
+
+    def build(self, types=3, devices=12, tags=4, jobs=40, multinode=2,
+              vmgroups=0, health=0, **kw):
+        """
+        :param types: number of device types
+        :param devices: number of devices, spread over the device types
+        :param tags: number of tags, each device gets a random subset
+        :param jobs: number of single node jobs to submit
+        :param multinode: number of two node multinode groups to submit
+        :param vmgroups: number of vm groups to submit (host and two vms)
+        :param health: number of device types with a health check job
+        :return: the list of hostnames in the lab
+        """
+        self.tags = [self.factory.ensure_tag('bench-tag-%d' % index) for index in range(tags)]
+        for index in range(types):
+            device_type = self.factory.make_device_type(name='bench-type-%d' % index)
+            if index < health:
+                device_type.health_check_job = self.factory.make_job_json(health_check='true')
+                device_type.save()
+            self.device_types.append(device_type)
+            self.devices[device_type.name] = []
+        for index in range(devices):
+            device_type = self.device_types[index % types]
+            device_tags = [tag for tag in self.tags if self.random.random() < 0.3]
+            device = self.factory.make_device(
+                device_type=device_type, tags=device_tags,
+                hostname='bench-%d-%04d' % (index % types, index))
+            self.devices[device_type.name].append(device)
+        for _ in range(jobs):
+            device_type = self.random.choice(self.device_types)
+            self.jobs.append(self.submit(
+                device_type=device_type.name, tags=self._job_tags(device_type)))
+        for _ in range(multinode):
+            client, server = self.random.choice(self.device_types), self.random.choice(self.device_types)
+            self.jobs.extend(self.submit(device_group=[
+                {"device_type": client.name, "count": 1, "role": "client"},
+                {"device_type": server.name, "count": 1, "role": "server"},
+            ]))
+        if vmgroups:
+            self.factory.ensure_device_type(name='kvm-arm')
+            self.factory.ensure_device_type(name='dynamic-vm')
+        for _ in range(vmgroups):
+            host = self.random.choice(self.device_types)
+            self.jobs.extend(self.submit(vm_group={
+                "host": {"device_type": host.name, "role": "host"},
+                "vms": [
+                    {"device_type": "kvm-arm", "role": "server"},
+                    {"device_type": "kvm-arm", "role": "client"},
+                ]
+            }))
+        return list(Device.objects.values_list('hostname', flat=True))
+
+    def _job_tags(self, device_type):
+        # only ask for tags which at least one device of the type supports
+        device = self.random.choice(self.devices[device_type.name])
+        return [tag.name for tag in device.tags.all() if self.random.random() < 0.5]
+
+    def submit(self, **kw):
+        job_definition = self.factory.make_job_json(**kw)
+        return TestJob.from_json_and_user(job_definition, self.user)
+
+
+class TickProfiler(object):
+    """
+    Records the wall time and the number of queries of each phase of
+    the scheduler tick by wrapping the phase methods of a DatabaseJobSource.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.ticks = []
+        for name in PHASES:
+            setattr(source, name, self._wrap(name, getattr(source, name)))
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kw):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.time()
+                try:
+                    return func(*args, **kw)
+                finally:
+                    record = self.ticks[-1].setdefault(name, [0.0, 0])
+                    record[0] += time.time() - start
+                    record[1] += len(queries)
+        return wrapper
+
+    def tick(self):
+        self.ticks.append({})
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            jobs = self.source.getJobList_impl()
+            self.ticks[-1]['total'] = [time.time() - start, len(queries)]
+        return jobs
+
+    def queries(self, tick, phase):
+        return self.ticks[tick].get(phase, [0.0, 0])[1]
+
+    def report(self):
+        lines = ["%-6s %-28s %10s %8s" % ('tick', 'phase', 'seconds', 'queries')]
+        for index, tick in enumerate(self.ticks):
+            for name in PHASES + ['total']:
+                if name in tick:
+                    lines.append("%-6d %-28s %10.3f %8d" % (index, name, tick[name][0], tick[name][1]))
+        return "\n".join(lines)
+
+
+class SchedulerTickBenchmark(DatabaseJobSourceTestEngine):
+
+    def restart(self, who):
+        self.report_start(who)
+        DeviceType.objects.all().delete()
+        Device.objects.all().delete()
+        TestJob.objects.all().delete()
+        Tag.objects.all().delete()
+        self.user = self.factory.make_user()
+
+    def run_lab(self, ticks=3, churn=0.0, **params):
+        lab = SyntheticLab(self.factory, self.user)
+        hostnames = lab.build(**params)
+        self.master = DatabaseJobSource(lambda: hostnames)
+        profiler = TickProfiler(self.master)
+        rand = random.Random(1)
+        for _ in range(ticks):
+            for job in profiler.tick():
+                self.job_started(job)
+            running = list(TestJob.objects.filter(status=TestJob.RUNNING))
+            for job in rand.sample(running, int(len(running) * churn)):
+                self.job_finished(job)
+        if 'DEBUG' in os.environ or 'LAVA_BENCHMARK' in os.environ:
+            logger.info("Scheduler ticks:\n%s", profiler.report())
+        return profiler
+
+    def test_tick_profile_small_lab(self):
+        profiler = self.run_lab(ticks=2)
+        for name in PHASES + ['total']:
+            self.assertIn(name, profiler.ticks[0])
+        queued = TestJob.objects.filter(status=TestJob.SUBMITTED).count()
+        self.assertTrue(queued)
+        # with no device changing state, the second tick must not
+        # cost a query per queued job.
+        self.assertLess(profiler.queries(1, '_assign_jobs'), queued)
+        self.cleanup(self.whoami())
+
+    @unittest.skipUnless('LAVA_BENCHMARK' in os.environ, "set LAVA_BENCHMARK to run the scheduler benchmark")
+    def test_benchmark_lab(self):
+        self.run_lab(**benchmark_parameters())
+        self.cleanup(self.whoami())
@@ -1,4 +1,5 @@
 import datetime
+import simplejson
 from django.utils import timezone
 
 from lava_scheduler_app.models import (
@@ -10,6 +11,7 @@ from lava_scheduler_app.models import (
     DevicesUnavailableException,
 )
 
+from lava_scheduler_daemon import dbjobsource
 from lava_scheduler_daemon.dbjobsource import DatabaseJobSource, find_device_for_job
 from lava_scheduler_daemon.tests.base import DatabaseJobSourceTestEngine
 from lava_scheduler_app.views import job_cancel
@@ -131,6 +133,37 @@ class DatabaseJobSourceTest(DatabaseJobSourceTestEngine):
         self.assertTrue(len(panda_jobs) > 0)
         self.assertTrue(all([job.actual_device is not None for job in panda_jobs]))
 
+    def test_health_check_batch(self):
+        """
+        health checks for devices of the same type are copies of one
+        validated job, each targeted at its own device.
+        """
+        self.panda.health_check_job = self.factory.make_job_json(health_check='true')
+        self.panda.save()
+        devices = self.master._get_health_check_devices()
+        self.assertEqual(
+            set(['panda01', 'panda02']),
+            set([device.hostname for device in devices if device.device_type == self.panda]))
+        self.master._submit_health_check_jobs()
+        self.assertEqual([], self.master._get_health_check_devices())
+        for hostname in ['panda01', 'panda02']:
+            job = TestJob.objects.get(health_check=True, requested_device__hostname=hostname)
+            self.assertEqual(hostname, simplejson.loads(job.definition)['target'])
+            self.assertEqual(TestJob.SUBMITTED, job.status)
+
+    def test_health_check_limit(self):
+        self.panda.health_check_job = self.factory.make_job_json(health_check='true')
+        self.panda.save()
+        limit = dbjobsource.MAX_HEALTH_CHECKS
+        dbjobsource.MAX_HEALTH_CHECKS = 1
+        try:
+            self.master._submit_health_check_jobs()
+            self.assertEqual(1, TestJob.objects.filter(health_check=True).count())
+            self.master._submit_health_check_jobs()
+            self.assertEqual(1, TestJob.objects.filter(health_check=True).count())
+        finally:
+            dbjobsource.MAX_HEALTH_CHECKS = limit
+
     def test_one_worker_does_not_mess_with_jobs_from_the_others(self):
         # simulate a worker with no devices configured
         worker = DatabaseJobSource(lambda: [])
@@ -341,6 +374,31 @@ class DatabaseJobSourceTest(DatabaseJobSourceTestEngine):
         self.assertEqual(self.panda01.status, Device.OFFLINE)
         self.assertEqual(self.panda02.status, Device.OFFLINE)
 
+    def test_offline_health_check_referenced(self):
+        """
+        A forced health check is not assigned to an OFFLINE device which
+        is still referenced by a running job.
+        """
+        self.panda.health_check_job = self.factory.make_job_json(health_check='true')
+        self.panda.save()
+        self.panda01.state_transition_to(Device.OFFLINE)
+        running = self.submit_job(device_type='panda')
+        running.status = TestJob.RUNNING
+        running.actual_device = self.panda01
+        running.save(update_fields=['status', 'actual_device'])
+        health_check = Device.initiate_health_check_job(self.panda01)
+
+        # only the idle devices are looked up in bulk
+        referenced = self.master._get_referenced_devices(['panda02'])
+        self.assertEqual({'panda02': []}, referenced)
+        self.assertFalse(self.master._validate_idle_device(health_check, self.panda01, referenced))
+        self.panda01 = Device.objects.get(hostname='panda01')  # reload
+        self.assertEqual(running, self.panda01.current_job)
+
+        self.scheduler_tick()
+        health_check = TestJob.objects.get(id=health_check.id)  # reload
+        self.assertIsNone(health_check.actual_device)
+
     def test_failed_health_check(self):
         """
         Incomplete health checks must take the device offline with a failed health status.
@@ -449,6 +507,43 @@ class DatabaseJobSourceTest(DatabaseJobSourceTestEngine):
         chosen_device = find_device_for_job(job, devices)
         self.assertEqual(self.black03, chosen_device)
 
+    def test_matcher_with_tags(self):
+        """
+        the JobMatcher applies the same rules as find_device_for_job
+        """
+        job = self.submit_job(device_type='beaglebone', tags=[
+            self.common_tag.name, self.unique_tag.name
+        ])
+        self.master.matcher.refresh(self.master._get_available_devices())
+        self.assertEqual(self.black02, self.master.matcher.match(job))
+
+        job = self.submit_job(device_type='beaglebone', tags=[
+            self.exclusion_tag.name
+        ])
+        self.assertEqual(self.black03, self.master.matcher.match(job))
+
+    def test_matcher_skips_unchanged_jobs(self):
+        """
+        a job which could not be matched is only checked again once a
+        device of the requested type has become available.
+        """
+        job1 = self.submit_job(device_type='panda')
+        self.submit_job(device_type='panda')
+        job3 = self.submit_job(device_type='panda')
+        self.scheduler_tick()
+        job3 = TestJob.objects.get(pk=job3.id)  # reload
+        self.assertIsNone(job3.actual_device)
+
+        self.master.matcher.refresh(self.master._get_available_devices())
+        self.master.matcher.full_scan = False
+        self.assertFalse(self.master.matcher.needs_check(job3))
+
+        self.job_finished(TestJob.objects.get(pk=job1.id))
+        self.scheduler_tick()
+        job3 = TestJob.objects.get(pk=job3.id)  # reload
+        self.assertEqual(job3.status, TestJob.RUNNING)
+        self.assertEqual(job3.actual_device.device_type, self.panda)
+
     def _test_basic_vm_groups_scheduling(self):
         self.factory.ensure_device_type(name='kvm-arm')
         self.factory.ensure_device_type(name='dynamic-vm')
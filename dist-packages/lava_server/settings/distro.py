@@ -233,6 +233,20 @@ LOGGING = {
 # set to false in /etc/lava-server/settings.conf to hide the Results menu
 PIPELINE = distro_settings.get_setting("PIPELINE", True)
 
+# bundle deserialization
+# set to true in /etc/lava-server/settings.conf to deserialize the submitted
+# bundles in the background, with the lava-server manage deserializer workers
+BUNDLE_DESERIALIZATION_ASYNC = distro_settings.get_setting("BUNDLE_DESERIALIZATION_ASYNC", False)
+
+# job log following
+# seconds a request following the log of a running job waits for the log to
+# grow, 0 to answer at once. Each waiting request holds a web server worker
+# (a mod_wsgi thread) for that long, so each browser following a job keeps
+# one worker busy most of the time: with a longer timeout, raise the number
+# of WSGI threads above the number of expected viewers, so that the UI and
+# the XML-RPC API are still served.
+LOG_TAIL_TIMEOUT = distro_settings.get_setting("LOG_TAIL_TIMEOUT", 3)
+
 # Load extensions
 loader.contribute_to_settings(locals(), distro_settings)
 
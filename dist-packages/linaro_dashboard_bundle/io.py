@@ -17,7 +17,11 @@
 # along with linaro-dashboard-bundle.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import base64
 import decimal
+import re
+import tempfile
+import uuid
 
 from json_schema_validator.schema import Schema
 from json_schema_validator.validator import Validator
@@ -238,3 +242,368 @@ class DocumentIO(object):
             raise DocumentFormatError(fmt)
         Validator.validate(schema, doc)
         return fmt
+
+
+class Base64Spool(object):
+    """
+    Decoded content of a large base64 string of a document, written to a
+    temporary file as the document is read.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self._escape = ''
+        self._base64 = ''
+
+    def write(self, text):
+        """
+        Decode a piece of the JSON text of the string
+        """
+        text = self._escape + text
+        self._escape = ''
+        index = text.rfind('\\', max(0, len(text) - 6))
+        if index >= 0:
+            run = index + 1 - len(text[:index + 1].rstrip('\\'))
+            length = 6 if text[index + 1:index + 2] == 'u' else 2
+            # keep an escape sequence cut by the end of the text
+            if run % 2 and len(text) - index < length:
+                text, self._escape = text[:index], text[index:]
+        if '\\' in text:
+            text = json.loads('"%s"' % text).encode('ascii')
+        data = self._base64 + ''.join(text.split())
+        end = len(data) - len(data) % 4
+        self._base64 = data[end:]
+        self._write(data[:end])
+
+    def _write(self, data):
+        content = base64.standard_b64decode(data)
+        self.file.write(content)
+        self.size += len(content)
+
+    def close(self):
+        """
+        Called at the end of the string, the file is then ready to be read.
+        """
+        if self._escape:
+            raise ValueError("Invalid escape sequence in spooled string")
+        if self._base64:
+            self._write(self._base64)
+            self._base64 = ''
+        self.file.seek(0)
+
+
+class DocumentStream(object):
+    """
+    Incremental reader of a document, for documents too large to be
+    loaded at once.
+
+    The test runs are read, checked and returned one at a time. The strings
+    of the "content" members of the attachments larger than spool_threshold
+    are not kept in memory but decoded into a Base64Spool, which replaces
+    the string in the test run. So the memory used is proportional to the
+    largest test run, without its attachments.
+
+    The stream has to be seekable, when the format of the document comes
+    after the test runs it is read in a first pass.
+    """
+
+    CHUNK_SIZE = 65536
+    SPOOL_MARKER = u'\x00spool:'
+    # text up to the next bracket, a string cut by the end of the buffer, a
+    # "content" or an "attachments" string. The strings are skipped whole.
+    FILLER = re.compile(r'(?:[^"{}\[\]]+|"(?!content"|attachments")[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+    NAMES = ['"content"', '"attachments"']
+    SCALAR = re.compile(r'[^,}\]\s]*')
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, stream, retain_order=True, spool_threshold=65536):
+        self.stream = stream
+        self.object_pairs_hook = DocumentIO._get_dict_impl(retain_order)
+        self.spool_threshold = spool_threshold
+        self._format = None
+        self._spools = []
+        # the markers of the spools are only valid in this stream
+        self._marker = u'%s%s:' % (self.SPOOL_MARKER, uuid.uuid4().hex)
+        self._rewind()
+
+    def _rewind(self):
+        self.stream.seek(0)
+        self.buffer = ''
+        self.pos = 0
+
+    def _fill(self):
+        data = self.stream.read(self.CHUNK_SIZE)
+        if not data:
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip the whitespace and return the next character, '' at the end
+        of the document.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError("Expecting %s at %r" % (" or ".join(chars), self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def _decode(self, text):
+        return json.loads(text, parse_float=decimal.Decimal, object_pairs_hook=self.object_pairs_hook)
+
+    def _read_string(self, mode='text'):
+        """
+        Read a string, the current character being the opening quote.
+
+        :param mode: 'text' to return the JSON text of the string, 'spool' to
+        return a Base64Spool when the string is larger than spool_threshold,
+        'skip' to discard it.
+        """
+        pieces = []
+        size = 0
+        spool = None
+        start = self.pos
+        pos = self.pos + 1
+        while True:
+            end = self.buffer.find('"', pos)
+            while end >= 0:
+                index = end - 1
+                while index >= 0 and self.buffer[index] == '\\':
+                    index -= 1
+                if (end - 1 - index) % 2 == 0:
+                    break
+                end = self.buffer.find('"', end + 1)
+            if end >= 0:
+                break
+            # keep the trailing backslashes, which may escape a quote
+            data = self.buffer[start:]
+            data = data[:len(data.rstrip('\\'))]
+            if spool is not None:
+                spool.write(data)
+            elif mode != 'skip':
+                pieces.append(data)
+                size += len(data)
+                if mode == 'spool' and size > self.spool_threshold:
+                    spool = Base64Spool()
+                    spool.write(''.join(pieces)[1:])
+                    pieces = None
+            self.buffer = self.buffer[start + len(data):]
+            self.pos = start = 0
+            if not self._fill():
+                raise ValueError("Unterminated string")
+            pos = 0
+        text = self.buffer[start:end]
+        self.pos = end + 1
+        if mode == 'skip':
+            return None
+        if spool is None and mode == 'spool' and size + len(text) > self.spool_threshold:
+            spool = Base64Spool()
+            text = (''.join(pieces) + text)[1:]
+        if spool is not None:
+            spool.write(text)
+            spool.close()
+            return spool
+        pieces.append(text)
+        return ''.join(pieces) + '"'
+
+    def _read_value(self, mode='text'):
+        """
+        Read a value.
+
+        :param mode: 'text' to return its JSON text, 'spool' to also spool the
+        large "content" strings of the attachments, which are replaced by a
+        marker in the text, 'skip' to discard it.
+        """
+        char = self._peek()
+        if char == '"':
+            return self._read_string('skip' if mode == 'skip' else 'text')
+        pieces = []
+        start = self.pos
+        if char not in '{[':
+            # a number, true, false or null
+            while True:
+                self.pos = self.SCALAR.match(self.buffer, self.pos).end()
+                pieces.append(self.buffer[start:self.pos])
+                if self.pos < len(self.buffer) or not self._fill():
+                    break
+                start = 0
+            return None if mode == 'skip' else ''.join(pieces)
+        depth = 0
+        # 'attachments' for the attachments arrays and 'attachment' for
+        # their objects, None for the other arrays and objects
+        path = []
+        # whether the next value is the one of an "attachments" member
+        attachments = False
+        while True:
+            end = self.FILLER.match(self.buffer, self.pos).end()
+            if self.buffer[self.pos:end].strip(self.WHITESPACE + ':'):
+                attachments = False
+            if end == len(self.buffer):
+                if mode != 'skip':
+                    pieces.append(self.buffer[start:])
+                self.buffer = ''
+                self.pos = start = 0
+                if not self._fill():
+                    raise ValueError("Unexpected end of document")
+                continue
+            char = self.buffer[end]
+            if char != '"':
+                self.pos = end + 1
+                if char == '[':
+                    path.append('attachments' if attachments else None)
+                elif char == '{':
+                    path.append('attachment' if path and path[-1] == 'attachments' else None)
+                else:
+                    path.pop()
+                attachments = False
+                if char in '{[':
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 0:
+                    break
+                continue
+            # a string cut by the end of the buffer, a "content" or an
+            # "attachments" string
+            name = [name for name in self.NAMES if self.buffer.startswith(name, end)]
+            if name:
+                self.pos = end + len(name[0])
+                string = name[0]
+            else:
+                if mode != 'skip':
+                    pieces.append(self.buffer[start:end])
+                self.pos = end
+                string = self._read_string('skip' if mode == 'skip' else 'text')
+                if string is not None:
+                    pieces.append(string)
+                start = self.pos
+            attachments = False
+            if mode == 'spool' and string == '"attachments"':
+                # _peek() may refill the buffer, keep the text read so far
+                pieces.append(self.buffer[start:self.pos])
+                attachments = self._peek() == ':'
+                start = self.pos
+            elif mode == 'spool' and string == '"content"' and path[-1] == 'attachment':
+                pieces.append(self.buffer[start:self.pos])
+                if self._peek() == ':':
+                    self.pos += 1
+                    pieces.append(':')
+                    if self._peek() == '"':
+                        string = self._read_string('spool')
+                        if isinstance(string, Base64Spool):
+                            pieces.append(json.dumps(u'%s%d' % (self._marker, len(self._spools))))
+                            self._spools.append(string)
+                        else:
+                            pieces.append(string)
+                start = self.pos
+        if mode != 'skip':
+            pieces.append(self.buffer[start:self.pos])
+            return ''.join(pieces)
+
+    def _members(self, test_runs=True):
+        """
+        Iterate over the members of the document.
+
+        :param test_runs: if False, the test runs are skipped
+        :return: generator of (key, decoded value), except for the array of
+        the test runs which gives ("test_run", JSON text) for each test run.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+        else:
+            while True:
+                if self._peek() != '"':
+                    self._expect('"')
+                key = self._decode(self._read_string())
+                self._expect(':')
+                if key == 'test_runs' and self._peek() == '[':
+                    self.pos += 1
+                    yield 'test_runs', []
+                    if self._peek() == ']':
+                        self.pos += 1
+                    else:
+                        while True:
+                            if test_runs:
+                                yield 'test_run', self._read_value('spool')
+                            else:
+                                self._read_value('skip')
+                            if self._expect(',]') == ']':
+                                break
+                else:
+                    yield key, self._decode(self._read_value())
+                if self._expect(',}') == '}':
+                    break
+        if self._peek():
+            raise ValueError("Extra data after the document")
+
+    def format(self):
+        """
+        :return: the format of the document
+        :raises DocumentFormatError: if the format is not known
+        """
+        if self._format is None:
+            for key, value in self._members(test_runs=False):
+                if key == 'format':
+                    self._format = value
+                    break
+            self._rewind()
+        if self._format not in DocumentIO.SCHEMAS:
+            raise DocumentFormatError(self._format)
+        return self._format
+
+    def _unspool(self, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                value[key] = self._unspool(item)
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                value[index] = self._unspool(item)
+        elif isinstance(value, basestring) and value.startswith(self._marker):
+            return self._spools[int(value[len(self._marker):])]
+        return value
+
+    def test_runs(self):
+        """
+        Read and check the test runs of the document, one at a time.
+
+        The spooled attachments of a test run are removed when the next
+        test run is read.
+
+        :raises ValueError: when the text is not a correct JSON document.
+        :raises json_schema_validator.errors.ValidationError: when a test run,
+        or the rest of the document, does not match the schema.
+        """
+        schema = DocumentIO.SCHEMAS[self.format()]
+        doc = {}
+        try:
+            for key, value in self._members():
+                if key != 'test_run':
+                    doc[key] = value
+                    continue
+                test_run = self._decode(value)
+                Validator.validate(schema, dict(doc, format=self._format, test_runs=[test_run]))
+                if self._spools:
+                    self._unspool(test_run)
+                yield test_run
+                self._close_spools()
+        finally:
+            self._close_spools()
+        Validator.validate(schema, doc)
+
+    def _close_spools(self):
+        for spool in self._spools:
+            spool.file.close()
+        self._spools = []
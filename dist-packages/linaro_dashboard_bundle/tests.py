@@ -20,6 +20,7 @@
 Unit tests for DocumentLoader
 """
 
+import base64
 from StringIO import StringIO
 from decimal import Decimal
 from json_schema_validator.errors import ValidationError
@@ -30,7 +31,7 @@ from testtools import TestCase
 
 from linaro_dashboard_bundle.errors import DocumentFormatError
 from linaro_dashboard_bundle.evolution import DocumentEvolution
-from linaro_dashboard_bundle.io import DocumentIO
+from linaro_dashboard_bundle.io import Base64Spool, DocumentIO, DocumentStream
 
 
 class DocumentIOLoadTests(TestCase):
@@ -196,6 +197,110 @@ class DocumentIOCheckTests(TestCase):
         self.assertRaises(ValidationError, DocumentIO.check, doc)
 
 
+class DocumentStreamTests(TestCase):
+
+    def stream(self, text, **kwargs):
+        stream = DocumentStream(StringIO(text), **kwargs)
+        # small reads, to cut the strings and the values
+        stream.CHUNK_SIZE = 7
+        return stream
+
+    def test_test_runs_are_the_loaded_test_runs(self):
+        text = resource_string(
+            'linaro_dashboard_bundle',
+            'test_documents/everything_in_one_bundle_1.7.1.json')
+        fmt, doc = DocumentIO.loads(text)
+        stream = self.stream(text)
+        self.assertEqual(stream.format(), fmt)
+        self.assertEqual(list(stream.test_runs()), doc["test_runs"])
+
+    def test_format_after_test_runs(self):
+        text = '{"test_runs": [], "format": "Dashboard Bundle Format 1.0"}'
+        stream = self.stream(text)
+        self.assertEqual(stream.format(), "Dashboard Bundle Format 1.0")
+        self.assertEqual(list(stream.test_runs()), [])
+
+    def test_unknown_format_raises_DocumentFormatError(self):
+        stream = self.stream('{"format": "Bad Format", "test_runs": []}')
+        self.assertRaises(DocumentFormatError, stream.format)
+
+    def test_malformed_document_raises_ValueError(self):
+        stream = self.stream('{"format": "Dashboard Bundle Format 1.0", "test_runs": [{')
+        self.assertRaises(ValueError, list, stream.test_runs())
+
+    def test_validator_finds_schema_mismatch(self):
+        text = '{"format": "Dashboard Bundle Format 1.0", "test_runs": [{"test_id": 1}]}'
+        self.assertRaises(ValidationError, list, self.stream(text).test_runs())
+
+    def test_large_content_is_spooled(self):
+        content = "".join([chr(index % 256) for index in range(3000)])
+        doc = {
+            "format": "Dashboard Bundle Format 1.2",
+            "test_runs": [
+                {
+                    "test_id": "spool",
+                    "analyzer_assigned_date": "2010-11-14T01:03:06Z",
+                    "analyzer_assigned_uuid": "1ab86b36-c23d-11df-a81b-002163936223",
+                    "time_check_performed": False,
+                    "test_results": [],
+                    "attachments": [
+                        {
+                            "pathname": "large.bin",
+                            "mime_type": "application/octet-stream",
+                            "content": base64.standard_b64encode(content)
+                        },
+                        {
+                            "pathname": "small.txt",
+                            "mime_type": "text/plain",
+                            "content": base64.standard_b64encode("small")
+                        }
+                    ]
+                }
+            ]
+        }
+        stream = self.stream(DocumentIO.dumps(doc), spool_threshold=1024)
+        for test_run in stream.test_runs():
+            large, small = test_run["attachments"]
+            self.assertTrue(isinstance(large["content"], Base64Spool))
+            self.assertEqual(large["content"].file.read(), content)
+            self.assertEqual(small["content"], base64.standard_b64encode("small"))
+
+    def test_only_attachments_are_spooled(self):
+        content = "x" * 3000
+        doc = {
+            "format": "Dashboard Bundle Format 1.2",
+            "test_runs": [
+                {
+                    "test_id": "spool",
+                    "analyzer_assigned_date": "2010-11-14T01:03:06Z",
+                    "analyzer_assigned_uuid": "1ab86b36-c23d-11df-a81b-002163936223",
+                    "time_check_performed": False,
+                    "attributes": {"content": content},
+                    "test_results": [
+                        {
+                            "test_case_id": "content",
+                            "result": "pass",
+                            "attributes": {"content": content}
+                        }
+                    ],
+                    "attachments": [
+                        {
+                            "pathname": "marker.txt",
+                            "mime_type": "text/plain",
+                            "content": u"\u0000spool:0"
+                        }
+                    ]
+                }
+            ]
+        }
+        stream = self.stream(DocumentIO.dumps(doc), spool_threshold=1024)
+        for test_run in stream.test_runs():
+            self.assertEqual(test_run["attributes"]["content"], content)
+            self.assertEqual(test_run["test_results"][0]["attributes"]["content"], content)
+            # only the markers of the stream are replaced by a spool
+            self.assertEqual(test_run["attachments"][0]["content"], u"\u0000spool:0")
+
+
 class DocumentIORegressionTests(TestWithScenarios, TestCase):
     """
     A set of tests ensuring that it's possible to load each of the file